@@ -0,0 +1,104 @@
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from .mail import enqueue_mail
+from .models import Branch, CourseRequest, OTPChallenge, User
+from .stats import count_students
+from .student_ids import next_student_id
+
+OTP_LIFETIME = timedelta(minutes=5)
+VERIFY, RESET = 'verify', 'reset'
+
+
+def hash_code(purpose, email, code):
+    # Keyed with SECRET_KEY: a leaked table does not give away 4-digit codes.
+    return salted_hmac('api.otp', f'{purpose}:{email}:{code}', algorithm='sha256').hexdigest()
+
+
+def issue_challenge(user_id, email, purpose):
+    """
+    Replace the user's challenge for ``purpose`` with a fresh code and return it, in one upsert.
+
+    A resend keeps the misses counted so far, so ``OTP_MAX_ATTEMPTS`` caps the
+    guesses across resends; they start over only once the previous code has
+    expired unused.
+    """
+    code = f'{secrets.randbelow(10000):04d}'
+    now = timezone.now()
+    table = connection.ops.quote_name(OTPChallenge._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, purpose, code_hash, expires_at, attempts) VALUES (%s, %s, %s, %s, 0) "
+            f"ON CONFLICT (user_id, purpose) DO UPDATE SET code_hash = excluded.code_hash, "
+            f"attempts = CASE WHEN {table}.expires_at <= %s THEN 0 ELSE {table}.attempts END, "
+            f"expires_at = excluded.expires_at",
+            [user_id, purpose, hash_code(purpose, email, code),
+             connection.ops.adapt_datetimefield_value(now + OTP_LIFETIME), connection.ops.adapt_datetimefield_value(now)],
+        )
+    return code
+
+
+def consume_challenge(email, purpose, code):
+    """
+    Use up a live challenge if ``code`` matches, in one conditional DELETE.
+
+    A miss counts against the challenge, which stops matching after
+    ``OTP_MAX_ATTEMPTS`` misses even with the right code.
+    """
+    live = OTPChallenge.objects.filter(user__email=email, purpose=purpose, expires_at__gt=timezone.now(),
+                                       attempts__lt=settings.OTP_MAX_ATTEMPTS)
+    if code and live.filter(code_hash=hash_code(purpose, email, code)).delete()[0]:
+        return True
+    live.update(attempts=F('attempts') + 1)
+    return False
+
+
+def register_student(password, branch=None, **fields):
+    """
+    Create an inactive account with its student id, OTP and course request.
+
+    The user row is built complete and inserted once; the user, course request,
+    challenge and OTP mail commit together or not at all. An unknown ``branch``
+    is ignored, as before.
+    """
+    user = User(is_active=False, student_id=next_student_id(), **fields)
+    user.set_password(password)
+    branch_exists = branch is not None and Branch.objects.filter(pk=branch).exists()
+    with transaction.atomic():
+        user.save(force_insert=True)
+        if branch_exists:
+            CourseRequest.objects.create(student=user, branch_id=branch, status='Pending')
+        code = issue_challenge(user.pk, user.email, VERIFY)
+        enqueue_mail(
+            'Your OTP for Produit Academy',
+            f'Hi {user.username},\n\nYour One-Time Password (OTP) is: {code}\nIt will expire in 5 minutes.',
+            'from@produit.academy',
+            user.email,
+        )
+    return user
+
+
+def verify_account(email, code):
+    with transaction.atomic():
+        if not consume_challenge(email, VERIFY, code):
+            return False
+        activated = list(User.objects.filter(email=email, role='student', is_active=False).values_list('pk', flat=True))
+        User.objects.filter(email=email).update(is_active=True, is_verified=True)
+        count_students(activated, 1)
+    return True
+
+
+def reset_password(email, code, password):
+    """Set ``password`` if ``code`` is current; the password is only hashed once the code checks out."""
+    with transaction.atomic():
+        if not consume_challenge(email, RESET, code):
+            return False
+        User.objects.filter(email=email).update(password=make_password(password))
+    return True
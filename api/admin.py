@@ -1,8 +1,27 @@
 from django.contrib import admin
-from .models import User, Branch, StudyMaterial, CourseRequest, Session
+from .models import User, Branch, StudyMaterial, CourseRequest, Session, OutboundEmail
+
+class CourseRequestAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status')
+    list_filter = ('status', 'branch')
+    list_select_related = ('student', 'branch')
+
+class StudyMaterialAdmin(admin.ModelAdmin):
+    list_display = ('title', 'branch', 'classification', 'is_preview')
+    list_select_related = ('branch',)
+
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at')
+    list_filter = ('status',)
+    # Bodies of pending messages hold plain-text one-time codes.
+    exclude = ('body',)
+
+class SessionAdmin(admin.ModelAdmin):
+    list_select_related = ('user',)
 
 admin.site.register(User)
 admin.site.register(Branch)
-admin.site.register(StudyMaterial)
-admin.site.register(CourseRequest)
-admin.site.register(Session)
\ No newline at end of file
+admin.site.register(StudyMaterial, StudyMaterialAdmin)
+admin.site.register(CourseRequest, CourseRequestAdmin)
+admin.site.register(Session, SessionAdmin)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
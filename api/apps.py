@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # metrics connects its query timer to connection_created before the first connection is opened.
+        from . import metrics, signals  # noqa: F401
@@ -0,0 +1,150 @@
+"""
+Async versions of the read-heavy endpoints, routed instead of the DRF views when ``ASYNC_VIEWS`` is on.
+
+DRF has no async views, so these are plain Django async views that reuse
+DRF's authentication classes and answer with the same JSON bytes. Work
+that only exists in sync form (the JWT session check, the catalogue cache)
+runs through ``sync_to_async``; queries use the async ORM and file bodies
+are streamed from an async iterator, so a slow client or disk never pins a
+worker thread.
+"""
+import os
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.utils.text import slugify
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+
+from .cache import aget_entitlement, cached_list_response
+from .downloads import serve_file
+from .fast_serializers import BranchValues, StudyMaterialValues
+from .models import Branch, StudyMaterial
+from .serializers import UserSerializer
+from .views import StudyMaterialView, materials_for
+
+
+def json_response(data, status=200, headers=None):
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    content_type = f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else renderer.media_type
+    return HttpResponse(renderer.render(data), status=status, headers=headers, content_type=content_type)
+
+
+class AsyncAPIView(View):
+    """
+    Authentication, permission checks and error bodies the way ``APIView`` does them.
+
+    ``permission`` is ``None`` (anyone), ``'authenticated'`` or ``'staff'``.
+    """
+    http_method_names = ['get', 'head', 'options']
+    permission = 'authenticated'
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await self.authenticate(request) or AnonymousUser()
+            self.check_permission(request.user)
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(request, exc)
+
+    async def authenticate(self, request):
+        # Anonymous requests to open endpoints skip the thread hop; a bad token is still rejected like in DRF.
+        if self.permission is None and 'HTTP_AUTHORIZATION' not in request.META:
+            return None
+        return await sync_to_async(self.run_authenticators)(request)
+
+    def run_authenticators(self, request):
+        for authenticator in self.get_authenticators():
+            result = authenticator.authenticate(request)
+            if result is not None:
+                # A token user whose account claims went stale reads them from its row; load it off the event loop.
+                if not getattr(result[0], 'claims_trusted', True):
+                    result[0].user
+                return result[0]
+        return None
+
+    def get_authenticators(self):
+        return [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+
+    def check_permission(self, user):
+        if self.permission is None:
+            return
+        if not user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        if self.permission == 'staff' and not user.is_staff:
+            raise exceptions.PermissionDenied()
+
+    def handle_exception(self, request, exc):
+        headers = {}
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            header = self.get_authenticators()[0].authenticate_header(request)
+            if header:
+                headers['WWW-Authenticate'] = header
+            else:
+                exc.status_code = 403
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return json_response(data, exc.status_code, headers)
+
+
+class AsyncBranchListView(AsyncAPIView):
+    permission = None
+
+    async def get(self, request):
+        # Usually a cache hit: one hop into the sync cache API, the query only runs on a miss.
+        serializer = BranchValues()
+        build = lambda: serializer.many(serializer.values(Branch.objects.all()))
+        return await sync_to_async(cached_list_response)(request, 'branches', 'all', build, respond=json_response)
+
+
+class AsyncStudyMaterialView(AsyncAPIView):
+    async def get(self, request):
+        entitlement = await aget_entitlement(request.user)
+        if entitlement is None:
+            return json_response([])
+        if 'cursor' in request.GET or 'page_size' in request.GET:
+            # Cursor pagination is sync-only in DRF; hand paginated requests to the sync view.
+            return await sync_to_async(self.paginated)(request)
+        serializer = StudyMaterialValues({'request': request})
+        queryset = materials_for(entitlement)
+        if not request.GET:
+            branch_id, approved = entitlement
+            build = lambda: serializer.many(serializer.values(queryset))
+            return await sync_to_async(cached_list_response)(
+                request, f'materials:{branch_id}', 'full' if approved else 'preview', build, private=True,
+                respond=json_response)
+        classification = request.GET.get('classification')
+        if classification is not None:
+            if classification not in dict(StudyMaterial.CLASSIFICATION_CHOICES):
+                choices = ', '.join(dict(StudyMaterial.CLASSIFICATION_CHOICES))
+                raise exceptions.ValidationError({'classification': f'Must be one of: {choices}.'})
+            queryset = queryset.filter(classification=classification)
+        return json_response(serializer.many([row async for row in serializer.values(queryset)]))
+
+    def paginated(self, request):
+        response = StudyMaterialView.as_view()(request)
+        return response.render()
+
+
+class AsyncStudentDashboardView(AsyncAPIView):
+    async def get(self, request):
+        # A token user answers from its claims; a loaded user may still lazily read its row.
+        return json_response(await sync_to_async(lambda: UserSerializer(request.user).data)())
+
+
+class AsyncMaterialFileView(AsyncAPIView):
+    async def get(self, request, pk):
+        if request.user.is_staff:
+            queryset = StudyMaterial.objects.all()
+        else:
+            queryset = materials_for(await aget_entitlement(request.user))
+        material = await queryset.filter(pk=pk).only('title', 'file').afirst()
+        if material is None:
+            return json_response({'detail': 'Material not found.'}, 404)
+        filename = (slugify(material.title) or 'material') + os.path.splitext(material.file.name)[1]
+        try:
+            return await sync_to_async(serve_file)(request, material.file.storage, material.file.name,
+                                                   'application/pdf', filename, asynchronous=True)
+        except FileNotFoundError:
+            return json_response({'detail': 'Material not found.'}, 404)
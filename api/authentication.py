@@ -1,14 +1,212 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.db import transaction
+from django.db.models import F
+from django.utils.functional import cached_property
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Session
+
+SESSION_CLAIM = 'sid'
+CLAIMS_VERSION_CLAIM = 'cv'
+# Account fields copied into tokens; a change to one of them invalidates the claims like an entitlement change.
+IDENTITY_CLAIMS = ('username', 'is_staff', 'role', 'email', 'student_id')
+MISSING = object()
 
 class EmailBackend(ModelBackend):
+    """
+    The only authentication backend: one lookup by email and one password check per attempt.
+
+    An unknown email still hashes the password once, as ``ModelBackend``
+    does, so response times do not tell which accounts exist. Inactive users
+    are returned, and turned away by the token serializer.
+    """
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
         try:
-            user = UserModel.objects.get(email=username)
+            user = UserModel._default_manager.get(email=username)
         except UserModel.DoesNotExist:
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password):
+            return user
+        return None
+
+class SessionCache:
+    """
+    Thread-safe LRU of user id -> ``(session_id, claims_version)``.
+
+    Entries expire after ``ttl`` seconds, which bounds how long a token
+    superseded by a login handled in another process keeps working here.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                return MISSING
+            self._entries.move_to_end(user_id)
+            return entry[0]
+
+    def set(self, user_id, state):
+        with self._lock:
+            self._entries[user_id] = (state, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+session_cache = SessionCache(settings.SESSION_CACHE_SIZE, settings.SESSION_CACHE_TTL)
+
+def start_session(user, session_id):
+    """Make ``session_id`` the user's only session, ending every earlier login."""
+    with transaction.atomic():
+        Session.objects.filter(user=user).delete()
+        Session.objects.create(user=user, session_key=session_id)
+    session_cache.set(str(user.pk), (session_id, 0))
+
+def session_state(user_id, refresh=False):
+    """``(session_id, claims_version)`` of the user's active login, or ``None``."""
+    state = MISSING if refresh else session_cache.get(str(user_id))
+    if state is MISSING:
+        state = Session.objects.filter(user_id=user_id).values_list('session_key', 'claims_version').first()
+        session_cache.set(str(user_id), state)
+    return state
+
+def forget_sessions(user_ids):
+    # After the commit; a request in between would cache the old row for SESSION_CACHE_TTL.
+    def discard():
+        for user_id in user_ids:
+            session_cache.discard(str(user_id))
+    transaction.on_commit(discard)
+
+def invalidate_claims(*user_ids):
+    """Stop trusting the entitlement and account claims in these users' current tokens until they refresh."""
+    Session.objects.filter(user_id__in=user_ids).update(claims_version=F('claims_version') + 1)
+    forget_sessions(user_ids)
+
+def end_sessions(*user_ids):
+    """Log these users out everywhere; their tokens stop working at the next session check."""
+    Session.objects.filter(user_id__in=user_ids).delete()
+    forget_sessions(user_ids)
+
+def validate_session(token):
+    """
+    Reject tokens from anything but the user's latest login.
+
+    Returns whether the token's entitlement and account claims are still current. A cache
+    hit that matches costs nothing; anything else is settled by one query, so
+    a login handled by another process is picked up at once. A claims change
+    made in another process is seen once the cache entry expires.
+    """
+    user_id, session_id = token.get(api_settings.USER_ID_CLAIM), token.get(SESSION_CLAIM)
+    claims_version = token.get(CLAIMS_VERSION_CLAIM, 0)
+    state = session_state(user_id)
+    # A token claiming a newer version than the cache knows means the cache is behind.
+    if state is None or state[0] != session_id or state[1] < claims_version:
+        state = session_state(user_id, refresh=True)
+    if session_id is None or state is None or state[0] != session_id:
+        raise AuthenticationFailed('This session has ended because of a newer login.', code='session_ended')
+    return state[1] == claims_version
+
+def identity_claims(user_id):
+    """The account claims copied into tokens, read fresh; ``None`` if the account is gone or inactive."""
+    return get_user_model().objects.filter(pk=user_id, is_active=True).values(*IDENTITY_CLAIMS).first()
+
+def entitlement_claims(user_id):
+    """Course request claims that let read-only endpoints skip loading the user."""
+    from .models import CourseRequest
+    course_request = CourseRequest.objects.filter(student_id=user_id).values_list('branch_id', 'status').first()
+    branch_id, status = course_request or (None, None)
+    return {'branch_id': branch_id, 'course_status': status}
+
+class ClaimsUser(TokenUser):
+    """
+    Read-only user built from token claims.
+
+    The ``User`` row is only loaded when a view reads an attribute the token
+    does not carry. Saving, like on any ``TokenUser``, is not supported.
+    """
+
+    def __init__(self, token, claims_trusted):
+        super().__init__(token)
+        self.claims_trusted = claims_trusted
+
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def user(self):
+        return get_user_model().objects.get(pk=self.id)
+
+    @property
+    def entitlement(self):
+        """``(branch_id, approved)`` from the claims, in the shape of ``api.cache.get_entitlement``."""
+        branch_id = self.token.get('branch_id')
+        if branch_id is None:
+            return None
+        return branch_id, self.token.get('course_status') == 'Approved'
+
+    # TokenUser reads these straight from the token; they are account claims like the others.
+    username = property(lambda self: self.__getattr__('username'))
+    is_staff = property(lambda self: self.__getattr__('is_staff'))
+
+    def __getattr__(self, attr):
+        if attr == 'token' or attr.startswith('_'):
+            raise AttributeError(attr)
+        # Account claims changed since the token was issued (see invalidate_claims) come from the row instead.
+        if attr in self.token and (self.claims_trusted or attr not in IDENTITY_CLAIMS):
+            return self.token[attr]
+        return getattr(self.user, attr)
+
+class SingleSessionJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that only accepts tokens issued by the user's latest login.
+
+    With ``JWT_TOKEN_USER_MODE`` on, safe requests get a ``ClaimsUser`` instead
+    of a ``User`` loaded from the database.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
             return None
-        else:
-            if user.check_password(password):
-                return user
-        return None
\ No newline at end of file
+        token = self.get_validated_token(raw_token)
+        claims_trusted = validate_session(token)
+        if settings.JWT_TOKEN_USER_MODE and request.method in SAFE_METHODS:
+            return ClaimsUser(token, claims_trusted), token
+        return self.get_user(token), token
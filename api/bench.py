@@ -0,0 +1,232 @@
+import asyncio
+import http.client
+import json
+import random
+import socket
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+from .models import Branch, CourseRequest, StudyMaterial, User
+from .stats import rebuild as rebuild_stats
+
+BATCH_SIZE = 5000
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    ms = [sample * 1000 for sample in samples]
+    return {
+        'count': len(ms),
+        'mean_ms': round(statistics.fmean(ms), 3) if ms else 0.0,
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+    }
+
+
+def time_calls(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _batched(rows, model):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def seed_dataset(users=1000, materials=1000, branches=10, approved_ratio=0.6, pending_ratio=0.3, seed=42, prefix='bench'):
+    """
+    Bulk-insert a synthetic dataset.
+
+    Users get an unusable password (hashing would dominate the run), one course
+    request each, and materials are spread evenly over the branches with about
+    one in five marked as preview.
+    """
+    rng = random.Random(seed)
+    branch_objs = Branch.objects.bulk_create(Branch(name=f'{prefix}-branch-{i}') for i in range(branches))
+    branch_ids = [branch.pk for branch in branch_objs]
+
+    _batched((User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', student_id=f'B{prefix[:3].upper()}-{i}',
+                   password='!', is_active=rng.random() > 0.05, is_verified=True)
+              for i in range(users)), User)
+    student_ids = list(User.objects.filter(username__startswith=prefix).values_list('id', flat=True))
+
+    def status():
+        roll = rng.random()
+        if roll < approved_ratio:
+            return 'Approved'
+        return 'Pending' if roll < approved_ratio + pending_ratio else 'Rejected'
+
+    _batched((CourseRequest(student_id=student_id, branch_id=rng.choice(branch_ids), status=status())
+              for student_id in student_ids), CourseRequest)
+    classifications = [choice for choice, _ in StudyMaterial.CLASSIFICATION_CHOICES]
+    _batched((StudyMaterial(title=f'{prefix} material {i}', file=f'materials/{prefix}-{i}.pdf',
+                            classification=rng.choice(classifications), branch_id=branch_ids[i % len(branch_ids)],
+                            is_preview=rng.random() < 0.2)
+              for i in range(materials)), StudyMaterial)
+    # Bulk inserts skip the stats receivers; recount so that deleting the rows later leaves the stats right.
+    rebuild_stats()
+    return branch_ids, student_ids
+
+
+async def read_response(reader):
+    """``(status, body size, keep-alive)`` of one HTTP/1.1 response, body read and discarded."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    keep_alive = headers.get('connection', '').lower() != 'close'
+    size = 0
+    if status in (204, 304) or 100 <= status < 200:
+        pass
+    elif 'content-length' in headers:
+        size = int(headers['content-length'])
+        await reader.readexactly(size)
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            chunk_size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(chunk_size + 2)
+            size += chunk_size
+            if not chunk_size:
+                break
+    else:
+        size = len(await reader.read())
+        keep_alive = False
+    return status, size, keep_alive
+
+
+async def load_test(base_url, requests, concurrency=100, duration=10.0):
+    """
+    Drive ``requests`` (``(path, headers)`` pairs, cycled through) at ``base_url`` from
+    ``concurrency`` keep-alive connections for ``duration`` seconds.
+
+    Stdlib only, so it runs wherever the project does; latencies are measured
+    per request from the first byte sent to the last byte received.
+    """
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    prefix = url.path.rstrip('/')
+    samples, statuses, transferred = [], Counter(), [0]
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        reader = writer = None
+        index = offset
+        while time.perf_counter() < deadline:
+            path, headers = requests[index % len(requests)]
+            index += 1
+            request = f'GET {prefix}{path} HTTP/1.1\r\nHost: {url.netloc}\r\n'
+            request += ''.join(f'{name}: {value}\r\n' for name, value in headers.items()) + '\r\n'
+            start = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                writer.write(request.encode('latin-1'))
+                status, size, keep_alive = await read_response(reader)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+                statuses[type(exc).__name__] += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                await asyncio.sleep(0.01)
+                continue
+            samples.append(time.perf_counter() - start)
+            statuses[status] += 1
+            transferred[0] += size
+            if not keep_alive:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(samples),
+        'requests_per_second': round(len(samples) / elapsed, 1),
+        'megabytes': round(transferred[0] / 2 ** 20, 2),
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        'timing': summarize(samples),
+    }
+
+
+class LocalClient:
+    """Requests through the Django test client in this process, counting each one's queries."""
+
+    def __init__(self):
+        from django.test import Client
+        self.client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+
+    def request(self, method, path, data=None, headers=None, remote_addr=None):
+        """``(status, body, queries)``; streamed bodies are read to the end. ``remote_addr`` is the client's address."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        kwargs = {'headers': headers or {}}
+        if remote_addr:
+            kwargs['REMOTE_ADDR'] = remote_addr
+        if data is not None:
+            kwargs.update(data=json.dumps(data) if method != 'GET' else data, content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method.lower())(path, **kwargs)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, body, len(queries)
+
+
+class RemoteClient:
+    """Requests to a running server over one keep-alive connection; queries are not visible from here."""
+
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        self.host, self.port, self.prefix = url.hostname, url.port or 80, url.path.rstrip('/')
+        self.connection = None
+
+    def request(self, method, path, data=None, headers=None, remote_addr=None):
+        # The server sees this machine's address whatever remote_addr says; run it with raised *_IP_BURST settings.
+        headers = dict(headers or {})
+        body = None
+        if data is not None and method == 'GET':
+            path += '?' + urlencode(data)
+        elif data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                self.connection.connect()
+                # Headers and body go out as separate writes; don't let Nagle hold the body back.
+                self.connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                self.connection.request(method, self.prefix + path, body, headers)
+                response = self.connection.getresponse()
+                return response.status, response.read(), None
+            except (http.client.HTTPException, OSError):
+                # The server closed an idle keep-alive connection; retry once on a fresh one.
+                self.connection.close()
+                self.connection = None
+                if attempt == 2:
+                    raise
@@ -0,0 +1,102 @@
+from collections import Counter
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+
+from .authentication import end_sessions, invalidate_claims
+from .cache import forget_entitlement
+from .mail import enqueue_many
+from .models import CourseRequest, User
+from .stats import bump, count_students
+
+UPDATED, UNCHANGED, NOT_FOUND = 'updated', 'unchanged', 'not_found'
+
+
+def outcome_report(requested_ids, found, changed, remaining=0):
+    """
+    Per-id outcomes plus totals.
+
+    ``requested_ids`` is ``None`` for filter-based requests, where only the
+    rows that matched are reported.
+    """
+    results = {pk: UPDATED if pk in changed else UNCHANGED for pk in found}
+    for pk in requested_ids or ():
+        results.setdefault(pk, NOT_FOUND)
+    totals = {outcome: 0 for outcome in (UPDATED, UNCHANGED, NOT_FOUND)}
+    for outcome in results.values():
+        totals[outcome] += 1
+    return {**totals, 'remaining': remaining, 'results': {str(pk): outcome for pk, outcome in results.items()}}
+
+
+def select_targets(queryset, ids, limit, done):
+    """
+    Rows named by ``ids``, or the first ``limit`` rows of ``queryset`` by id and how many are left.
+
+    On the filter path rows matching ``done`` (already in the target state)
+    are skipped, so repeating a request works through the backlog.
+    """
+    if ids is not None:
+        return queryset.filter(pk__in=ids), 0
+    queryset = queryset.exclude(done)
+    remaining = max(0, queryset.count() - limit)
+    return queryset.order_by('pk')[:limit], remaining
+
+
+def set_request_status(new_status, ids=None, branch=None, status=None, limit=None):
+    """
+    Move course requests to ``new_status`` with one UPDATE.
+
+    Requests already in that status are reported unchanged and get no second
+    notification, so retrying a request is harmless. Bulk UPDATEs skip model
+    signals and ``save()``, so the entitlement caches are invalidated and the
+    stats are counted here.
+    """
+    queryset = CourseRequest.objects.all()
+    if branch is not None:
+        queryset = queryset.filter(branch_id=branch)
+    if status is not None:
+        queryset = queryset.filter(status=status)
+    with transaction.atomic():
+        targets, remaining = select_targets(queryset, ids, limit, Q(status=new_status))
+        rows = list(targets.select_for_update(of=('self',))
+                    .values_list('pk', 'student_id', 'status', 'student__email', 'branch__name', 'branch_id'))
+        changed = [row for row in rows if row[2] != new_status]
+        if changed:
+            CourseRequest.objects.filter(pk__in=[row[0] for row in changed]).update(status=new_status)
+            deltas = Counter()
+            for _, _, old_status, _, _, branch_id in changed:
+                deltas['requests', branch_id, old_status] -= 1
+                deltas['requests', branch_id, new_status] += 1
+            bump(deltas)
+            student_ids = {row[1] for row in changed}
+            transaction.on_commit(partial(forget_entitlement, *student_ids))
+            invalidate_claims(*student_ids)
+            enqueue_many(
+                (f'Your Produit Academy course request was {new_status.lower()}',
+                 f'Your request to join {branch_name} has been {new_status.lower()}.',
+                 'from@produit.academy', email)
+                for _, _, _, email, branch_name, _ in changed
+            )
+    return outcome_report(ids, [row[0] for row in rows], {row[0] for row in changed}, remaining)
+
+
+def set_students_active(active, ids=None, branch=None, limit=None):
+    """
+    Activate or deactivate students with one UPDATE; deactivation also ends their sessions.
+
+    Only ``role='student'`` accounts are touched. Idempotent like ``set_request_status``.
+    """
+    queryset = User.objects.filter(role='student')
+    if branch is not None:
+        queryset = queryset.filter(id__in=CourseRequest.objects.filter(branch_id=branch).values('student_id'))
+    with transaction.atomic():
+        targets, remaining = select_targets(queryset, ids, limit, Q(is_active=active))
+        rows = list(targets.select_for_update().values_list('pk', 'is_active'))
+        changed = [pk for pk, is_active in rows if is_active != active]
+        if changed:
+            User.objects.filter(pk__in=changed).update(is_active=active)
+            count_students(changed, 1 if active else -1)
+            if not active:
+                end_sessions(*changed)
+    return outcome_report(ids, [row[0] for row in rows], set(changed), remaining)
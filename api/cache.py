@@ -0,0 +1,118 @@
+import uuid
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+
+# Per-process hit/miss counters, keyed by (namespace kind, outcome).
+stats = Counter()
+
+NO_ENTITLEMENT = ()
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_version(namespace):
+    """
+    Current version token of ``namespace``.
+
+    Tokens are random rather than incrementing so that two processes that lose
+    their local caches can never hand out the same version for different data.
+    They expire with the entries they guard: with a per-process cache a bump
+    only reaches the process that made it, and the others have to drop their
+    version, and with it their ETags, within ``CATALOG_CACHE_TIMEOUT``.
+    """
+    cache = get_cache()
+    key = f'version:{namespace}'
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        if not cache.add(key, version, timeout=settings.CATALOG_CACHE_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(*namespaces):
+    get_cache().set_many({f'version:{namespace}': uuid.uuid4().hex[:12] for namespace in namespaces},
+                         timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+
+def record(namespace, outcome):
+    stats[namespace.split(':')[0], outcome] += 1
+
+
+def get_entitlement(user):
+    """
+    ``(branch_id, approved)`` for the student's course request, or ``None``.
+
+    Cached per user and dropped whenever one of their course requests changes.
+    A token user whose claims are still current answers from the token alone.
+    """
+    if getattr(user, 'claims_trusted', False):
+        record('entitlement', 'claims')
+        return user.entitlement
+    cache = get_cache()
+    key = f'entitlement:{user.pk}'
+    entitlement = cache.get(key)
+    if entitlement is None:
+        record('entitlement', 'miss')
+        from .models import CourseRequest
+        try:
+            course_request = CourseRequest.objects.only('branch_id', 'status').get(student_id=user.pk)
+            entitlement = (course_request.branch_id, course_request.status == 'Approved')
+        except CourseRequest.DoesNotExist:
+            entitlement = NO_ENTITLEMENT
+        cache.set(key, entitlement, settings.CATALOG_CACHE_TIMEOUT)
+    else:
+        record('entitlement', 'hit')
+    return entitlement or None
+
+
+async def aget_entitlement(user):
+    """``get_entitlement`` for async views; only leaves the event loop when the claims are not enough."""
+    if getattr(user, 'claims_trusted', False):
+        record('entitlement', 'claims')
+        return user.entitlement
+    return await sync_to_async(get_entitlement)(user)
+
+
+def forget_entitlement(*user_ids):
+    get_cache().delete_many([f'entitlement:{user_id}' for user_id in user_ids])
+
+
+def cached_list_response(request, namespace, variant, build, private=False, respond=Response):
+    """
+    Respond with the list produced by ``build()``, cached under the namespace version.
+
+    The version doubles as the ETag, so a client revalidating with
+    ``If-None-Match`` gets a bodiless 304 without the list even being read.
+    ``respond`` wraps the data, DRF's ``Response`` unless an async view renders it itself.
+    """
+    version = get_version(namespace)
+    etag = quote_etag(f'{namespace}-{variant}-{version}')
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        record(namespace, 'not_modified')
+    else:
+        cache = get_cache()
+        # Serialized file URLs are absolute, so the origin is part of the key.
+        key = f'list:{namespace}:{variant}:{version}:{request.build_absolute_uri("/")}'
+        data = cache.get(key)
+        if data is None:
+            record(namespace, 'miss')
+            data = list(build())
+            cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+        else:
+            record(namespace, 'hit')
+        response = respond(data)
+    response['ETag'] = etag
+    if private:
+        patch_vary_headers(response, ['Authorization'])
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,149 @@
+import asyncio
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .storage import digest_from_name
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(storage, name):
+    """
+    Strong validator for a stored file: the content digest for content-addressed
+    names, otherwise size and mtime (the scheme nginx uses for static files).
+    """
+    size = storage.size(name)
+    modified = storage.get_modified_time(name)
+    digest = digest_from_name(name)
+    if digest:
+        return f'"{digest}"', modified, size
+    return f'"{size:x}-{int(modified.timestamp()):x}"', modified, size
+
+
+def parse_range(header, size):
+    """
+    Parse a single ``bytes=`` range.
+
+    Returns ``(start, end)`` (inclusive), ``None`` when the whole file should be
+    sent (no header, malformed or multi-range requests) or ``False`` when the
+    range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def iter_range(file_handle, start, length):
+    try:
+        file_handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file_handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file_handle.close()
+
+
+async def aiter_range(file_handle, start, length):
+    """``iter_range`` for ASGI: reads happen in a thread, so a slow disk never stalls the event loop."""
+    try:
+        await asyncio.to_thread(file_handle.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(file_handle.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file_handle.close()
+
+
+def sendfile_response(storage, name, content_type):
+    mode = settings.MATERIAL_SENDFILE_MODE
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MATERIAL_SENDFILE_PREFIX.rstrip('/') + '/' + quote(name)
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = storage.path(name)
+    else:
+        raise ValueError(f"Unknown MATERIAL_SENDFILE_MODE {mode!r}")
+    return response
+
+
+def serve_file(request, storage, name, content_type, filename, etag=None, asynchronous=False):
+    """
+    Serve the stored file ``name`` with conditional GET and single byte-range support.
+
+    With ``MATERIAL_SENDFILE_MODE`` set, the body (and range handling) is
+    delegated to the front-end server and no worker is held for the transfer.
+    ``asynchronous`` streams the body from an async iterator for ASGI servers.
+    """
+    strong_etag, modified, size = file_etag(storage, name)
+    etag = etag or strong_etag
+    last_modified = int(modified.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if settings.MATERIAL_SENDFILE_MODE:
+            response = sendfile_response(storage, name, content_type)
+        else:
+            response = _body_response(request, storage, name, content_type, size, etag, http_date(last_modified),
+                                      asynchronous)
+        response['Content-Disposition'] = f'inline; filename="{filename}"'
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, max_age=settings.MATERIAL_FILE_MAX_AGE)
+    return response
+
+
+def _body_response(request, storage, name, content_type, size, etag, last_modified, asynchronous=False):
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if byte_range and if_range and if_range not in (etag, last_modified):
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file_handle = storage.open(name, 'rb')
+    if byte_range is None and not asynchronous:
+        return FileResponse(file_handle, content_type=content_type)
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1
+    chunks = (aiter_range if asynchronous else iter_range)(file_handle, start, length)
+    response = StreamingHttpResponse(chunks, status=206 if byte_range else 200, content_type=content_type)
+    response['Content-Length'] = str(length)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,74 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import CourseRequest, User
+
+ITERATOR_CHUNK_SIZE = 2000
+# Rows per chunk handed to the server; one write per row would mean thousands of tiny socket writes.
+ROWS_PER_CHUNK = 500
+
+EXPORTS = {
+    'students': (
+        lambda: User.objects.filter(role='student').order_by('id'),
+        ('id', 'username', 'email', 'student_id', 'is_active', 'is_verified', 'college', 'phone_number', 'date_joined'),
+    ),
+    'course-requests': (
+        lambda: CourseRequest.objects.order_by('id'),
+        ('id', 'student_id', 'student__student_id', 'student__email', 'branch_id', 'branch__name', 'status'),
+    ),
+}
+
+
+class Echo:
+    """File-like object that hands back what ``csv.writer`` writes instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def chunked(lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= ROWS_PER_CHUNK:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(columns, rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
+
+
+def export_rows(kind, queryset=None):
+    """Column names and a lazy row iterator; rows are fetched ``ITERATOR_CHUNK_SIZE`` at a time."""
+    build, columns = EXPORTS[kind]
+    queryset = build() if queryset is None else queryset
+    return columns, queryset.values_list(*columns).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+def export_response(kind, fmt, queryset=None):
+    """Stream an export; memory stays flat however many rows there are."""
+    lines, content_type = FORMATS[fmt]
+    columns, rows = export_rows(kind, queryset)
+    response = StreamingHttpResponse(chunked(lines(columns, rows)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
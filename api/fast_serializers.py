@@ -0,0 +1,127 @@
+"""
+Read-only serializers for the hot list endpoints.
+
+They map ``values()`` rows straight to plain dicts instead of building model
+instances and running DRF fields over them. The output must match the
+``ModelSerializer`` of the same name field for field; ``FastSerializerTests``
+renders both and compares the bytes.
+"""
+import re
+
+from django.utils.functional import cached_property
+from rest_framework.response import Response
+
+from .models import StudyMaterial
+
+PLAIN_NAME_RE = re.compile(r'(?:[A-Za-z0-9_-]+/)*[A-Za-z0-9_-]+(?:\.[A-Za-z0-9_-]+)*\Z')
+URL_PROBE = 'probe'
+
+
+class ValuesSerializer:
+    """
+    ``fields`` lists ``(name, lookup)`` pairs in wire order. A lookup may name a
+    method converting the value as a third item, or be another ``ValuesSerializer``
+    followed by the relation to nest it under.
+    """
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.plan = cls.compile()
+        cls.lookups = tuple(cls.flatten(cls.plan))
+
+    @classmethod
+    def compile(cls, prefix=''):
+        plan = []
+        for name, source, *rest in cls.fields:
+            if isinstance(source, type) and issubclass(source, ValuesSerializer):
+                plan.append((name, None, source.compile(f'{prefix}{rest[0]}__')))
+            else:
+                plan.append((name, prefix + source, rest[0] if rest else None))
+        return tuple(plan)
+
+    @classmethod
+    def flatten(cls, plan):
+        for _, lookup, extra in plan:
+            if lookup is None:
+                yield from cls.flatten(extra)
+            else:
+                yield lookup
+
+    def __init__(self, context=None):
+        self.request = (context or {}).get('request')
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def to_representation(self, row, plan=None):
+        data = {}
+        for name, lookup, extra in plan or self.plan:
+            if lookup is None:
+                data[name] = self.to_representation(row, extra)
+            elif extra is None:
+                data[name] = row[lookup]
+            else:
+                data[name] = getattr(self, extra)(row[lookup])
+        return data
+
+    def many(self, rows):
+        to_representation, plan = self.to_representation, self.plan
+        return [to_representation(row, plan) for row in rows]
+
+
+class BranchValues(ValuesSerializer):
+    fields = (('id', 'id'), ('name', 'name'))
+
+
+class StudentValues(ValuesSerializer):
+    fields = (('id', 'id'), ('username', 'username'), ('email', 'email'), ('role', 'role'),
+              ('student_id', 'student_id'))
+
+
+class StudyMaterialValues(ValuesSerializer):
+    fields = (('id', 'id'), ('title', 'title'), ('file', 'file', 'file_url'),
+              ('classification', 'classification'), ('is_preview', 'is_preview'), ('branch', 'branch_id'))
+    storage = StudyMaterial._meta.get_field('file').storage
+
+    def url(self, name):
+        # Same as serializers.FileField: absolute when there is a request to build it from.
+        url = self.storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    @cached_property
+    def url_prefix(self):
+        return self.url(URL_PROBE)[:-len(URL_PROBE)]
+
+    def file_url(self, name):
+        if not name:
+            return None
+        # Plain names (stored names are digests) need no quoting, so the prefix is worked out once.
+        if PLAIN_NAME_RE.match(name):
+            return self.url_prefix + name
+        return self.url(name)
+
+
+class CourseRequestValues(ValuesSerializer):
+    fields = (('id', 'id'), ('student', StudentValues, 'student'), ('branch', BranchValues, 'branch'),
+              ('status', 'status'))
+
+
+class FastListMixin:
+    """``ListAPIView.list`` over ``fast_serializer_class`` rows; pagination works on the dicts as well."""
+    fast_serializer_class = None
+
+    def get_fast_serializer(self):
+        return self.fast_serializer_class(self.get_serializer_context())
+
+    def fast_list(self, queryset):
+        serializer = self.get_fast_serializer()
+        return serializer.many(serializer.values(queryset))
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_fast_serializer()
+        rows = serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.many(page))
+        return Response(serializer.many(rows))
@@ -0,0 +1,57 @@
+"""
+Password hashers whose cost comes from ``settings.PASSWORD_HASHER_COSTS``.
+
+``PASSWORD_HASHERS`` lists the one ``PASSWORD_HASHER`` names first, so new
+passwords use it. Django re-hashes a password at its owner's next successful
+login when the stored hash used another algorithm or other costs, so a policy
+change reaches active accounts without a migration or a reset. The
+algorithm names are Django's, so hashes written by its stock hashers keep
+verifying.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+def cost(name, default):
+    return settings.PASSWORD_HASHER_COSTS.get(name, default)
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return cost('PBKDF2_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return cost('SCRYPT_WORK_FACTOR', hashers.ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return cost('SCRYPT_BLOCK_SIZE', hashers.ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return cost('SCRYPT_PARALLELISM', hashers.ScryptPasswordHasher.parallelism)
+
+    @property
+    def maxmem(self):
+        # OpenSSL refuses more than 32 MiB by default; scrypt needs 128 * N * r bytes, allow twice that.
+        return 2 * 128 * self.work_factor * self.block_size
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Needs ``argon2-cffi``; listed anyway so that its hashes fail clearly rather than as unknown."""
+
+    @property
+    def time_cost(self):
+        return cost('ARGON2_TIME_COST', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return cost('ARGON2_MEMORY_COST', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return cost('ARGON2_PARALLELISM', hashers.Argon2PasswordHasher.parallelism)
@@ -0,0 +1,157 @@
+import codecs
+import csv
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .models import Branch, CourseRequest, User
+from .stats import ALL_BRANCHES, bump
+from .student_ids import allocate_student_ids
+
+BATCH_SIZE = 1000
+# Errors kept in the report; the count keeps going past it.
+MAX_REPORTED_ERRORS = 1000
+STATUSES = {status for status, _ in CourseRequest.STATUS_CHOICES}
+
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {'created': self.created, 'failed': self.failed, 'errors': self.errors}
+
+
+def branch_lookup():
+    """Branch ids by id and by name, so the file may use either."""
+    lookup = {}
+    for pk, name in Branch.objects.values_list('pk', 'name'):
+        lookup[str(pk)] = lookup[name] = pk
+    return lookup
+
+
+def clean_row(row, branches):
+    """``(user fields, branch_id, status)`` for one CSV row, or raise ``ValueError``."""
+    username, email = (row.get('username') or '').strip(), (row.get('email') or '').strip()
+    if not username or len(username) > 150:
+        raise ValueError("username is required and must be at most 150 characters")
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise ValueError(f"invalid email {email!r}")
+    branch = (row.get('branch') or '').strip()
+    if branch and branch not in branches:
+        raise ValueError(f"unknown branch {branch!r}")
+    status = (row.get('status') or 'Pending').strip()
+    if status not in STATUSES:
+        raise ValueError(f"unknown status {status!r}")
+    fields = {'username': username, 'email': email,
+              'college': (row.get('college') or '').strip() or None,
+              'phone_number': (row.get('phone_number') or '').strip()[:15] or None}
+    return fields, branches.get(branch), status
+
+
+def import_batch(batch, report, dry_run=False):
+    """Insert one batch of cleaned ``(line, fields, branch_id, status)`` rows, skipping taken emails and usernames."""
+    emails = [fields['email'] for _, fields, _, _ in batch]
+    usernames = [fields['username'] for _, fields, _, _ in batch]
+    taken_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+    taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    rows = []
+    for line, fields, branch_id, status in batch:
+        if fields['email'] in taken_emails:
+            report.error(line, f"email {fields['email']!r} already exists")
+        elif fields['username'] in taken_usernames:
+            report.error(line, f"username {fields['username']!r} already exists")
+        else:
+            rows.append((line, fields, branch_id, status))
+    if not rows or dry_run:
+        report.created += len(rows)
+        return
+
+    # Reserved in its own short transaction, so the sequence row is not locked while the batch inserts.
+    student_ids = allocate_student_ids(len(rows))
+    # Imported students sign in after a password reset; hashing a placeholder would dominate the run.
+    password = make_password(None)
+    try:
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                User(password=password, is_active=True, is_verified=True, student_id=student_id, **fields)
+                for (_, fields, _, _), student_id in zip(rows, student_ids)
+            )
+            CourseRequest.objects.bulk_create(
+                CourseRequest(student_id=user.pk, branch_id=branch_id, status=status)
+                for user, (_, _, branch_id, status) in zip(users, rows) if branch_id is not None
+            )
+            deltas = Counter({('students', ALL_BRANCHES, ''): len(users)})
+            for _, _, branch_id, status in rows:
+                if branch_id is not None:
+                    deltas['requests', branch_id, status] += 1
+                    deltas['students', branch_id, ''] += 1
+            bump(deltas)
+    except IntegrityError:
+        # An email or username taken since the check above, by a signup or a concurrent import.
+        for line, fields, _, _ in rows:
+            report.error(line, f"email {fields['email']!r} or its username was taken during the import; retry the row")
+        return
+    report.created += len(users)
+
+
+def import_students(stream, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Create students and their course requests from a CSV text stream.
+
+    Columns: ``username``, ``email`` and optionally ``branch`` (id or name),
+    ``status``, ``college`` and ``phone_number``. Rows are read and inserted
+    ``batch_size`` at a time, each batch in its own transaction, so memory
+    stays flat. Bad rows are skipped and reported with their line number.
+    A dry run only catches repeats within a batch.
+    """
+    report = ImportReport()
+    branches = branch_lookup()
+    reader = csv.DictReader(stream)
+    missing = {'username', 'email'} - set(reader.fieldnames or ())
+    if missing:
+        report.error(1, f"missing column(s): {', '.join(sorted(missing))}")
+        return report
+
+    batch, seen = [], set()
+    for row in reader:
+        line = reader.line_num
+        try:
+            fields, branch_id, status = clean_row(row, branches)
+        except ValueError as exc:
+            report.error(line, str(exc))
+            continue
+        keys = (('email', fields['email']), ('username', fields['username']))
+        duplicate = next((key for key in keys if key in seen), None)
+        if duplicate:
+            report.error(line, f"{duplicate[0]} {duplicate[1]!r} appears earlier in the file")
+            continue
+        seen.update(keys)
+        batch.append((line, fields, branch_id, status))
+        if len(batch) >= batch_size:
+            # Earlier batches are committed, so the database catches repeats across batches.
+            import_batch(batch, report, dry_run)
+            batch, seen = [], set()
+    if batch:
+        import_batch(batch, report, dry_run)
+    # Repeats within the file are caught before the batch's database checks.
+    report.errors.sort(key=lambda error: error['line'])
+    return report
+
+
+def text_lines(uploaded_file):
+    """Decode an uploaded file line by line, tolerating a UTF-8 BOM from spreadsheet exports."""
+    return codecs.iterdecode(uploaded_file, 'utf-8-sig')
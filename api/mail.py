@@ -0,0 +1,94 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_mail(subject, body, from_email, to):
+    """Queue one message; it joins the caller's transaction, so a rolled-back request sends nothing."""
+    return OutboundEmail.objects.create(subject=subject, body=body, from_email=from_email, to=to)
+
+
+def enqueue_many(messages):
+    """Queue ``(subject, body, from_email, to)`` tuples with a single INSERT."""
+    return OutboundEmail.objects.bulk_create(
+        OutboundEmail(subject=subject, body=body, from_email=from_email, to=to)
+        for subject, body, from_email, to in messages
+    )
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(settings.EMAIL_OUTBOX_BACKOFF * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_MAX_BACKOFF))
+
+
+def claim_batch(batch_size):
+    """
+    Lease up to ``batch_size`` due messages to this worker.
+
+    The lease pushes ``next_attempt_at`` forward so concurrent workers skip the
+    rows, and a worker that dies mid-batch only delays them by the lease.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = (OutboundEmail.objects.select_for_update(skip_locked=True)
+               .filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at'))
+        batch = list(due[:batch_size])
+        if batch:
+            OutboundEmail.objects.filter(pk__in=[message.pk for message in batch]).update(
+                next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE))
+    return batch
+
+
+def drain_outbox(batch_size=100):
+    """
+    Send one batch over a single backend connection.
+
+    Returns ``(sent, failed)``. Failures are retried with exponential backoff
+    and moved to ``dead`` after ``EMAIL_OUTBOX_MAX_ATTEMPTS``. Bodies carry
+    one-time codes in plain text, so they are blanked as soon as a message is
+    sent or given up on; ``manage.py prune_outbox`` deletes the old rows.
+    """
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent, failed = [], []
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for message in batch:
+            email = EmailMessage(message.subject, message.body, message.from_email, [message.to], connection=connection)
+            try:
+                connection.send_messages([email])
+            except Exception as exc:
+                logger.warning("Sending mail %s to %s failed: %s", message.pk, message.to, exc)
+                failed.append((message, str(exc)))
+            else:
+                sent.append(message.pk)
+    except Exception as exc:
+        logger.warning("Mail connection failed: %s", exc)
+        done = set(sent)
+        failed = [(message, str(exc)) for message in batch if message.pk not in done]
+    finally:
+        connection.close()
+
+    now = timezone.now()
+    if sent:
+        OutboundEmail.objects.filter(pk__in=sent).update(status='sent', sent_at=now, attempts=F('attempts') + 1,
+                                                         body='')
+    for message, error in failed:
+        attempts = message.attempts + 1
+        dead = attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+        OutboundEmail.objects.filter(pk=message.pk).update(
+            attempts=attempts, last_error=error[:2000], status='dead' if dead else 'pending',
+            next_attempt_at=now + backoff(attempts), **({'body': ''} if dead else {}),
+        )
+    return len(sent), len(failed)
@@ -0,0 +1,129 @@
+import copy
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.utils import ConnectionHandler
+
+from api.bench import summarize
+
+ALIAS = 'db_pool_bench'
+# Applied on top of settings.DATABASES['default'] by database_settings().
+MODES = {
+    'connect': "a new connection per request (CONN_MAX_AGE=0)",
+    'persistent': "one persistent connection per thread (CONN_MAX_AGE=600)",
+    'pool': "psycopg's pool, connections returned after each request",
+}
+
+
+def database_settings(mode, pool_size):
+    config = copy.deepcopy(settings.DATABASES['default'])
+    options = config.setdefault('OPTIONS', {})
+    options.pop('pool', None)
+    config['CONN_MAX_AGE'] = 600 if mode == 'persistent' else 0
+    if mode == 'pool':
+        options['pool'] = {'min_size': 1, 'max_size': pool_size, 'timeout': 60}
+    return config
+
+
+def server_connections():
+    """Backends connected to this database, apart from the one asking."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM pg_stat_activity "
+                       "WHERE datname = current_database() AND pid <> pg_backend_pid()")
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = ("Run the same short request (one query plus --work-ms of other work) from --concurrency threads with "
+            "a new connection per request, persistent connections and the psycopg pool, and report latency "
+            "percentiles and the peak number of server connections. PostgreSQL only; run it with the deployment's "
+            "DATABASE_URL and compare --concurrency against the threads gunicorn would run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+        parser.add_argument('--concurrency', type=int, default=32, help="Threads issuing requests.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per thread.")
+        parser.add_argument('--pool-size', type=int, default=8, help="max_size of the pool in pool mode.")
+        parser.add_argument('--work-ms', type=float, default=5.0,
+                            help="Time each request spends outside the database while holding its connection.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(f"bench_db_pool needs PostgreSQL; DATABASE_URL points at {connection.vendor}.")
+        baseline = server_connections()
+        report = {}
+        for mode in options['modes']:
+            self.stderr.write(f"{mode}: {MODES[mode]}...")
+            report[mode] = self.run(mode, options, baseline)
+        connection.close()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for mode, result in report.items():
+            timing = result['timing']
+            self.stdout.write(f"{mode:11} {result['requests_per_second']:>9.1f} req/s   p50 {timing['p50_ms']:>8.2f} ms"
+                              f"   p99 {timing['p99_ms']:>8.2f} ms   peak {result['peak_connections']:>4} connections"
+                              f"   {result['errors']} errors")
+
+    def run(self, mode, options, baseline):
+        handler = ConnectionHandler({ALIAS: database_settings(mode, options['pool_size'])})
+        samples, errors, peak = [], [], [0]
+        done = threading.Event()
+        lock = threading.Lock()
+
+        def request(db):
+            # What Django's request_started / request_finished handlers do around a view.
+            db.close_if_unusable_or_obsolete()
+            start = time.perf_counter()
+            with db.cursor() as cursor:
+                cursor.execute("SELECT id, name FROM api_branch ORDER BY id LIMIT 20")
+                cursor.fetchall()
+            time.sleep(options['work_ms'] / 1000)
+            db.close_if_unusable_or_obsolete()
+            return time.perf_counter() - start
+
+        def worker():
+            db = handler[ALIAS]
+            try:
+                for _ in range(options['requests']):
+                    try:
+                        elapsed = request(db)
+                    except Exception as exc:
+                        with lock:
+                            errors.append(repr(exc))
+                        continue
+                    with lock:
+                        samples.append(elapsed)
+            finally:
+                db.close()
+
+        def monitor():
+            try:
+                while not done.wait(0.05):
+                    peak[0] = max(peak[0], server_connections() - baseline)
+            finally:
+                connection.close()
+
+        watcher = threading.Thread(target=monitor)
+        watcher.start()
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+        done.set()
+        watcher.join()
+        if mode == 'pool':
+            handler[ALIAS].close_pool()
+        if errors:
+            self.stderr.write(f"{mode}: {len(errors)} failed requests, e.g. {errors[0]}")
+        return {'requests_per_second': round(len(samples) / seconds, 1), 'timing': summarize(samples),
+                'peak_connections': peak[0], 'errors': len(errors)}
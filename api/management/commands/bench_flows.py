@@ -0,0 +1,208 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+
+from api.bench import LocalClient, RemoteClient, seed_dataset, summarize
+from api.models import Branch, OutboundEmail, StudyMaterial, User
+
+PREFIX = 'flowbench'
+OTP_RE = re.compile(r'is: (\d{4})')
+PASSWORD = 'bench-pass-12345'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Recorder:
+    """Per-endpoint samples of one run."""
+
+    def __init__(self, client):
+        self.client = client
+        self.samples = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, name, method, path, data=None, token=None, ip=None, expect=200):
+        headers = {}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        start = time.perf_counter()
+        # In-process every student connects from an address of its own; see RemoteClient for --url runs.
+        status, body, queries = self.client.request(method, path, data, headers, remote_addr=ip)
+        self.samples[name].append(time.perf_counter() - start)
+        if queries is not None:
+            self.queries[name].append(queries)
+        if status != expect:
+            self.errors[name] += 1
+            raise CommandError(f"{name}: {method} {path} answered {status}, expected {expect}: {body[:200]!r}")
+        return json.loads(body) if body and body[:1] in b'[{' else body
+
+    def report(self, wall_seconds):
+        endpoints = {}
+        for name, samples in self.samples.items():
+            queries = self.queries.get(name)
+            endpoints[name] = {
+                'errors': self.errors[name],
+                'requests_per_second': round(len(samples) / sum(samples), 1) if sum(samples) else 0.0,
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+                'timing': summarize(samples),
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {'requests': total, 'seconds': round(wall_seconds, 3),
+                'requests_per_second': round(total / wall_seconds, 1), 'endpoints': endpoints}
+
+
+def compare(report, baseline, threshold, min_ms):
+    """Endpoints whose p95 grew by more than ``threshold`` (and ``min_ms``) or whose query count grew."""
+    regressions = []
+    for name, current in report['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            continue
+        now_p95, then_p95 = current['timing']['p95_ms'], before['timing']['p95_ms']
+        if now_p95 > then_p95 * (1 + threshold) and now_p95 - then_p95 > min_ms:
+            regressions.append(f"{name}: p95 {then_p95:.2f} -> {now_p95:.2f} ms")
+        now_queries, then_queries = current['queries_per_request'], before['queries_per_request']
+        if now_queries is not None and then_queries is not None and now_queries > then_queries + 0.5:
+            regressions.append(f"{name}: {then_queries} -> {now_queries} queries per request")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ("Drive the student flow (signup, verify OTP, login, dashboard, materials, file download) and the admin "
+            "flow (dashboard, approve, student list) over seeded data, in-process or against --url, and report "
+            "throughput, latency percentiles and queries per request per endpoint. In-process runs are rolled "
+            f"back; --url runs commit rows prefixed '{PREFIX}' and delete them afterwards, and come from one address, so "
+            "run that server with OTP_IP_BURST and LOGIN_IP_BURST above --students.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50, help="Student flows to run (each one signs up).")
+        parser.add_argument('--users', type=int, default=10_000, help="Seeded background students.")
+        parser.add_argument('--materials', type=int, default=20_000, help="Seeded materials.")
+        parser.add_argument('--branches', type=int, default=10)
+        parser.add_argument('--file-size', type=int, default=512 * 1024)
+        parser.add_argument('--url', help="Base URL of a running server sharing this database (e.g. http://127.0.0.1:8000).")
+        parser.add_argument('--output', help="Write the report to this JSON file.")
+        parser.add_argument('--compare', help="Baseline report to compare with; regressions fail the command.")
+        parser.add_argument('--threshold', type=float, default=0.25, help="Allowed relative p95 growth.")
+        parser.add_argument('--min-ms', type=float, default=2.0, help="Ignore p95 growth smaller than this.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        if options['url']:
+            report = self.run_remote(options)
+        else:
+            report = self.run_local(options)
+        report['meta'] = {'database': connection.vendor, 'target': options['url'] or 'in-process',
+                          'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                          **{key: options[key] for key in ('students', 'users', 'materials', 'branches', 'file_size')}}
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+        if options['compare']:
+            with open(options['compare']) as handle:
+                regressions = compare(report, json.load(handle), options['threshold'], options['min_ms'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def run_local(self, options):
+        media_root = tempfile.mkdtemp()
+        # Throttles stay on; every simulated student has its own address and email.
+        try:
+            with override_settings(MEDIA_ROOT=media_root, MATERIAL_PREVIEW_WORKERS=0), transaction.atomic():
+                self.seed(options)
+                report = self.run(LocalClient(), options)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        return report
+
+    def run_remote(self, options):
+        try:
+            self.seed(options)
+            return self.run(RemoteClient(options['url']), options)
+        finally:
+            self.cleanup()
+
+    def seed(self, options):
+        self.stderr.write(f"Seeding {options['users']} students and {options['materials']} materials...")
+        branch_ids, _ = seed_dataset(options['users'], options['materials'], options['branches'], prefix=PREFIX)
+        for branch_id in branch_ids:
+            material = StudyMaterial(title=f'{PREFIX} download {branch_id}', branch_id=branch_id,
+                                     classification='Notes', is_preview=True)
+            material.file.save('download.pdf', ContentFile(b'%PDF-1.4\n' + os.urandom(options['file_size'])))
+        User.objects.create_user(username=f'{PREFIX}-admin', email=f'{PREFIX}-admin@example.com', password=PASSWORD,
+                                 is_staff=True, role='admin', is_verified=True)
+        self.branch_ids = branch_ids
+
+    def cleanup(self):
+        for material in StudyMaterial.objects.filter(title__startswith=PREFIX):
+            material.file.delete(save=False)
+        StudyMaterial.objects.filter(title__startswith=PREFIX).delete()
+        OutboundEmail.objects.filter(to__startswith=PREFIX).delete()
+        User.objects.filter(email__startswith=PREFIX).delete()
+        Branch.objects.filter(name__startswith=PREFIX).delete()
+
+    def run(self, client, options):
+        recorder = Recorder(client)
+        start = time.perf_counter()
+        for i in range(options['students']):
+            self.student_flow(recorder, i)
+        self.admin_flow(recorder)
+        return recorder.report(time.perf_counter() - start)
+
+    def student_flow(self, recorder, i):
+        email, ip = f'{PREFIX}-s{i}@example.com', f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}'
+        branch_id = self.branch_ids[i % len(self.branch_ids)]
+        recorder.call('signup', 'POST', '/api/signup/', {'username': f'{PREFIX}-s{i}', 'email': email,
+                                                         'password': PASSWORD, 'branch': branch_id}, ip=ip, expect=201)
+        body = OutboundEmail.objects.filter(to=email).latest('id').body
+        recorder.call('verify_otp', 'POST', '/api/verify-otp/', {'email': email, 'otp': OTP_RE.search(body)[1]}, ip=ip)
+        token = recorder.call('login', 'POST', '/api/login/', {'email': email, 'password': PASSWORD}, ip=ip)['access']
+        recorder.call('student_dashboard', 'GET', '/api/student/dashboard/', token=token, ip=ip)
+        materials = recorder.call('materials', 'GET', '/api/materials/', token=token, ip=ip)
+        download = next(row for row in materials if row['title'].startswith(f'{PREFIX} download'))
+        recorder.call('material_file', 'GET', f"/api/materials/{download['id']}/file/", token=token, ip=ip)
+
+    def admin_flow(self, recorder):
+        token = recorder.call('login', 'POST', '/api/login/', {'email': f'{PREFIX}-admin@example.com',
+                                                               'password': PASSWORD})['access']
+        for branch_id in self.branch_ids:
+            pending = recorder.call('admin_dashboard', 'GET', '/api/admin/dashboard/',
+                                    {'branch': branch_id, 'search': f'{PREFIX}-s', 'page_size': 100}, token=token)
+            for row in pending['results']:
+                recorder.call('approve', 'PATCH', f"/api/courserequests/{row['id']}/update/", {'status': 'Approved'},
+                              token=token)
+            recorder.call('student_list', 'GET', '/api/admin/students/', {'branch': branch_id, 'page_size': 100},
+                          token=token)
+
+    def print_report(self, report):
+        meta = report['meta']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{meta['target']} on {meta['database']}: {report['requests']} requests in {report['seconds']} s "
+            f"({report['requests_per_second']} req/s)"))
+        for name, result in report['endpoints'].items():
+            timing = result['timing']
+            queries = '-' if result['queries_per_request'] is None else f"{result['queries_per_request']:.2f}"
+            self.stdout.write(f"  {name:18} {timing['count']:>6}  {result['requests_per_second']:>8.1f} req/s  "
+                              f"p50 {timing['p50_ms']:>8.2f}  p95 {timing['p95_ms']:>8.2f}  p99 {timing['p99_ms']:>8.2f} ms"
+                              f"  {queries:>6} queries")
@@ -0,0 +1,82 @@
+import csv
+import json
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.exports import export_response
+from api.imports import BATCH_SIZE, import_students
+from api.models import Branch
+
+
+class Rollback(Exception):
+    pass
+
+
+def measure(func, trace_memory):
+    """
+    Run ``func`` and return its result, seconds taken and peak traced memory in MiB.
+
+    Tracing slows Python down several times over, so it is opt-in and the
+    timings of a traced run are not comparable with untraced ones.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+        elapsed = time.perf_counter() - start
+        peak = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2) if trace_memory else None
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+class Command(BaseCommand):
+    help = ("Import a generated CSV of --rows students, then stream them back out as CSV and NDJSON, "
+            "reporting throughput. Everything is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--trace-memory', action='store_true', help="Also report peak Python memory (slow).")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        report = {}
+        with tempfile.TemporaryFile('w+', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['username', 'email', 'branch', 'status', 'college'])
+            for i in range(rows):
+                writer.writerow([f'importbench{i}', f'importbench{i}@example.com', f'importbench-{i % 10}',
+                                 'Approved' if i % 3 else 'Pending', 'Bench College'])
+            handle.seek(0)
+            try:
+                with transaction.atomic():
+                    Branch.objects.bulk_create(Branch(name=f'importbench-{i}') for i in range(10))
+                    result, elapsed, peak = measure(
+                        lambda: import_students(handle, options['batch_size']), options['trace_memory'])
+                    report['import'] = {'rows': result.created, 'failed': result.failed, 'seconds': round(elapsed, 3),
+                                        'rows_per_second': round(result.created / elapsed), 'peak_mib': peak}
+                    for fmt in ('csv', 'ndjson'):
+                        size, elapsed, peak = measure(
+                            lambda: sum(len(chunk) for chunk in export_response('students', fmt).streaming_content),
+                            options['trace_memory'])
+                        report[f'export_{fmt}'] = {'bytes': size, 'seconds': round(elapsed, 3),
+                                                   'rows_per_second': round(rows / elapsed), 'peak_mib': peak}
+                    raise Rollback
+            except Rollback:
+                pass
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, result in report.items():
+            line = f"{name:14} {result['seconds']:>8.3f} s  {result['rows_per_second']:>9} rows/s"
+            if result['peak_mib'] is not None:
+                line += f"  peak {result['peak_mib']:>7.2f} MiB"
+            self.stdout.write(line)
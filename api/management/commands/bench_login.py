@@ -0,0 +1,101 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+
+from api import ratelimit
+from api.bench import LocalClient, summarize
+from api.models import User
+
+PREFIX = 'loginbench'
+PASSWORD = 'bench-pass-12345'
+HASHERS = {'pbkdf2': 'api.hashers.PBKDF2PasswordHasher', 'scrypt': 'api.hashers.ScryptPasswordHasher',
+           'argon2': 'api.hashers.Argon2PasswordHasher'}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Logins per second on one core for each password hasher at the configured costs: the hash alone, "
+            "successful logins, wrong passwords and unknown emails (which should cost the same), and attempts "
+            "refused by the login throttle. Runs in-process and is always rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', nargs='+', default=['pbkdf2', 'scrypt'], choices=list(HASHERS))
+        parser.add_argument('--logins', type=int, default=20, help="Attempts per kind and hasher.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        report = {}
+        for name in options['hashers']:
+            self.stderr.write(f"{name}...")
+            hashers = [HASHERS[name], *(path for path in settings.PASSWORD_HASHERS if path != HASHERS[name])]
+            try:
+                with override_settings(PASSWORD_HASHERS=hashers), transaction.atomic():
+                    report[name] = self.run(options['logins'])
+                    raise Rollback
+            except Rollback:
+                pass
+            except ValueError as exc:  # argon2-cffi missing
+                raise CommandError(f"{name}: {exc}")
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, result in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name}: {result['hash_ms']:.1f} ms per hash, {result['logins_per_second']:.1f} logins/s per core"))
+            for kind in ('login', 'wrong_password', 'unknown_email', 'throttled'):
+                timing = result[kind]
+                self.stdout.write(f"  {kind:15} p50 {timing['p50_ms']:>9.2f} ms   p95 {timing['p95_ms']:>9.2f} ms")
+
+    def run(self, logins):
+        encoded = make_password(PASSWORD)
+        hash_seconds = []
+        for _ in range(max(3, logins // 4)):
+            start = time.perf_counter()
+            check_password(PASSWORD, encoded)
+            hash_seconds.append(time.perf_counter() - start)
+        users = User.objects.bulk_create(
+            User(username=f'{PREFIX}-{i}', email=f'{PREFIX}-{i}@example.com', password=encoded, is_active=True,
+                 is_verified=True)
+            for i in range(logins)
+        )
+
+        client = LocalClient()
+        samples = {'login': [], 'wrong_password': [], 'unknown_email': [], 'throttled': []}
+        attempts = [
+            ('login', lambda i: {'email': users[i].email, 'password': PASSWORD}, 200),
+            ('wrong_password', lambda i: {'email': users[i].email, 'password': 'not-the-password'}, 401),
+            ('unknown_email', lambda i: {'email': f'{PREFIX}-missing-{i}@example.com', 'password': PASSWORD}, 401),
+        ]
+        with override_settings(LOGIN_IP_BURST=10 ** 9, LOGIN_EMAIL_BURST=10 ** 9):
+            for kind, data, expect in attempts:
+                for i in range(logins):
+                    samples[kind].append(self.attempt(client, data(i), expect))
+        ratelimit.buckets.clear()
+        with override_settings(LOGIN_IP_BURST=1):
+            client.request('POST', '/api/login/', {'email': users[0].email, 'password': PASSWORD}, {})  # the one allowed
+            for i in range(logins):
+                samples['throttled'].append(self.attempt(client, {'email': users[i].email, 'password': PASSWORD}, 429))
+        ratelimit.buckets.clear()
+
+        login = samples['login']
+        return {'hash_ms': round(statistics.median(hash_seconds) * 1000, 3),
+                'logins_per_second': round(len(login) / sum(login), 1),
+                **{kind: summarize(values) for kind, values in samples.items()}}
+
+    def attempt(self, client, data, expect):
+        start = time.perf_counter()
+        status, body, _ = client.request('POST', '/api/login/', data, {})
+        elapsed = time.perf_counter() - start
+        if status != expect:
+            raise CommandError(f"Login answered {status}, expected {expect}: {body[:200]!r}")
+        return elapsed
@@ -0,0 +1,99 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.bench import seed_dataset, summarize, time_calls
+from api.models import CourseRequest, Session, StudyMaterial, User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Seed a synthetic dataset and report EXPLAIN plans and p50/p99 latency of the hot endpoint "
+            "queries with and without the api indexes. Everything is rolled back unless --keep is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--materials', type=int, default=1_000_000)
+        parser.add_argument('--branches', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+        parser.add_argument('--keep', action='store_true', help="Commit the seeded rows instead of rolling back.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.stderr.write(f"Seeding {options['users']} users and {options['materials']} materials...")
+                branch_ids, student_ids = seed_dataset(options['users'], options['materials'], options['branches'])
+                report = self.run(branch_ids, student_ids, options['repeat'])
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            pass
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, result in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for variant in ('without_indexes', 'with_indexes'):
+                timing = result[variant]['timing']
+                self.stdout.write(f"  {variant:16} p50 {timing['p50_ms']:>9.3f} ms   p99 {timing['p99_ms']:>9.3f} ms")
+                for line in result[variant]['plan'].splitlines():
+                    self.stdout.write(f"    {line}")
+
+    def queries(self, branch_ids, student_ids):
+        rng = random.Random(7)
+        students = User.objects.filter(role='student', is_active=True).order_by('id')
+        middle = student_ids[len(student_ids) // 2]
+        pending = CourseRequest.objects.filter(status='Pending').order_by('id')
+        return {
+            'student_list': lambda: students[:50],
+            'student_list_deep_page': lambda: students.filter(id__gt=middle)[:50],
+            'student_list_by_branch': lambda: students.filter(
+                id__in=CourseRequest.objects.filter(branch_id=rng.choice(branch_ids)).values('student_id'))[:50],
+            'admin_dashboard': lambda: pending.select_related('student', 'branch')[:50],
+            'admin_dashboard_by_branch': lambda: pending.filter(branch_id=rng.choice(branch_ids))[:50],
+            'material_entitlement': lambda: CourseRequest.objects.filter(
+                student_id=rng.choice(student_ids)).values_list('branch_id', 'status'),
+            'materials_preview': lambda: StudyMaterial.objects.filter(
+                branch_id=rng.choice(branch_ids), is_preview=True).order_by('id')[:50],
+            'materials_by_classification': lambda: StudyMaterial.objects.filter(
+                branch_id=rng.choice(branch_ids), classification='PYQ').order_by('id')[:50],
+            'login_session_cleanup': lambda: Session.objects.filter(user_id=rng.choice(student_ids)),
+        }
+
+    def explain(self, queryset, phase):
+        # The phase comment stops SQLite from reusing an EXPLAIN prepared before the indexes were dropped.
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql} /* {phase} */', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def measure(self, queries, repeat, phase):
+        results = {}
+        for name, build in queries.items():
+            plan = self.explain(build(), phase)
+            samples = time_calls(lambda: list(build()), repeat)
+            results[name] = {'plan': plan, 'timing': summarize(samples)}
+        return results
+
+    def run(self, branch_ids, student_ids, repeat):
+        queries = self.queries(branch_ids, student_ids)
+        with_indexes = self.measure(queries, repeat, 'with_indexes')
+        try:
+            # Plain DROP INDEX is transactional on both Postgres and SQLite, so the rollback restores them.
+            with transaction.atomic(), connection.cursor() as cursor:
+                for model in (User, CourseRequest, StudyMaterial, Session):
+                    for index in model._meta.indexes:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+                without_indexes = self.measure(queries, repeat, 'without_indexes')
+                raise Rollback
+        except Rollback:
+            pass
+        return {name: {'without_indexes': without_indexes[name], 'with_indexes': with_indexes[name]}
+                for name in queries}
@@ -0,0 +1,79 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from api.bench import seed_dataset
+from api.fast_serializers import BranchValues, CourseRequestValues, StudentValues, StudyMaterialValues
+from api.models import Branch, CourseRequest, StudyMaterial, User
+from api.renderers import ORJSONRenderer
+from api.serializers import BranchSerializer, CourseRequestSerializer, StudyMaterialSerializer, UserSerializer
+
+CASES = (
+    ('branches', BranchSerializer, BranchValues, lambda: Branch.objects.all()),
+    ('students', UserSerializer, StudentValues, lambda: User.objects.filter(role='student')),
+    ('materials', StudyMaterialSerializer, StudyMaterialValues, lambda: StudyMaterial.objects.all()),
+    ('course_requests', CourseRequestSerializer, CourseRequestValues,
+     lambda: CourseRequest.objects.select_related('student', 'branch')),
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+def best_of(func, repeat):
+    """Fewest seconds ``func`` took over ``repeat`` runs, and its last result."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = ("Rows per second for each list serializer: ModelSerializer + JSONRenderer against the values() "
+            "fast path + ORJSONRenderer, query included. The seeded data is always rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20_000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                seed_dataset(options['rows'], options['rows'], branches=50, prefix='serialbench')
+                report = self.run(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, result in report.items():
+            self.stdout.write(f"{name:16} {result['rows']:>7} rows  model {result['model_rows_per_second']:>9} rows/s  "
+                              f"fast {result['fast_rows_per_second']:>9} rows/s  x{result['speedup']:.1f}")
+
+    def run(self, repeat):
+        context = {'request': RequestFactory().get('/', HTTP_HOST='localhost')}
+        report = {}
+        for name, serializer_class, fast_class, queryset in CASES:
+            fast = fast_class(context)
+            model_seconds, expected = best_of(
+                lambda: JSONRenderer().render(serializer_class(queryset(), many=True, context=context).data), repeat)
+            fast_seconds, output = best_of(
+                lambda: ORJSONRenderer().render(fast.many(fast.values(queryset()))), repeat)
+            if output != expected:
+                self.stderr.write(f"{name}: fast output differs from the ModelSerializer's")
+            rows = queryset().count()
+            report[name] = {'rows': rows, 'bytes': len(output), 'identical': output == expected,
+                            'model_rows_per_second': round(rows / model_seconds),
+                            'fast_rows_per_second': round(rows / fast_seconds),
+                            'speedup': round(model_seconds / fast_seconds, 2)}
+        return report
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+
+from api.authentication import start_session
+from api.bench import load_test, seed_dataset
+from api.models import Branch, CourseRequest, StudyMaterial, User
+from api.serializers import MyTokenObtainPairSerializer
+
+PREFIX = 'servebench'
+
+
+@contextmanager
+def gunicorn(mode, port, workers):
+    """Run gunicorn.conf.py in ``mode`` on ``port`` and yield its base URL."""
+    env = {**os.environ, 'SERVER_MODE': mode, 'GUNICORN_BIND': f'127.0.0.1:{port}', 'WEB_CONCURRENCY': str(workers)}
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--log-level', 'warning'],
+                               cwd=settings.BASE_DIR, env=env)
+    try:
+        if not wait_for_port('127.0.0.1', port, 30):
+            raise CommandError(f"gunicorn ({mode}) did not start; are gunicorn and uvicorn-worker installed?")
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+def wait_for_port(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = ("Load-test the branch, material list, dashboard and material file endpoints under gunicorn in "
+            "each SERVER_MODE (or against --url) and compare requests/sec and tail latency. Seeds rows "
+            f"prefixed '{PREFIX}' into the configured database and deletes them afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+        parser.add_argument('--url', help="Benchmark an already running server instead of starting gunicorn.")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=15.0, help="Seconds per endpoint.")
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--file-size', type=int, default=2 * 2 ** 20, help="Bytes in the downloaded file.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        self.stderr.write("Seeding...")
+        scenarios = self.seed(options['students'], options['file_size'])
+        report = {}
+        try:
+            if options['url']:
+                report['url'] = self.run(options['url'], scenarios, options)
+            else:
+                for mode in options['modes']:
+                    with gunicorn(mode, options['port'], options['workers']) as base_url:
+                        report[mode] = self.run(base_url, scenarios, options)
+        finally:
+            self.cleanup()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for target, endpoints in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(target))
+            for name, result in endpoints.items():
+                timing = result['timing']
+                self.stdout.write(f"  {name:18} {result['requests_per_second']:>9.1f} req/s   p50 {timing['p50_ms']:>8.2f} ms"
+                                  f"   p99 {timing['p99_ms']:>8.2f} ms   {result['statuses']}")
+
+    def seed(self, students, file_size):
+        seed_dataset(users=students * 2, materials=500, branches=5, prefix=PREFIX)
+        approved = list(CourseRequest.objects.filter(student__username__startswith=PREFIX, status='Approved',
+                                                     student__is_active=True).select_related('student')[:students])
+        if not approved:
+            raise CommandError("The seeded dataset has no approved students.")
+        headers = []
+        for course_request in approved:
+            refresh = MyTokenObtainPairSerializer.get_token(course_request.student)
+            start_session(course_request.student, refresh['sid'])
+            headers.append({'Authorization': f'Bearer {refresh.access_token}'})
+        material = StudyMaterial(title=f'{PREFIX} download', branch_id=approved[0].branch_id, classification='Notes')
+        material.file.save('download.pdf', ContentFile(b'%PDF-1.4\n' + os.urandom(file_size)), save=True)
+        owners = [header for header, course_request in zip(headers, approved)
+                  if course_request.branch_id == material.branch_id]
+        return {
+            'branches': [('/api/branches/', {})],
+            'materials': [('/api/materials/', header) for header in headers],
+            'student_dashboard': [('/api/student/dashboard/', header) for header in headers],
+            'material_file': [(f'/api/materials/{material.pk}/file/', header) for header in owners],
+        }
+
+    def cleanup(self):
+        for material in StudyMaterial.objects.filter(title__startswith=PREFIX):
+            material.file.delete(save=False)
+        StudyMaterial.objects.filter(title__startswith=PREFIX).delete()
+        User.objects.filter(username__startswith=PREFIX).delete()
+        Branch.objects.filter(name__startswith=PREFIX).delete()
+
+    def run(self, base_url, scenarios, options):
+        results = {}
+        for name, requests in scenarios.items():
+            self.stderr.write(f"{base_url} {name}...")
+            results[name] = asyncio.run(load_test(base_url, requests, options['concurrency'], options['duration']))
+        return results
@@ -0,0 +1,82 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.authentication import session_cache, start_session
+from api.bench import seed_dataset, summarize, time_calls
+from api.models import CourseRequest
+from api.serializers import MyTokenObtainPairSerializer
+
+ENDPOINTS = ('student_dashboard', 'materials-list', 'course-request-detail')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Compare queries and latency per request for the student read endpoints with JWT_TOKEN_USER_MODE "
+            "off and on. The seeded data is always rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--materials', type=int, default=2000)
+        parser.add_argument('--students', type=int, default=50, help="Logged-in students the requests rotate over.")
+        parser.add_argument('--repeat', type=int, default=500)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                seed_dataset(options['users'], options['materials'], branches=5, prefix='tokenbench')
+                report = self.run(options['students'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, result in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for mode in ('user_load', 'token_user'):
+                row = result[mode]
+                self.stdout.write(f"  {mode:10} {row['queries_per_request']:>5.2f} queries   "
+                                  f"p50 {row['timing']['p50_ms']:>8.3f} ms   p99 {row['timing']['p99_ms']:>8.3f} ms")
+            self.stdout.write(f"  saved      {result['queries_saved_per_request']:>5.2f} queries per request")
+
+    def login(self, students):
+        headers = []
+        requests = CourseRequest.objects.filter(status='Approved', student__is_active=True).select_related('student')
+        for course_request in requests[:students]:
+            refresh = MyTokenObtainPairSerializer.get_token(course_request.student)
+            start_session(course_request.student, refresh['sid'])
+            headers.append(f'Bearer {refresh.access_token}')
+        return headers
+
+    def run(self, students, repeat):
+        headers = self.login(students)
+        client = Client(HTTP_HOST='localhost')
+        rng = random.Random(7)
+        report = {}
+        for name in ENDPOINTS:
+            url = reverse(name)
+            result = {}
+            for mode, enabled in (('user_load', False), ('token_user', True)):
+                with override_settings(JWT_TOKEN_USER_MODE=enabled):
+                    session_cache.clear()
+                    # One pass over every student warms the session and list caches.
+                    for header in headers:
+                        client.get(url, HTTP_AUTHORIZATION=header)
+                    with CaptureQueriesContext(connection) as queries:
+                        samples = time_calls(lambda: client.get(url, HTTP_AUTHORIZATION=rng.choice(headers)), repeat)
+                result[mode] = {'queries_per_request': len(queries) / repeat, 'timing': summarize(samples)}
+            result['queries_saved_per_request'] = (
+                result['user_load']['queries_per_request'] - result['token_user']['queries_per_request'])
+            report[name] = result
+        return report
@@ -0,0 +1,48 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import StudyMaterial, next_change_version
+from api.storage import digest_from_name
+
+
+class Command(BaseCommand):
+    help = "Move legacy material files into content-addressed storage, collapsing identical files into one blob."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-originals', action='store_true',
+                            help="Leave the legacy files in place after repointing the rows.")
+
+    def handle(self, *args, **options):
+        storage = StudyMaterial._meta.get_field('file').storage
+        moved, missing, originals = 0, 0, set()
+
+        rows = StudyMaterial.objects.values_list('pk', 'file').order_by('pk')
+        for pk, name in rows.iterator(chunk_size=500):
+            if not name or digest_from_name(name):
+                continue
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f"material {pk}: {name} is missing")
+                continue
+            with storage.open(name, 'rb') as handle:
+                blob = storage.save(name, File(handle))
+            # A new file URL is a change synced clients have to see.
+            with transaction.atomic():
+                StudyMaterial.objects.filter(pk=pk, file=name).update(file=blob, change_version=next_change_version())
+            originals.add(name)
+            moved += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f"material {pk}: {name} -> {blob}")
+
+        removed = 0
+        if not options['keep_originals']:
+            still_used = set(StudyMaterial.objects.filter(file__in=originals).values_list('file', flat=True))
+            for name in originals - still_used:
+                storage.delete(name)
+                removed += 1
+
+        blobs = StudyMaterial.objects.values('file').distinct().count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Repointed {moved} material(s) onto {blobs} blob(s); removed {removed} legacy file(s); {missing} missing."
+        ))
@@ -0,0 +1,59 @@
+import os
+import shutil
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from api.models import StudyMaterial
+from api.storage import digest_from_name
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed material blobs that no StudyMaterial row references."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=3600,
+                            help="Keep unreferenced files younger than this many seconds (in-flight uploads).")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting.")
+
+    def handle(self, *args, **options):
+        storage = StudyMaterial._meta.get_field('file').storage
+        refs = dict(StudyMaterial.objects.values_list('file').annotate(refs=Count('id')).order_by())
+        cutoff = time.time() - options['grace']
+
+        kept = removed = freed = 0
+        for name, full_path in storage.iter_blobs():
+            is_temp = os.path.basename(name).startswith('.upload-')
+            if not is_temp and (digest_from_name(name) is None or refs.get(name)):
+                kept += 1
+                continue
+            stat = os.stat(full_path)
+            if stat.st_mtime > cutoff:
+                kept += 1
+                continue
+            if options['verbosity'] > 1:
+                self.stdout.write(f"remove {name}")
+            if not options['dry_run']:
+                os.unlink(full_path)
+            removed += 1
+            freed += stat.st_size
+
+        # Previews are keyed by content digest; legacy names have none, so leave previews alone until deduped.
+        digests = {digest_from_name(name) for name in refs}
+        pruned = 0
+        if None not in digests and default_storage.exists('previews'):
+            for bucket in os.scandir(default_storage.path('previews')):
+                for entry in os.scandir(bucket.path):
+                    if entry.name not in digests and entry.stat().st_mtime <= cutoff:
+                        if not options['dry_run']:
+                            shutil.rmtree(entry.path)
+                        pruned += 1
+
+        shared = sum(1 for count in refs.values() if count > 1)
+        prefix = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {removed} file(s), {freed} bytes, and {pruned} preview set(s); kept {kept}; "
+            f"{shared} blob(s) shared by several materials."
+        ))
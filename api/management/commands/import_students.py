@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.imports import BATCH_SIZE, import_students
+
+
+class Command(BaseCommand):
+    help = ("Create students and their course requests from a CSV file with username, email and optional "
+            "branch, status, college and phone_number columns.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate the file without inserting anything.")
+
+    def handle(self, *args, **options):
+        with open(options['path'], newline='', encoding='utf-8-sig') as handle:
+            report = import_students(handle, options['batch_size'], options['dry_run'])
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if report.failed > len(report.errors):
+            self.stderr.write(f"... and {report.failed - len(report.errors)} more error(s)")
+        verb = "Would create" if options['dry_run'] else "Created"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {report.created} student(s), {report.failed} row(s) failed."))
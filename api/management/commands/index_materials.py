@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.models import StudyMaterial
+from api.search import index_material_text
+
+
+class Command(BaseCommand):
+    help = "Extract PDF text into the search index for materials whose current file has not been indexed yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-extract text that is already indexed.")
+
+    def handle(self, *args, **options):
+        indexed = failed = 0
+        for material in StudyMaterial.objects.order_by('pk').iterator(chunk_size=500):
+            try:
+                stored = index_material_text(material, options['force'])
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"material {material.pk}: {exc}")
+                continue
+            indexed += stored
+            if stored and options['verbosity'] > 1:
+                self.stdout.write(f"material {material.pk}: indexed")
+        self.stdout.write(self.style.SUCCESS(f"Indexed text of {indexed} material(s), {failed} failed."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import OTPChallenge
+
+
+class Command(BaseCommand):
+    # Challenges out of attempts stay until they expire, so a resend cannot hand their guesses back.
+    help = "Delete one-time code challenges that have expired."
+
+    def handle(self, *args, **options):
+        deleted, _ = OTPChallenge.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired OTP challenge(s)."))
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import OutboundEmail
+
+
+class Command(BaseCommand):
+    help = "Delete sent and dead outbox messages older than --days."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Keep messages created in the last this many days.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = OutboundEmail.objects.filter(status__in=('sent', 'dead'), created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} old outbox message(s)."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from api.models import Session
+
+
+class Command(BaseCommand):
+    help = "Delete login sessions whose refresh token has expired."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - api_settings.REFRESH_TOKEN_LIFETIME
+        deleted, _ = Session.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired session(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the admin statistics counters from the tables and report the ones that had drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report the drift.")
+
+    def handle(self, *args, **options):
+        drift = rebuild(dry_run=options['dry_run'])
+        for (metric, branch_id, bucket), (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f"{metric} branch={branch_id} {bucket or '-'}: {stored} -> {actual}")
+        verb = "Found" if options['dry_run'] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drift)} drifted counter(s)."))
@@ -0,0 +1,43 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.models import StudyMaterial
+from api.previews import content_digest, previews_ready, render_args, render_previews
+
+
+class Command(BaseCommand):
+    help = "Render thumbnails and page previews for study materials that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-render previews that already exist.")
+        parser.add_argument('--workers', type=int, default=settings.MATERIAL_PREVIEW_WORKERS or 1)
+
+    def handle(self, *args, **options):
+        jobs, seen = {}, set()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for material in StudyMaterial.objects.order_by('pk').iterator(chunk_size=500):
+                try:
+                    digest = content_digest(material.file)
+                except OSError:
+                    self.stderr.write(f"material {material.pk}: {material.file.name} is missing")
+                    continue
+                if digest in seen or (previews_ready(digest) and not options['force']):
+                    continue
+                seen.add(digest)
+                jobs[pool.submit(render_previews, *render_args(material, digest))] = material.pk
+
+            rendered = failed = 0
+            for future in as_completed(jobs):
+                try:
+                    pages = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"material {jobs[future]}: {exc}")
+                else:
+                    rendered += 1
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"material {jobs[future]}: {pages} page(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered previews for {rendered} file(s), {failed} failed."))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.mail import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Send queued OTP and notification mails in batches over one connection per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="Keep polling the outbox instead of exiting when it is empty.")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep between polls with --loop.")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = drain_outbox(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"sent {sent}, failed {failed}")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {total_sent} mail(s), {total_failed} failure(s)."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.uploads import sweep
+
+
+class Command(BaseCommand):
+    help = ("Delete chunked upload sessions untouched for MATERIAL_UPLOAD_SESSION_TTL seconds, "
+            "and part files whose session is gone.")
+
+    def handle(self, *args, **options):
+        sessions, files, freed = sweep()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {sessions} abandoned upload session(s) and {files} part file(s), {freed} bytes."))
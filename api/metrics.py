@@ -0,0 +1,276 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+``MetricsMiddleware`` times every request, counts its queries through an
+execute wrapper on every connection and records latency, query count, query time,
+response size and status into the process-local ``registry``: a few dict
+updates under a lock, no I/O. With ``METRICS_DIR`` set, each process also
+dumps its cumulative numbers to ``<METRICS_DIR>/metrics-<pid>.json`` every
+``METRICS_FLUSH_INTERVAL`` seconds and ``/metrics`` sums the files of every
+worker, so a scrape sees the whole gunicorn pool whichever worker serves it.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .cache import stats as cache_stats
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Request latency by view.', LATENCY_BUCKETS),
+    'http_response_size_bytes': ('Response body size by view (streamed bodies without a length are left out).',
+                                 SIZE_BUCKETS),
+    'db_queries_per_request': ('Database queries per request by view.', QUERY_BUCKETS),
+}
+COUNTERS = {
+    'http_requests_total': 'Requests by view, method and status code.',
+    'db_query_duration_seconds_total': 'Time spent in database queries by view.',
+    'cache_events_total': 'Catalogue cache lookups by namespace and outcome (this process only).',
+}
+
+
+class Registry:
+    """Counters and histograms keyed by ``(metric, label values)``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        # [bucket counts (non-cumulative, one past the last bound for +Inf), sum, count]
+        self.histograms = {}
+        self.flushed_at = time.monotonic()
+
+    def record_request(self, view, method, status, seconds, size, queries, query_seconds):
+        # The per-request hot path: one lock, no allocations once a view has been seen.
+        view_labels = (('view', view),)
+        status_labels = (('view', view), ('method', method), ('status', str(status)))
+        observations = [('http_request_duration_seconds', seconds), ('db_queries_per_request', queries)]
+        if size is not None:
+            observations.append(('http_response_size_bytes', size))
+        counters, histograms = self.counters, self.histograms
+        with self._lock:
+            key = ('http_requests_total', status_labels)
+            counters[key] = counters.get(key, 0) + 1
+            key = ('db_query_duration_seconds_total', view_labels)
+            counters[key] = counters.get(key, 0) + query_seconds
+            for name, value in observations:
+                key = (name, view_labels)
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = [[0] * (len(HISTOGRAMS[name][1]) + 1), 0, 0]
+                histogram[0][bisect_left(HISTOGRAMS[name][1], value)] += 1
+                histogram[1] += value
+                histogram[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(buckets), total, count]
+                               for (name, labels), (buckets, total, count) in self.histograms.items()],
+            }
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def flush(self, force=False):
+        """Write this process's snapshot to ``METRICS_DIR``, at most every ``METRICS_FLUSH_INTERVAL`` seconds."""
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (not force and now - self.flushed_at < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self.flushed_at = now
+        path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(f'{path}.tmp', 'w') as handle:
+                json.dump(self.snapshot(), handle)
+            os.replace(f'{path}.tmp', path)
+        except OSError as exc:
+            logger.warning("Cannot write metrics to %s: %s", path, exc)
+
+
+registry = Registry()
+
+
+def collect():
+    """Snapshots of every worker: the files in ``METRICS_DIR`` (this process's freshly written) or just this one."""
+    directory = settings.METRICS_DIR
+    if not directory:
+        return [registry.snapshot()]
+    registry.flush(force=True)
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.startswith('metrics-') and name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name)) as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                continue  # a worker being replaced mid-read; it is counted on the next scrape
+    return snapshots
+
+
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render(snapshots):
+    """Sum the snapshots and write them out in the Prometheus text exposition format."""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+    for (namespace, outcome), value in cache_stats.items():
+        counters['cache_events_total', (('namespace', namespace), ('outcome', outcome))] = value
+
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [f'{name}{format_labels(labels)} {value}'
+                  for (metric, labels), value in sorted(counters.items()) if metric == name]
+    for name, (help_text, bounds) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip((*bounds, '+Inf'), buckets):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+            lines += [f'{name}_sum{format_labels(labels)} {total}', f'{name}_count{format_labels(labels)} {count}']
+    return '\n'.join(lines) + '\n'
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match else '<unmatched>'
+
+
+class QueryTimer:
+    """``execute_wrapper`` that counts and times queries and logs the slow ones."""
+
+    def __init__(self, request):
+        self.request = request
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+                logger.warning("Slow query (%.1f ms) in %s: %s", elapsed * 1000, view_name(self.request), sql)
+
+
+# The QueryTimer of the request being handled. Connections are per thread and under ASGI the ORM runs in
+# sync_to_async threads, which get a copy of the request's context, so the timer is found through it.
+current_queries = ContextVar('current_queries', default=None)
+
+
+def timed_execute(execute, sql, params, many, context):
+    queries = current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Sent again whenever a connection object reconnects.
+    if timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timed_execute)
+
+
+class MetricsMiddleware:
+    """
+    Records every request in ``registry``; goes first in ``MIDDLEWARE`` so the timing covers the whole stack.
+
+    Async-capable like the rest of the stack, so under ASGI requests stay on
+    the event loop. Streaming responses are timed up to the point the body
+    starts.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        queries, token = self.start(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_queries.reset(token)
+        self.record(request, response, elapsed, queries)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        queries, token = self.start(request)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_queries.reset(token)
+        self.record(request, response, elapsed, queries)
+        return response
+
+    def start(self, request):
+        queries = QueryTimer(request)
+        return queries, current_queries.set(queries)
+
+    def record(self, request, response, elapsed, queries):
+        view = view_name(request)
+        if response.streaming:
+            size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+        else:
+            size = len(response.content)
+        registry.record_request(view, request.method, response.status_code, elapsed, size,
+                                queries.count, queries.seconds)
+        if elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+            logger.warning("Slow request (%.1f ms, %d queries, %.1f ms in SQL): %s %s -> %s [%s]",
+                           elapsed * 1000, queries.count, queries.seconds * 1000, request.method,
+                           request.get_full_path(), response.status_code, view)
+        registry.flush()
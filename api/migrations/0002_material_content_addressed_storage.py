@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:03
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='studymaterial',
+            name='file',
+            field=models.FileField(storage=api.storage.material_storage, upload_to='materials/'),
+        ),
+    ]
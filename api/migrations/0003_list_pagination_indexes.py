@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_material_content_addressed_storage'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='courserequest',
+            index=models.Index(fields=['status', 'id'], name='request_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courserequest',
+            index=models.Index(fields=['branch', 'status', 'id'], name='request_branch_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courserequest',
+            index=models.Index(fields=['branch', 'student'], name='request_branch_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studymaterial',
+            index=models.Index(fields=['branch', 'is_preview', 'id'], name='material_branch_preview_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studymaterial',
+            index=models.Index(fields=['branch', 'classification', 'id'], name='material_branch_class_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'is_active', 'id'], name='user_role_active_id_idx'),
+        ),
+    ]
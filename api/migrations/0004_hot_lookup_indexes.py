@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_list_pagination_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='courserequest',
+            name='request_status_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='studymaterial',
+            name='material_branch_preview_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_role_active_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='courserequest',
+            index=models.Index(fields=['student', 'status', 'branch'], name='request_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courserequest',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['id'], name='request_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studymaterial',
+            index=models.Index(condition=models.Q(('is_preview', True)), fields=['branch', 'id'], name='material_preview_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('role', 'student')), fields=['id'], name='user_active_student_idx'),
+        ),
+    ]
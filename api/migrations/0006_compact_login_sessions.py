@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+def clear_sessions(apps, schema_editor):
+    # Old rows hold whole access tokens, which do not fit the new key and no token carries a sid yet.
+    apps.get_model('api', 'Session').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_outbound_email'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_sessions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='session',
+            name='session_key',
+            field=models.CharField(max_length=64, primary_key=True, serialize=False),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['created_at'], name='session_created_idx'),
+        ),
+    ]
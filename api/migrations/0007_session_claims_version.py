@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_compact_login_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='claims_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:19
+
+import re
+
+from django.db import migrations, models
+
+
+def seed_student_id_sequence(apps, schema_editor):
+    # Start above every existing numeric id so new ids never collide with the old PROD-NNNN ones,
+    # whatever STUDENT_ID_FORMAT is.
+    User = apps.get_model('api', 'User')
+    highest = 0
+    for student_id in User.objects.exclude(student_id=None).values_list('student_id', flat=True).iterator():
+        match = re.search(r'(\d+)$', student_id)
+        if match:
+            highest = max(highest, int(match.group(1)))
+    apps.get_model('api', 'Sequence').objects.update_or_create(name='student_id', defaults={'next_value': highest + 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_session_claims_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(seed_student_id_sequence, migrations.RunPython.noop),
+    ]
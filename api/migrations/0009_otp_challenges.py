@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_student_id_sequence'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='otp',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='otp_expiry',
+        ),
+        migrations.CreateModel(
+            name='OTPChallenge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(choices=[('verify', 'Verify account'), ('reset', 'Reset password')], max_length=10)),
+                ('code_hash', models.CharField(max_length=64)),
+                ('expires_at', models.DateTimeField()),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='otp_expires_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'purpose'), name='otp_user_purpose_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+POSTGRES_INDEX = [
+    """ALTER TABLE api_materialtext ADD COLUMN search tsvector GENERATED ALWAYS AS (
+           setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', content), 'B')
+       ) STORED""",
+    "CREATE INDEX materialtext_search_idx ON api_materialtext USING GIN (search)",
+]
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE api_materialtext_fts USING fts5(
+           title, content, content='api_materialtext', content_rowid='material_id', tokenize='porter unicode61'
+       )""",
+    """CREATE TRIGGER api_materialtext_ai AFTER INSERT ON api_materialtext BEGIN
+           INSERT INTO api_materialtext_fts (rowid, title, content) VALUES (new.material_id, new.title, new.content);
+       END""",
+    """CREATE TRIGGER api_materialtext_ad AFTER DELETE ON api_materialtext BEGIN
+           INSERT INTO api_materialtext_fts (api_materialtext_fts, rowid, title, content)
+           VALUES ('delete', old.material_id, old.title, old.content);
+       END""",
+    """CREATE TRIGGER api_materialtext_au AFTER UPDATE ON api_materialtext BEGIN
+           INSERT INTO api_materialtext_fts (api_materialtext_fts, rowid, title, content)
+           VALUES ('delete', old.material_id, old.title, old.content);
+           INSERT INTO api_materialtext_fts (rowid, title, content) VALUES (new.material_id, new.title, new.content);
+       END""",
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_INDEX, 'sqlite': SQLITE_INDEX}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+    # Titles are searchable at once; the index_materials command extracts the PDF text.
+    StudyMaterial, MaterialText = apps.get_model('api', 'StudyMaterial'), apps.get_model('api', 'MaterialText')
+    MaterialText.objects.bulk_create(
+        (MaterialText(material_id=pk, title=title) for pk, title in StudyMaterial.objects.values_list('pk', 'title')),
+        batch_size=1000,
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE api_materialtext_fts")
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_otp_challenges'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialText',
+            fields=[
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='api.studymaterial')),
+                ('title', models.CharField(max_length=200)),
+                ('content', models.TextField(blank=True)),
+                ('digest', models.CharField(blank=True, max_length=64)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
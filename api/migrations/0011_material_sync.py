@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+def create_change_version_sequence(apps, schema_editor):
+    apps.get_model('api', 'Sequence').objects.get_or_create(name='change_version')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_material_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('material_id', models.BigIntegerField()),
+                ('branch_id', models.BigIntegerField()),
+                ('change_version', models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='courserequest',
+            name='change_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studymaterial',
+            name='change_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='studymaterial',
+            index=models.Index(fields=['branch', 'change_version'], name='material_branch_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='materialtombstone',
+            index=models.Index(fields=['branch_id', 'change_version'], name='tombstone_branch_version_idx'),
+        ),
+        migrations.RunPython(create_change_version_sequence, migrations.RunPython.noop),
+    ]
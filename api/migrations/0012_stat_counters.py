@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:18
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# api.stats.ALL_BRANCHES, copied so the migration keeps working whatever that module becomes.
+ALL_BRANCHES = 0
+
+
+def fill_counters(apps, schema_editor):
+    StatCounter = apps.get_model('api', 'StatCounter')
+    CourseRequest, User = apps.get_model('api', 'CourseRequest'), apps.get_model('api', 'User')
+    StudyMaterial = apps.get_model('api', 'StudyMaterial')
+    counts = Counter()
+    for branch_id, status, total in (CourseRequest.objects.values_list('branch_id', 'status')
+                                     .annotate(total=Count('id')).order_by()):
+        counts['requests', branch_id, status] = total
+    for branch_id, total in (CourseRequest.objects.filter(student__role='student', student__is_active=True)
+                             .values_list('branch_id').annotate(total=Count('student_id', distinct=True)).order_by()):
+        counts['students', branch_id, ''] = total
+    counts['students', ALL_BRANCHES, ''] = User.objects.filter(role='student', is_active=True).count()
+    for branch_id, classification, total in (StudyMaterial.objects.values_list('branch_id', 'classification')
+                                             .annotate(total=Count('id')).order_by()):
+        counts['materials', branch_id, classification] = total
+    StatCounter.objects.bulk_create(StatCounter(metric=metric, branch_id=branch_id, bucket=bucket, value=value)
+                                    for (metric, branch_id, bucket), value in counts.items() if value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_material_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=20)),
+                ('branch_id', models.BigIntegerField()),
+                ('bucket', models.CharField(blank=True, max_length=20)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('metric', 'branch_id', 'bucket'), name='stat_counter_key')],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+def blank_delivered_bodies(apps, schema_editor):
+    # Sent and dead messages no longer keep their bodies, which hold plain-text one-time codes.
+    apps.get_model('api', 'OutboundEmail').objects.filter(status__in=('sent', 'dead')).exclude(body='').update(body='')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_delivered_bodies, migrations.RunPython.noop),
+    ]
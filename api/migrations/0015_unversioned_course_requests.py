@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:56
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_blank_delivered_mail_bodies'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='courserequest',
+            name='change_version',
+        ),
+    ]
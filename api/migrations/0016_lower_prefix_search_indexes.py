@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:02
+
+from django.db import migrations
+
+# search_students matches a prefix of LOWER(student_id) / LOWER(email). text_pattern_ops lets a LIKE 'x%'
+# use the index whatever the database collation is. SQLite's LIKE already ignores case and needs none.
+POSTGRES_INDEXES = {
+    'user_student_id_lower_idx': 'student_id',
+    'user_email_lower_idx': 'email',
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in POSTGRES_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX {name} ON api_user ((LOWER({column})) text_pattern_ops)')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in POSTGRES_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_unversioned_course_requests'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
+from django.utils import timezone
+
+from .storage import material_storage
 
 class User(AbstractUser):
     ROLE_CHOICES = (('student', 'Student'), ('admin', 'Admin'))
@@ -15,20 +20,80 @@ class User(AbstractUser):
     is_verified = models.BooleanField(default=False)
     college = models.CharField(max_length=200, blank=True, null=True)
     phone_number = models.CharField(max_length=15, blank=True, null=True)
-    otp = models.CharField(max_length=4, blank=True, null=True)
-    otp_expiry = models.DateTimeField(blank=True, null=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Student list walked in id order for cursor pagination. Partial, because Django renders
+            # is_active=True as a bare boolean that SQLite cannot match against a composite index.
+            models.Index(fields=['id'], condition=models.Q(role='student', is_active=True), name='user_active_student_idx'),
+        ]
+
+CHANGE_VERSION_SEQUENCE = 'change_version'
+
+def next_change_version():
+    # The UPDATE locks the row (created by migration 0011) until the caller's transaction ends.
+    if Sequence.objects.filter(name=CHANGE_VERSION_SEQUENCE).update(next_value=models.F('next_value') + 1):
+        return Sequence.objects.values_list('next_value', flat=True).get(name=CHANGE_VERSION_SEQUENCE) - 1
+    return Sequence.reserve(CHANGE_VERSION_SEQUENCE, 1)[0]
+
+class VersionedModel(models.Model):
+    """
+    Stamps every save with the next value of one global sequence, for the delta sync in ``api.sync``.
+
+    The sequence row stays locked until the saving transaction commits, so
+    versions become visible in the order they were handed out and a client
+    that has seen version ``n`` has seen every committed change up to it.
+    Bulk writes bypass ``save()`` and stamp ``next_change_version()`` themselves.
+    """
+    change_version = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'change_version'}
+        with transaction.atomic(savepoint=False):
+            self.change_version = next_change_version()
+            super().save(*args, **kwargs)
 
 class Branch(models.Model):
     name = models.CharField(max_length=100)
     def __str__(self): return self.name
 
-class StudyMaterial(models.Model):
+class StudyMaterial(VersionedModel):
     CLASSIFICATION_CHOICES = (('PYQ', 'PYQ'), ('Notes', 'Notes'), ('One-shots', 'One-shots'))
     title = models.CharField(max_length=200)
-    file = models.FileField(upload_to='materials/')
+    file = models.FileField(upload_to='materials/', storage=material_storage)
     classification = models.CharField(max_length=10, choices=CLASSIFICATION_CHOICES)
     branch = models.ForeignKey('Branch', on_delete=models.CASCADE)
     is_preview = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Preview lists for students awaiting approval; partial for the same bare-boolean reason as User.
+            models.Index(fields=['branch', 'id'], condition=models.Q(is_preview=True), name='material_preview_idx'),
+            models.Index(fields=['branch', 'classification', 'id'], name='material_branch_class_idx'),
+            # Delta sync: what changed in a branch after a version.
+            models.Index(fields=['branch', 'change_version'], name='material_branch_version_idx'),
+        ]
+
+    def __str__(self): return self.title
+
+class MaterialText(models.Model):
+    """
+    Searchable text of a material, kept up to date by ``api.search``.
+
+    The full-text index itself is vendor-specific and created by migration
+    0010: a generated ``tsvector`` column with a GIN index on PostgreSQL, an
+    FTS5 table kept in sync by triggers on SQLite.
+    """
+    material = models.OneToOneField(StudyMaterial, on_delete=models.CASCADE, primary_key=True)
+    title = models.CharField(max_length=200)
+    content = models.TextField(blank=True)
+    # sha256 of the file the content was extracted from; blank until extraction ran.
+    digest = models.CharField(max_length=64, blank=True)
+
     def __str__(self): return self.title
 
 class CourseRequest(models.Model):
@@ -36,13 +101,145 @@ class CourseRequest(models.Model):
     student = models.ForeignKey('User', on_delete=models.CASCADE)
     branch = models.ForeignKey('Branch', on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'status', 'id'], name='request_branch_status_id_idx'),
+            # Student list filtered by branch: semi-join from branch to students.
+            models.Index(fields=['branch', 'student'], name='request_branch_student_idx'),
+            # Entitlement lookup on every material request, answered from the index alone.
+            models.Index(fields=['student', 'status', 'branch'], name='request_student_status_idx'),
+            # The admin dashboard lists pending requests, a small slice once admissions settle. Other statuses
+            # are common enough that a primary-key scan finds a page of them quickly.
+            models.Index(fields=['id'], condition=models.Q(status='Pending'), name='request_pending_idx'),
+        ]
+
     def __str__(self): return f"{self.student.username} - {self.branch.name} ({self.status})"
 
 class Session(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    # Use TextField as the primary key to guarantee enough space
-    session_key = models.TextField(primary_key=True) 
+    # The login's refresh-token jti, carried by its tokens as the ``sid`` claim.
+    session_key = models.CharField(max_length=64, primary_key=True)
+    # Bumped when the entitlement claims in this session's tokens go stale.
+    claims_version = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['created_at'], name='session_created_idx')]
+
     def __str__(self):
-        return f"{self.user.username}'s session"
\ No newline at end of file
+        return f"{self.user.username}'s session"
+
+class OTPChallenge(models.Model):
+    """The one live one-time code per user and purpose; codes are stored as keyed hashes."""
+    PURPOSE_CHOICES = (('verify', 'Verify account'), ('reset', 'Reset password'))
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    purpose = models.CharField(max_length=10, choices=PURPOSE_CHOICES)
+    code_hash = models.CharField(max_length=64)
+    expires_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'purpose'], name='otp_user_purpose_uniq')]
+        # The sweeper deletes by expiry.
+        indexes = [models.Index(fields=['expires_at'], name='otp_expires_idx')]
+
+    def __str__(self): return f"{self.user_id} {self.purpose} (expires {self.expires_at})"
+
+class Sequence(models.Model):
+    """A named counter handed out in blocks; see ``api.student_ids``."""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self): return f"{self.name} @ {self.next_value}"
+
+    @classmethod
+    def reserve(cls, name, count):
+        """Reserve ``count`` consecutive values of the named sequence; its row stays locked until the outer transaction ends."""
+        with transaction.atomic():
+            sequence, _ = cls.objects.select_for_update().get_or_create(name=name)
+            first = sequence.next_value
+            sequence.next_value = first + count
+            sequence.save(update_fields=['next_value'])
+        return range(first, first + count)
+
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = (('pending', 'Pending'), ('sent', 'Sent'), ('dead', 'Dead'))
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='pending'), name='outbox_due_idx'),
+        ]
+
+    def __str__(self): return f"{self.subject} -> {self.to} ({self.status})"
+
+class MaterialTombstone(models.Model):
+    """A material deleted from, or moved out of, a branch, for clients syncing that branch (see ``api.sync``)."""
+    material_id = models.BigIntegerField()
+    # Not a foreign key: deleting a branch deletes its materials, which leave tombstones for that branch.
+    branch_id = models.BigIntegerField()
+    change_version = models.PositiveBigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch_id', 'change_version'], name='tombstone_branch_version_idx'),
+        ]
+
+    def __str__(self): return f"material {self.material_id} left branch {self.branch_id} @ {self.change_version}"
+
+
+class StatCounter(models.Model):
+    """
+    One figure of the admin statistics, kept current by ``api.stats`` on every write.
+
+    ``metric`` is ``requests`` (bucket: status), ``students`` (active students
+    with a request in the branch; branch 0 counts all active students) or
+    ``materials`` (bucket: classification).
+    """
+    metric = models.CharField(max_length=20)
+    branch_id = models.BigIntegerField()
+    bucket = models.CharField(max_length=20, blank=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'branch_id', 'bucket'], name='stat_counter_key'),
+        ]
+
+    def __str__(self): return f"{self.metric}[{self.branch_id}, {self.bucket!r}] = {self.value}"
+
+
+class UploadSession(models.Model):
+    """
+    A material upload in progress, sent in chunks by ``api.uploads``.
+
+    The material fields and the size and sha256 of the whole file are given up
+    front; ``offset`` is how many bytes have been received and verified so far.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    classification = models.CharField(max_length=10, choices=StudyMaterial.CLASSIFICATION_CHOICES)
+    branch = models.ForeignKey('Branch', on_delete=models.CASCADE)
+    is_preview = models.BooleanField(default=False)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='upload_session_updated_idx')]
+
+    def __str__(self): return f"{self.filename}: {self.offset}/{self.size} bytes"
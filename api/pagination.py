@@ -0,0 +1,23 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key.
+
+    Every page is a ``WHERE id > <cursor> ORDER BY id LIMIT n`` range scan, so
+    deep pages cost the same as the first one and no COUNT(*) is issued.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class OptionalCursorPagination(IdCursorPagination):
+    """Only paginates when the client asks for it with ``cursor`` or ``page_size``."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if 'cursor' not in request.query_params and 'page_size' not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
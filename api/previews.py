@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from pdf2image import convert_from_path
+
+from .cache import get_cache
+from .storage import digest_from_name
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL = 'thumb.jpg'
+# Seconds before a job that failed is accepted again; a broken PDF would otherwise render on every poll.
+RETRY_AFTER = 300
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+_pending = set()
+_retry_at = {}
+
+
+def content_digest(field_file):
+    """
+    sha256 of a stored file; free for content-addressed names, streamed once for legacy ones.
+
+    New uploads are content-addressed, so a legacy name never gets other
+    bytes and its digest is cached without expiry.
+    """
+    digest = digest_from_name(field_file.name)
+    if digest:
+        return digest
+    cache, key = get_cache(), f'digest:{field_file.name}'
+    digest = cache.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with field_file.storage.open(field_file.name, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        cache.set(key, digest, timeout=None)
+    return digest
+
+
+def preview_name(digest, page=None):
+    """Storage name of the thumbnail (``page=None``) or of a page preview."""
+    filename = THUMBNAIL if page is None else f'page-{page}.jpg'
+    return f'previews/{digest[:2]}/{digest}/{filename}'
+
+
+def previews_ready(digest):
+    # The thumbnail is written last, so its presence means every page is in place.
+    return default_storage.exists(preview_name(digest))
+
+
+def _write_jpeg(image, path, quality):
+    tmp_path = f'{path}.tmp'
+    image.convert('RGB').save(tmp_path, 'JPEG', quality=quality, optimize=True)
+    os.replace(tmp_path, path)
+
+
+def render_previews(pdf_path, out_dir, pages, dpi, thumb_width, quality=70):
+    """
+    Render the first ``pages`` pages of ``pdf_path`` into ``out_dir``.
+
+    Runs inside a pool process, so it only takes plain arguments and never
+    touches Django settings or the database.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=1, last_page=pages)
+    for number, image in enumerate(images, start=1):
+        _write_jpeg(image, os.path.join(out_dir, f'page-{number}.jpg'), quality)
+    if images:
+        thumb = images[0].copy()
+        thumb.thumbnail((thumb_width, thumb_width * 2))
+        _write_jpeg(thumb, os.path.join(out_dir, THUMBNAIL), quality)
+    return len(images)
+
+
+def extract_text(pdf_path, pages, max_chars):
+    """
+    Plain text of the first ``pages`` pages via poppler's ``pdftotext``, cut at ``max_chars``.
+
+    Pool-safe like ``render_previews``.
+    """
+    result = subprocess.run(['pdftotext', '-l', str(pages), '-enc', 'UTF-8', '-q', pdf_path, '-'],
+                            capture_output=True, timeout=120, check=True)
+    return ' '.join(result.stdout.decode('utf-8', 'replace').split())[:max_chars]
+
+
+def render_args(material, digest):
+    out_dir = os.path.dirname(default_storage.path(preview_name(digest)))
+    return (material.file.path, out_dir, settings.MATERIAL_PREVIEW_PAGES,
+            settings.MATERIAL_PREVIEW_DPI, settings.MATERIAL_PREVIEW_THUMB_WIDTH)
+
+
+def get_pool():
+    """Process pool shared by the web process, created lazily so it never lives in a pre-fork master."""
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.MATERIAL_PREVIEW_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _slots = threading.BoundedSemaphore(settings.MATERIAL_PREVIEW_QUEUE_SIZE)
+        return _pool
+
+
+def queued(key):
+    """Whether a job for ``key`` is queued or running, or failed less than ``RETRY_AFTER`` seconds ago."""
+    return key in _pending or _retry_at.get(key, 0) > time.monotonic()
+
+
+def submit(key, func, *args, on_result=None):
+    """
+    Run ``func(*args)`` in the pool without blocking the caller.
+
+    Returns ``False`` when a job with the same ``key`` is already ``queued`` or
+    the queue is full. ``on_result`` runs on the pool's callback thread.
+    """
+    if queued(key):
+        return False
+    pool = get_pool()
+    if not _slots.acquire(blocking=False):
+        logger.info("Background queue full, skipping %s", key)
+        return False
+    _pending.add(key)
+
+    def done(future):
+        _pending.discard(key)
+        _slots.release()
+        if future.exception() is not None:
+            logger.warning("Background job %s failed: %s", key, future.exception())
+            _retry_at[key] = time.monotonic() + RETRY_AFTER
+        elif on_result is not None:
+            on_result(future.result())
+
+    pool.submit(func, *args).add_done_callback(done)
+    return True
+
+
+def schedule_previews(material, digest=None):
+    """
+    Queue preview rendering for ``material`` without blocking the caller.
+
+    Returns ``False`` when previews are disabled, already rendered or queued, or
+    when the queue is full; the ``render_previews`` command catches up later.
+    Pass ``digest`` when it is already known.
+    """
+    if not settings.MATERIAL_PREVIEW_WORKERS or not material.file:
+        return False
+    try:
+        digest = digest or content_digest(material.file)
+    except OSError:
+        logger.warning("Cannot read %s for material %s", material.file.name, material.pk)
+        return False
+    key = ('previews', digest)
+    if queued(key) or previews_ready(digest):
+        return False
+    return submit(key, render_previews, *render_args(material, digest))
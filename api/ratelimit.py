@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBuckets:
+    """
+    Thread-safe, size-bounded token buckets kept in process memory.
+
+    A bucket holds up to ``burst`` tokens and refills ``burst`` tokens per
+    ``period`` seconds; the least recently used buckets are dropped first.
+    """
+
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, period):
+        """Take a token; returns 0 on success, else the seconds until one is available."""
+        now = time.monotonic()
+        rate = burst / period
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+buckets = TokenBuckets()
+
+
+def shared_take(key, burst, period):
+    """
+    Count a hit in the shared cache's fixed window for ``key``.
+
+    With a cache shared by the workers (``CACHE_BACKEND`` file or db) this
+    keeps the limit from multiplying with the number of worker processes; the
+    default locmem cache is per process, so there each worker counts alone. If
+    the cache is down the local bucket alone applies.
+    """
+    window = int(time.time() // period)
+    cache_key = f'ratelimit:{key}:{window}'
+    try:
+        cache = get_cache()
+        cache.add(cache_key, 0, period)
+        count = cache.incr(cache_key)
+    except Exception as exc:
+        logger.warning("Rate limit cache unavailable: %s", exc)
+        return 0
+    return 0 if count <= burst else period - time.time() % period
+
+
+def take(key, burst, period):
+    """0 if ``key`` may go ahead, else the seconds to wait. Floods are turned away without any I/O."""
+    return buckets.take(key, burst, period) or shared_take(key, burst, period)
+
+
+class ScopedThrottle(BaseThrottle):
+    """
+    Limits a view per client IP and per email address in the request body.
+
+    The client IP is DRF's ``get_ident``: ``REMOTE_ADDR``, or the address the
+    last of ``NUM_PROXIES`` trusted proxies put in ``X-Forwarded-For``.
+    """
+    # Prefix of the bucket keys and of the <SCOPE>_IP_BURST, <SCOPE>_EMAIL_BURST and <SCOPE>_RATE_PERIOD settings.
+    scope = None
+
+    def allow_request(self, request, view):
+        prefix = self.scope.upper()
+        limits = [(f'{self.scope}-ip:{self.get_ident(request)}', getattr(settings, f'{prefix}_IP_BURST'))]
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if email:
+            limits.append((f'{self.scope}-email:{str(email).lower()}', getattr(settings, f'{prefix}_EMAIL_BURST')))
+        period = getattr(settings, f'{prefix}_RATE_PERIOD')
+        self.wait_seconds = max(take(key, burst, period) for key, burst in limits)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class OTPThrottle(ScopedThrottle):
+    """Limits OTP issuing and checking."""
+    scope = 'otp'
+
+
+class LoginThrottle(ScopedThrottle):
+    """Limits password logins per client IP and per account; runs before the password is hashed."""
+    scope = 'login'
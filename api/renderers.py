@@ -0,0 +1,36 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # optional; JSONRenderer's own output is identical, only slower
+    orjson = None
+
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` encoding with orjson when it is installed.
+
+    Produces the same bytes as the stock renderer under DRF's default
+    ``COMPACT_JSON`` and ``UNICODE_JSON``: compact separators, UTF-8 rather than
+    ``\\u`` escapes except for U+2028 and U+2029, and DRF's encoder for
+    datetimes, decimals and the other types orjson would format differently.
+    Other settings, indented output (``; indent=`` in the Accept header or the
+    browsable API) and anything orjson refuses go through the stock renderer.
+    """
+    default = staticmethod(encoders.JSONEncoder().default)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=ORJSON_OPTIONS)
+        except (orjson.JSONEncodeError, ValueError):
+            # Integers past 64 bits and other values orjson refuses: let the stock renderer decide.
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
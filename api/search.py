@@ -0,0 +1,144 @@
+import logging
+import re
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils.html import escape
+
+from .models import MaterialText, StudyMaterial
+from .previews import content_digest, extract_text, submit
+
+logger = logging.getLogger(__name__)
+
+# Control characters mark the hits in snippets until the text around them is HTML-escaped.
+MARK_START, MARK_END = '\x02', '\x03'
+TERM_RE = re.compile(r'\w+')
+
+SQLITE_SEARCH = """
+    SELECT m.id, bm25(api_materialtext_fts, 10.0, 1.0) AS rank, snippet(api_materialtext_fts, -1, %s, %s, '…', 16)
+    FROM api_materialtext_fts JOIN api_studymaterial m ON m.id = api_materialtext_fts.rowid
+    WHERE api_materialtext_fts MATCH %s {filters}
+    ORDER BY rank, m.id LIMIT %s OFFSET %s
+"""
+# Title hits weigh more through the setweight() in the generated column (migration 0010).
+POSTGRES_SEARCH = """
+    SELECT m.id, -ts_rank_cd(d.search, q) AS rank,
+           ts_headline('english', d.title || '. ' || d.content, q,
+                       'StartSel=' || %s || ', StopSel=' || %s || ', MaxFragments=2, MaxWords=16, MinWords=6')
+    FROM api_materialtext d JOIN api_studymaterial m ON m.id = d.material_id, plainto_tsquery('english', %s) q
+    WHERE d.search @@ q {filters}
+    ORDER BY rank, m.id LIMIT %s OFFSET %s
+"""
+
+
+def index_title(material):
+    """Make the material searchable by title; the stored text survives a title change."""
+    MaterialText.objects.bulk_create([MaterialText(material_id=material.pk, title=material.title)],
+                                     update_conflicts=True, unique_fields=['material'], update_fields=['title'])
+
+
+def store_text(material_id, file_name, digest, content):
+    # Conditional on the file, so text extracted from a file that has since been replaced is dropped.
+    MaterialText.objects.filter(material_id=material_id, material__file=file_name).update(content=content, digest=digest)
+
+
+def text_args(material):
+    return material.file.path, settings.MATERIAL_SEARCH_PAGES, settings.MATERIAL_SEARCH_MAX_CHARS
+
+
+def schedule_text(material):
+    """
+    Queue text extraction for ``material`` in the preview pool without blocking.
+
+    Skipped when background work is disabled, the file is unreadable or its
+    text is already stored; the ``index_materials`` command catches up later.
+    """
+    if not settings.MATERIAL_PREVIEW_WORKERS or not material.file:
+        return False
+    try:
+        digest = content_digest(material.file)
+    except OSError:
+        logger.warning("Cannot read %s for material %s", material.file.name, material.pk)
+        return False
+    if MaterialText.objects.filter(material_id=material.pk, digest=digest).exists():
+        return False
+
+    def save(content):
+        # Runs on the pool's callback thread, which gets its own connection; close it when done.
+        try:
+            store_text(material.pk, material.file.name, digest, content)
+        finally:
+            connections.close_all()
+
+    return submit(('text', digest), extract_text, *text_args(material), on_result=save)
+
+
+def index_material_text(material, force=False):
+    """Extract and store the text of ``material`` in this process; returns whether anything was stored."""
+    digest = content_digest(material.file)
+    if not force and MaterialText.objects.filter(material_id=material.pk, digest=digest).exists():
+        return False
+    index_title(material)
+    store_text(material.pk, material.file.name, digest, extract_text(*text_args(material)))
+    return True
+
+
+def match_query(text):
+    """The words of ``text`` as an FTS5 query: every word must match, the last one as a prefix."""
+    terms = TERM_RE.findall(text)
+    if not terms:
+        return ''
+    return ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+
+
+def format_snippet(snippet):
+    return escape(snippet or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def title_search(text, branch_id=None, preview_only=False, classification=None, limit=20, offset=0):
+    """Unranked hits whose title contains every word of ``text``, for databases migration 0010 gave no index."""
+    terms = TERM_RE.findall(text)
+    if not terms:
+        return []
+    queryset = StudyMaterial.objects.all()
+    for term in terms:
+        queryset = queryset.filter(title__icontains=term)
+    if branch_id is not None:
+        queryset = queryset.filter(branch_id=branch_id)
+    if preview_only:
+        queryset = queryset.filter(is_preview=True)
+    if classification:
+        queryset = queryset.filter(classification=classification)
+    rows = queryset.order_by('id').values_list('pk', 'title')[offset:offset + limit]
+    return [(pk, 0.0, escape(title)) for pk, title in rows]
+
+
+def search_materials(text, branch_id=None, preview_only=False, classification=None, limit=20, offset=0):
+    """
+    ``(material_id, rank, snippet)`` hits for ``text``, best first (lowest rank).
+
+    ``branch_id=None`` searches every branch (for staff). Snippets are
+    HTML-escaped with hits wrapped in ``<mark>``. Other databases than SQLite
+    and PostgreSQL fall back to ``title_search``.
+    """
+    if connection.vendor == 'sqlite':
+        sql, query = SQLITE_SEARCH, match_query(text)
+    elif connection.vendor == 'postgresql':
+        sql, query = POSTGRES_SEARCH, text
+    else:
+        return title_search(text, branch_id, preview_only, classification, limit, offset)
+    if not query.strip():
+        return []
+
+    filters, params = [], [MARK_START, MARK_END, query]
+    if branch_id is not None:
+        filters.append('AND m.branch_id = %s')
+        params.append(branch_id)
+    if preview_only:
+        filters.append('AND m.is_preview')
+    if classification:
+        filters.append('AND m.classification = %s')
+        params.append(classification)
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(filters=' '.join(filters)), params + [limit, offset])
+        return [(pk, rank, format_snippet(snippet)) for pk, rank, snippet in cursor.fetchall()]
@@ -1,21 +1,35 @@
 # api/serializers.py
+import logging
+import os
+
+from django.conf import settings
 from rest_framework import serializers
-from .models import User, Branch, StudyMaterial, CourseRequest, Session
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .models import User, Branch, StudyMaterial, CourseRequest, UploadSession
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework.exceptions import AuthenticationFailed # Add this import
+from .accounts import register_student
+from .authentication import (CLAIMS_VERSION_CLAIM, IDENTITY_CLAIMS, SESSION_CLAIM, entitlement_claims, identity_claims,
+                             session_state, start_session)
+from .storage import DIGEST_RE
+from .uploads import PDF_MAGIC
+
+logger = logging.getLogger(__name__)
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
-        token['username'] = user.username
-        token['is_staff'] = user.is_staff
-        token['role'] = user.role
+        token.payload.update({claim: getattr(user, claim) for claim in IDENTITY_CLAIMS})
+        token.payload.update(entitlement_claims(user.pk))
+        # The refresh token's jti names the login session; access tokens minted from it inherit the claim.
+        token[SESSION_CLAIM] = token['jti']
+        token[CLAIMS_VERSION_CLAIM] = 0
         return token
 
     def validate(self, attrs):
         # This will authenticate the user, or raise an exception
-        data = super().validate(attrs)
+        data = super(TokenObtainPairSerializer, self).validate(attrs)
 
         # `self.user` is the user object that was successfully authenticated
         user = self.user
@@ -28,12 +42,33 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
             )
 
         # If the user is active, proceed with the single-session logic
-        Session.objects.filter(user=user).delete()
-        session_key = data.get('access')
-        if session_key:
-            Session.objects.create(user=user, session_key=str(session_key))
-            print(f"--- New session created for {user.email} ---")
+        refresh = self.get_token(user)
+        start_session(user, refresh[SESSION_CLAIM])
+        data['refresh'] = str(refresh)
+        data['access'] = str(refresh.access_token)
+        logger.info("New session created for user %s", user.pk)
+
+        return data
 
+
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.get(api_settings.USER_ID_CLAIM)
+        # Refreshing is rare, so always check the database rather than the per-process cache.
+        state = session_state(user_id, refresh=True)
+        if state is None or state[0] != refresh.get(SESSION_CLAIM):
+            raise AuthenticationFailed('This session has ended because of a newer login.', 'session_ended')
+        data = super().validate(attrs)
+        # Re-read the account and the entitlement so the new access token carries current claims.
+        identity = identity_claims(user_id)
+        if identity is None:
+            raise AuthenticationFailed('Account is inactive.', 'no_active_account')
+        access = refresh.access_token
+        access.payload.update(identity)
+        access.payload.update(entitlement_claims(user_id))
+        access[CLAIMS_VERSION_CLAIM] = state[1]
+        data['access'] = str(access)
         return data
 
 
@@ -46,16 +81,50 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
-        validated_data.pop('branch', None)
-        user = User.objects.create_user(**validated_data)
-        user.is_active = False 
-        user.save()
-        return user
+        return register_student(**validated_data)
 
 class BranchSerializer(serializers.ModelSerializer):
     class Meta: model = Branch; fields = '__all__'
 class StudyMaterialSerializer(serializers.ModelSerializer):
-    class Meta: model = StudyMaterial; fields = '__all__'
+    class Meta: model = StudyMaterial; exclude = ('change_version',)
+
+    def validate_file(self, value):
+        if value.size > settings.MATERIAL_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files are limited to {settings.MATERIAL_UPLOAD_MAX_SIZE} bytes.")
+        head = value.read(len(PDF_MAGIC))
+        value.seek(0)
+        if head != PDF_MAGIC:
+            raise serializers.ValidationError("Only PDF files can be uploaded.")
+        return value
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_max = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'title', 'classification', 'branch', 'is_preview', 'filename', 'size', 'sha256', 'offset',
+                  'chunk_max', 'created_at', 'updated_at')
+        read_only_fields = ('offset',)
+
+    def get_chunk_max(self, obj):
+        return settings.MATERIAL_UPLOAD_CHUNK_MAX
+
+    def validate_filename(self, value):
+        value = os.path.basename(value)
+        if os.path.splitext(value)[1].lower() != '.pdf':
+            raise serializers.ValidationError("Only PDF files can be uploaded.")
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.MATERIAL_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files are 1 to {settings.MATERIAL_UPLOAD_MAX_SIZE} bytes long.")
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if not DIGEST_RE.match(value):
+            raise serializers.ValidationError("Expected the hex sha256 of the whole file.")
+        return value
 class CourseRequestSerializer(serializers.ModelSerializer):
     student = UserSerializer(read_only=True)
     branch = BranchSerializer(read_only=True)
@@ -73,7 +142,7 @@ class ChangePasswordSerializer(serializers.Serializer):
 
     def update(self, instance, validated_data):
         instance.set_password(validated_data['new_password'])
-        instance.save()
+        instance.save(update_fields=['password'])
         return instance
 
 class ResetPasswordSerializer(serializers.Serializer):
@@ -83,4 +152,34 @@ class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('username', 'email', 'college', 'phone_number')
-        read_only_fields = ('email',)
\ No newline at end of file
+        read_only_fields = ('email',)
+class BulkSelectionSerializer(serializers.Serializer):
+    """Either an explicit ``ids`` list or a ``filter``, never both."""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError("Give either 'ids' or 'filter'.")
+        if 'filter' in attrs and not self.initial_data.get('filter'):
+            raise serializers.ValidationError({'filter': "Give at least one condition."})
+        if len(attrs.get('ids', ())) > settings.BULK_UPDATE_LIMIT:
+            raise serializers.ValidationError({'ids': f"At most {settings.BULK_UPDATE_LIMIT} ids per request."})
+        if 'ids' in attrs:
+            attrs['ids'] = list(dict.fromkeys(attrs['ids']))
+        return attrs
+
+class CourseRequestFilterSerializer(serializers.Serializer):
+    branch = serializers.IntegerField(required=False)
+    # Decisions apply to pending requests unless another status is asked for.
+    status = serializers.ChoiceField(choices=CourseRequest.STATUS_CHOICES, default='Pending')
+
+class BulkCourseRequestSerializer(BulkSelectionSerializer):
+    status = serializers.ChoiceField(choices=['Approved', 'Rejected'])
+    filter = CourseRequestFilterSerializer(required=False)
+
+class StudentFilterSerializer(serializers.Serializer):
+    branch = serializers.IntegerField(required=False)
+
+class BulkStudentSerializer(BulkSelectionSerializer):
+    action = serializers.ChoiceField(choices=['activate', 'deactivate'])
+    filter = StudentFilterSerializer(required=False)
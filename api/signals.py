@@ -0,0 +1,178 @@
+from collections import Counter
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .authentication import IDENTITY_CLAIMS, end_sessions, invalidate_claims
+from .cache import bump_version, forget_entitlement
+from .models import Branch, CourseRequest, MaterialTombstone, StatCounter, StudyMaterial, User, next_change_version
+from .previews import schedule_previews
+from .search import index_title, schedule_text
+from .stats import ALL_BRANCHES, bump, count_students
+
+
+@receiver(post_save, sender=StudyMaterial)
+def queue_material_previews(sender, instance, **kwargs):
+    transaction.on_commit(partial(schedule_previews, instance))
+
+
+@receiver(post_save, sender=StudyMaterial)
+def index_material(sender, instance, **kwargs):
+    # The title is searchable as part of the save; the PDF text follows from the pool.
+    # Deleting a material cascades to its MaterialText row, which drops it from the index.
+    index_title(instance)
+    transaction.on_commit(partial(schedule_text, instance))
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_branches(sender, instance, **kwargs):
+    # Cache invalidations wait for the commit; a read in between would cache the old rows under the new version.
+    transaction.on_commit(partial(bump_version, 'branches'))
+
+
+@receiver(post_init, sender=StudyMaterial)
+def remember_material_branch(sender, instance, **kwargs):
+    # Read through __dict__ so a deferred branch_id is not loaded for every instance.
+    instance._cached_branch_id = instance.__dict__.get('branch_id')
+
+
+# Connected before invalidate_material_lists, which moves _cached_branch_id on to the new branch.
+@receiver(post_save, sender=StudyMaterial)
+def record_material_move(sender, instance, created, **kwargs):
+    old_branch_id = getattr(instance, '_cached_branch_id', None)
+    if not created and old_branch_id not in (None, instance.branch_id):
+        MaterialTombstone.objects.create(material_id=instance.pk, branch_id=old_branch_id,
+                                         change_version=instance.change_version)
+
+
+@receiver(post_delete, sender=StudyMaterial)
+def record_material_deletion(sender, instance, **kwargs):
+    # Deletions run in the collector's transaction, which keeps the version sequence locked until commit.
+    MaterialTombstone.objects.create(material_id=instance.pk, branch_id=instance.branch_id,
+                                     change_version=next_change_version())
+
+
+@receiver(post_save, sender=StudyMaterial)
+@receiver(post_delete, sender=StudyMaterial)
+def invalidate_material_lists(sender, instance, **kwargs):
+    # A material moved to another branch leaves the old branch's list stale too.
+    branch_ids = {instance.branch_id, getattr(instance, '_cached_branch_id', None)} - {None}
+    transaction.on_commit(partial(bump_version, *(f'materials:{branch_id}' for branch_id in branch_ids)))
+    instance._cached_branch_id = instance.branch_id
+
+
+@receiver(post_save, sender=CourseRequest)
+@receiver(post_delete, sender=CourseRequest)
+def invalidate_entitlement(sender, instance, **kwargs):
+    transaction.on_commit(partial(forget_entitlement, instance.student_id))
+    invalidate_claims(instance.student_id)
+
+
+@receiver(post_init, sender=User)
+def remember_identity(sender, instance, **kwargs):
+    instance._identity = tuple(instance.__dict__.get(name) for name in IDENTITY_CLAIMS)
+    instance._was_active = instance.__dict__.get('is_active')
+
+
+@receiver(post_save, sender=User)
+def invalidate_identity_claims(sender, instance, created, **kwargs):
+    # Tokens copy these fields; a renamed or demoted user's tokens must not vouch for the old values.
+    identity = tuple(instance.__dict__.get(name) for name in IDENTITY_CLAIMS)
+    if not created and identity != instance._identity:
+        invalidate_claims(instance.pk)
+    instance._identity = identity
+    # Token users are never loaded from the row, so a deactivated account is only locked out by its sessions.
+    if not created and instance._was_active and not instance.is_active:
+        end_sessions(instance.pk)
+    instance._was_active = instance.is_active
+
+
+# Admin statistics (api.stats). Each instance remembers what it was counted as when it was loaded, so that a
+# save can move it from one counter to another. Read through __dict__ so deferred fields are not loaded; an
+# instance loaded without them is not recounted on save, and reconcile_stats picks up the difference.
+COUNTED_FIELDS = {StudyMaterial: ('branch_id', 'classification'), CourseRequest: ('branch_id', 'status'),
+                  User: ('role', 'is_active')}
+
+
+@receiver(post_init, sender=StudyMaterial)
+@receiver(post_init, sender=CourseRequest)
+@receiver(post_init, sender=User)
+def remember_counted_state(sender, instance, **kwargs):
+    instance._counted = tuple(instance.__dict__.get(name) for name in COUNTED_FIELDS[sender])
+
+
+def is_active_student(course_request):
+    if CourseRequest.student.is_cached(course_request):
+        return course_request.student.role == 'student' and course_request.student.is_active
+    return User.objects.filter(pk=course_request.student_id, role='student', is_active=True).exists()
+
+
+@receiver(post_save, sender=StudyMaterial)
+def count_material(sender, instance, created, **kwargs):
+    old, new = instance._counted, (instance.branch_id, instance.classification)
+    if not created and (None in old or old == new):
+        return
+    deltas = Counter({('materials', *new): 1})
+    if not created:
+        deltas['materials', *old] -= 1
+    bump(deltas)
+    instance._counted = new
+
+
+@receiver(post_delete, sender=StudyMaterial)
+def uncount_material(sender, instance, **kwargs):
+    bump({('materials', instance.branch_id, instance.classification): -1})
+
+
+@receiver(post_save, sender=CourseRequest)
+def count_course_request(sender, instance, created, **kwargs):
+    old, new = instance._counted, (instance.branch_id, instance.status)
+    if not created and (None in old or old == new):
+        return
+    deltas = Counter({('requests', *new): 1})
+    if not created:
+        deltas['requests', *old] -= 1
+    if (created or old[0] != new[0]) and is_active_student(instance):
+        deltas['students', new[0], ''] += 1
+        if not created:
+            deltas['students', old[0], ''] -= 1
+    bump(deltas)
+    instance._counted = new
+
+
+@receiver(post_delete, sender=CourseRequest)
+def uncount_course_request(sender, instance, **kwargs):
+    deltas = Counter({('requests', instance.branch_id, instance.status): -1})
+    if is_active_student(instance):
+        deltas['students', instance.branch_id, ''] -= 1
+    bump(deltas)
+
+
+@receiver(post_save, sender=User)
+def count_student(sender, instance, created, **kwargs):
+    old = ('student', False) if created else instance._counted
+    if None in old:
+        return
+    was, now = old == ('student', True), (instance.role, instance.is_active) == ('student', True)
+    if was != now:
+        # A new account has no course requests yet; only the total changes.
+        if created:
+            bump({('students', ALL_BRANCHES, ''): 1})
+        else:
+            count_students([instance.pk], 1 if now else -1)
+    instance._counted = (instance.role, instance.is_active)
+
+
+@receiver(post_delete, sender=User)
+def uncount_student(sender, instance, **kwargs):
+    # Its course requests were deleted first and took the per-branch counts with them.
+    if (instance.role, instance.is_active) == ('student', True):
+        bump({('students', ALL_BRANCHES, ''): -1})
+
+
+@receiver(post_delete, sender=Branch)
+def drop_branch_counters(sender, instance, **kwargs):
+    StatCounter.objects.filter(branch_id=instance.pk).delete()
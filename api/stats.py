@@ -0,0 +1,89 @@
+"""
+Admin statistics kept in ``StatCounter`` rows and updated with every write.
+
+Single saves and deletes are counted by the receivers in ``api.signals``.
+Bulk paths that bypass them (``api.bulk``, ``api.imports``, account
+verification) call ``bump`` or ``count_students`` in the same transaction.
+Every change is one ``INSERT ... ON CONFLICT DO UPDATE SET value = value +
+delta`` statement, so concurrent writers never lose an increment, and the
+stats endpoint reads O(branches) rows. ``manage.py reconcile_stats``
+recomputes everything from the tables.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import CourseRequest, StatCounter, StudyMaterial, User
+
+ALL_BRANCHES = 0
+
+
+def bump(deltas):
+    """Add ``{(metric, branch_id, bucket): delta}`` to the counters, creating missing ones, in one statement."""
+    rows = sorted((metric, branch_id or ALL_BRANCHES, bucket, delta)
+                  for (metric, branch_id, bucket), delta in deltas.items() if delta)
+    if not rows:
+        return
+    # Sorted, so concurrent writers lock the rows in the same order.
+    table = connection.ops.quote_name(StatCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (metric, branch_id, bucket, value) VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT (metric, branch_id, bucket) DO UPDATE SET value = {table}.value + excluded.value",
+            rows,
+        )
+
+
+def count_students(user_ids, delta):
+    """Count students just activated (``delta=1``) or deactivated (``-1``), in total and in their branches."""
+    if not user_ids:
+        return
+    deltas = Counter({('students', ALL_BRANCHES, ''): delta * len(user_ids)})
+    branches = (CourseRequest.objects.filter(student_id__in=user_ids).values_list('branch_id')
+                .annotate(students=Count('student_id', distinct=True)).order_by())
+    for branch_id, students in branches:
+        deltas['students', branch_id, ''] += delta * students
+    bump(deltas)
+
+
+def expected():
+    """Every counter computed from the tables."""
+    counts = Counter()
+    for branch_id, status, total in (CourseRequest.objects.values_list('branch_id', 'status')
+                                     .annotate(total=Count('id')).order_by()):
+        counts['requests', branch_id, status] = total
+    for branch_id, total in (CourseRequest.objects.filter(student__role='student', student__is_active=True)
+                             .values_list('branch_id').annotate(total=Count('student_id', distinct=True)).order_by()):
+        counts['students', branch_id, ''] = total
+    counts['students', ALL_BRANCHES, ''] = User.objects.filter(role='student', is_active=True).count()
+    for branch_id, classification, total in (StudyMaterial.objects.values_list('branch_id', 'classification')
+                                             .annotate(total=Count('id')).order_by()):
+        counts['materials', branch_id, classification] = total
+    return counts
+
+
+def current():
+    return Counter({(metric, branch_id, bucket): value for metric, branch_id, bucket, value
+                    in StatCounter.objects.values_list('metric', 'branch_id', 'bucket', 'value')})
+
+
+def rebuild(dry_run=False):
+    """
+    Recompute every counter and return ``{key: (stored, actual)}`` for those that were off.
+
+    On PostgreSQL the counters table is locked for the duration, so writers
+    bumping a counter meanwhile wait instead of having their increment
+    overwritten.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql' and not dry_run:
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {connection.ops.quote_name(StatCounter._meta.db_table)} IN EXCLUSIVE MODE')
+        stored, actual = current(), expected()
+        drift = {key: (stored[key], actual[key]) for key in stored.keys() | actual.keys() if stored[key] != actual[key]}
+        if drift and not dry_run:
+            StatCounter.objects.all().delete()
+            StatCounter.objects.bulk_create(StatCounter(metric=metric, branch_id=branch_id, bucket=bucket, value=value)
+                                            for (metric, branch_id, bucket), value in actual.items() if value)
+    return drift
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def digest_from_name(name):
+    """Return the sha256 a content-addressed name was stored under, or ``None`` for legacy names."""
+    digest = os.path.splitext(os.path.basename(name or ''))[0]
+    return digest if DIGEST_RE.match(digest) else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps one copy of every distinct file.
+
+    Uploads are streamed through sha256 into a temporary file and then moved to
+    ``<prefix>/<aa>/<digest><ext>``. Re-uploading identical bytes returns the
+    existing name instead of writing a suffixed duplicate, so several rows can
+    point at the same blob. Nothing here deletes blobs on its own; unreferenced
+    ones are removed by the ``gc_materials`` command.
+    """
+
+    def __init__(self, prefix='materials', **kwargs):
+        self.prefix = prefix
+        super().__init__(**kwargs)
+
+    def blob_name(self, digest, ext):
+        return f'{self.prefix}/{digest[:2]}/{digest}{ext.lower()}'
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content has been hashed in _save.
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1]
+        directory = self.path(self.prefix)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            return self.adopt(tmp_path, digest.hexdigest(), ext)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def adopt(self, path, digest, ext):
+        """
+        Move the file at ``path``, whose sha256 the caller computed, into place and return its name.
+
+        ``path`` has to be on the same file system; the file is renamed, not
+        copied, and removed instead when the blob already exists. An existing
+        blob is touched, so ``gc_materials`` leaves it alone for its grace
+        period even if it listed the blob as unreferenced a moment ago.
+        """
+        name = self.blob_name(digest, ext)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.utime(full_path)
+            os.unlink(path)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.chmod(path, self.file_permissions_mode or 0o644)
+            os.replace(path, full_path)
+        return name
+
+    def iter_blobs(self):
+        """Yield ``(name, full_path)`` for every stored blob and leftover temp file."""
+        root = self.path(self.prefix)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                name = os.path.relpath(full_path, self.location).replace(os.sep, '/')
+                yield name, full_path
+
+
+def material_storage():
+    return ContentAddressedStorage()
@@ -0,0 +1,52 @@
+import os
+import threading
+
+from django.conf import settings
+
+from .models import Sequence
+
+STUDENT_ID_SEQUENCE = 'student_id'
+
+
+def reserve(name, count):
+    """Reserve ``count`` consecutive values of the named sequence in one short transaction."""
+    return Sequence.reserve(name, count)
+
+
+class BlockAllocator:
+    """
+    Hands out values of a sequence from a block reserved per process.
+
+    Only every ``block_size``-th call touches the database. Values of a block
+    still unused when the process exits are skipped, so allocated values are
+    unique and increasing per process but not gapless.
+    """
+
+    def __init__(self, name, block_size):
+        self.name, self.block_size = name, block_size
+        self._lock = threading.Lock()
+        self._block = iter(())
+        self._pid = None
+
+    def next(self):
+        with self._lock:
+            # A block reserved before a fork would be handed out by every child.
+            if self._pid != os.getpid():
+                self._block, self._pid = iter(()), os.getpid()
+            value = next(self._block, None)
+            if value is None:
+                self._block = iter(reserve(self.name, self.block_size))
+                value = next(self._block)
+            return value
+
+
+student_ids = BlockAllocator(STUDENT_ID_SEQUENCE, settings.STUDENT_ID_BLOCK_SIZE)
+
+
+def next_student_id():
+    return settings.STUDENT_ID_FORMAT.format(student_ids.next())
+
+
+def allocate_student_ids(count):
+    """``count`` student ids straight from the sequence, for bulk imports that would drain a block at once."""
+    return [settings.STUDENT_ID_FORMAT.format(value) for value in reserve(STUDENT_ID_SEQUENCE, count)]
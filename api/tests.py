@@ -1,3 +1,1724 @@
-from django.test import TestCase
+import csv
+import decimal
+import gc
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import hashers, metrics, previews, ratelimit
+from .async_views import AsyncBranchListView, AsyncMaterialFileView, AsyncStudentDashboardView, AsyncStudyMaterialView
+from .authentication import session_cache
+from .cache import forget_entitlement, get_entitlement
+from .fast_serializers import BranchValues, CourseRequestValues, StudentValues, StudyMaterialValues
+from .mail import drain_outbox, enqueue_mail
+from .models import (User, Branch, StudyMaterial, CourseRequest, Session, OutboundEmail, Sequence, OTPChallenge,
+                     StatCounter, UploadSession)
+from .imports import import_students
+from .previews import content_digest, preview_name, previews_ready, render_previews
+from .ratelimit import TokenBuckets
+from .renderers import ORJSONRenderer
+from .search import store_text
+from .serializers import BranchSerializer, CourseRequestSerializer, StudyMaterialSerializer, UserSerializer
+from .storage import digest_from_name
+from .student_ids import BlockAllocator, allocate_student_ids
+from .uploads import part_path
+
+PDF_BYTES = b'%PDF-1.4\n' + bytes(range(256)) * 40 + b'\n%%EOF\n'
+
+
+class APITestCase(TestCase):
+    """Starts every test with an empty cache; row ids are reused across rolled-back tests."""
+
+    def setUp(self):
+        cache.clear()
+        session_cache.clear()
+        ratelimit.buckets.clear()
+
+
+class MediaTestCase(APITestCase):
+    """Points MEDIA_ROOT at a throwaway directory for the duration of the class."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+def make_student(email, branch=None, status=None, **extra):
+    extra.setdefault('username', email.split('@')[0])
+    user = User.objects.create_user(email=email, password='pass12345', **extra)
+    if branch is not None and status is not None:
+        CourseRequest.objects.create(student=user, branch=branch, status=status)
+    return user
+
+
+def make_material(branch, title='Notes', is_preview=False, content=PDF_BYTES):
+    return StudyMaterial.objects.create(
+        title=title, branch=branch, classification='Notes', is_preview=is_preview,
+        file=SimpleUploadedFile(f'{title}.pdf', content, content_type='application/pdf'),
+    )
+
+
+@override_settings(MATERIAL_SENDFILE_MODE='')
+class MaterialFileViewTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        self.material = make_material(self.branch)
+        self.preview = make_material(self.branch, title='Preview', is_preview=True)
+        self.client = APIClient()
+        self.client.force_authenticate(make_student('a@example.com', self.branch, 'Approved'))
+        self.url = reverse('material-file', args=[self.material.pk])
+
+    def test_full_download_advertises_ranges_and_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), PDF_BYTES)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+    def test_byte_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), PDF_BYTES[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(PDF_BYTES)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-7')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), PDF_BYTES[-7:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(PDF_BYTES)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(PDF_BYTES)}')
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_unapproved_student_only_gets_previews(self):
+        client = APIClient()
+        client.force_authenticate(make_student('b@example.com', self.branch, 'Pending'))
+        self.assertEqual(client.get(self.url).status_code, 404)
+        self.assertEqual(client.get(reverse('material-file', args=[self.preview.pk])).status_code, 200)
+
+    def test_anonymous_rejected(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    @override_settings(MATERIAL_SENDFILE_MODE='x-accel-redirect', MATERIAL_SENDFILE_PREFIX='/protected-media/')
+    def test_accel_redirect_mode(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.material.file.name)
+        self.assertEqual(response.content, b'')
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+
+    def blob_count(self):
+        return sum(len(files) for _, _, files in os.walk(os.path.join(self.media_root, 'materials')))
+
+    def test_identical_uploads_share_one_blob(self):
+        first = make_material(self.branch, title='one')
+        second = make_material(self.branch, title='two')
+        other = make_material(self.branch, title='three', content=PDF_BYTES + b'x')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertNotEqual(first.file.name, other.file.name)
+        self.assertIsNotNone(digest_from_name(first.file.name))
+        self.assertEqual(self.blob_count(), 2)
+
+    def test_etag_is_content_digest(self):
+        material = make_material(self.branch)
+        client = APIClient()
+        client.force_authenticate(make_student('a@example.com', self.branch, 'Approved'))
+        response = client.get(reverse('material-file', args=[material.pk]))
+        self.assertEqual(response['ETag'], f'"{digest_from_name(material.file.name)}"')
+
+    def test_gc_keeps_referenced_blobs(self):
+        kept = make_material(self.branch, title='kept')
+        make_material(self.branch, title='kept-too')
+        doomed = make_material(self.branch, title='doomed', content=b'%PDF-other')
+        doomed.delete()
+        call_command('gc_materials', grace=0, stdout=StringIO())
+        self.assertTrue(kept.file.storage.exists(kept.file.name))
+        self.assertFalse(kept.file.storage.exists(doomed.file.name))
+        self.assertEqual(self.blob_count(), 1)
+
+    def test_reupload_refreshes_an_unreferenced_blob(self):
+        doomed = make_material(self.branch, title='doomed')
+        doomed.delete()
+        path = doomed.file.path
+        os.utime(path, (0, 0))
+        # Uploaded again while gc_materials may have listed the blob as unreferenced: its grace starts over.
+        make_material(self.branch, title='again')
+        self.assertGreater(os.stat(path).st_mtime, time.time() - 3600)
+
+    def test_dedup_backfill_repoints_legacy_files(self):
+        legacy_dir = os.path.join(self.media_root, 'materials')
+        os.makedirs(legacy_dir, exist_ok=True)
+        names = ['materials/lab.pdf', 'materials/lab_JYux3ev.pdf']
+        for name in names:
+            with open(os.path.join(self.media_root, name), 'wb') as handle:
+                handle.write(PDF_BYTES)
+        material = make_material(self.branch)
+        StudyMaterial.objects.filter(pk=material.pk).update(file=names[0])
+        StudyMaterial.objects.filter(pk=make_material(self.branch).pk).update(file=names[1])
+        versions = dict(StudyMaterial.objects.values_list('pk', 'change_version'))
+
+        call_command('dedup_materials', stdout=StringIO())
+
+        # The file URLs changed, so synced clients have to pick the rows up again.
+        for pk, version in StudyMaterial.objects.values_list('pk', 'change_version'):
+            self.assertGreater(version, versions[pk])
+
+        files = set(StudyMaterial.objects.values_list('file', flat=True))
+        self.assertEqual(len(files), 1)
+        self.assertIsNotNone(digest_from_name(files.pop()))
+        for name in names:
+            self.assertFalse(os.path.exists(os.path.join(self.media_root, name)))
+
+
+@override_settings(MATERIAL_PREVIEW_WORKERS=0, MATERIAL_SENDFILE_MODE='')
+class MaterialPreviewTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        self.material = make_material(self.branch)
+        self.digest = digest_from_name(self.material.file.name)
+        self.client = APIClient()
+        self.client.force_authenticate(make_student('a@example.com', self.branch, 'Pending'))
+
+    def test_render_writes_pages_then_thumbnail(self):
+        from PIL import Image
+        pages = [Image.new('RGB', (800, 1100), 'white') for _ in range(2)]
+        out_dir = os.path.dirname(default_storage.path(preview_name(self.digest)))
+        with mock.patch('api.previews.convert_from_path', return_value=pages) as convert:
+            self.assertEqual(render_previews(self.material.file.path, out_dir, 2, 50, 320), 2)
+        convert.assert_called_once_with(self.material.file.path, dpi=50, first_page=1, last_page=2)
+        self.assertTrue(previews_ready(self.digest))
+        self.assertTrue(default_storage.exists(preview_name(self.digest, 2)))
+        with Image.open(default_storage.path(preview_name(self.digest))) as thumb:
+            self.assertEqual(thumb.width, 320)
+
+    def test_unapproved_student_sees_page_previews(self):
+        default_storage.save(preview_name(self.digest, 1), ContentFile(b'jpeg'))
+        response = self.client.get(reverse('material-preview', args=[self.material.pk, 1]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['ETag'], f'"{self.digest}-p1"')
+        self.assertEqual(self.client.get(reverse('material-file', args=[self.material.pk])).status_code, 404)
+
+    def test_missing_preview_is_404(self):
+        response = self.client.get(reverse('material-thumbnail', args=[self.material.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_polling_a_missing_preview_queues_it_once(self):
+        key = ('previews', self.digest)
+        self.addCleanup(previews._pending.discard, key)
+        self.addCleanup(previews._retry_at.pop, key, None)
+        default_storage.delete(preview_name(self.digest))
+        url = reverse('material-thumbnail', args=[self.material.pk])
+        with override_settings(MATERIAL_PREVIEW_WORKERS=1), mock.patch('api.previews._slots'), \
+                mock.patch('api.previews.get_pool') as get_pool:
+            for _ in range(3):
+                self.assertEqual(self.client.get(url).status_code, 404)
+            get_pool.return_value.submit.assert_called_once()
+            # A failed render is not retried on the next polls either.
+            done = get_pool.return_value.submit.return_value.add_done_callback.call_args.args[0]
+            done(mock.Mock(exception=mock.Mock(return_value=RuntimeError('bad pdf'))))
+            self.assertEqual(self.client.get(url).status_code, 404)
+            get_pool.return_value.submit.assert_called_once()
+
+    def test_legacy_digest_is_hashed_once(self):
+        cache.clear()
+        self.material.file.name = 'materials/legacy.pdf'
+        default_storage.save(self.material.file.name, ContentFile(PDF_BYTES))
+        with mock.patch('api.previews.hashlib.sha256', wraps=hashlib.sha256) as sha256:
+            self.assertEqual(content_digest(self.material.file), self.digest)
+            self.assertEqual(content_digest(self.material.file), self.digest)
+        sha256.assert_called_once()
+
+    def test_other_branch_cannot_see_previews(self):
+        default_storage.save(preview_name(self.digest), ContentFile(b'jpeg'))
+        client = APIClient()
+        client.force_authenticate(make_student('b@example.com', Branch.objects.create(name='ECE'), 'Approved'))
+        self.assertEqual(client.get(reverse('material-thumbnail', args=[self.material.pk])).status_code, 404)
+
+
+class CatalogueCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        self.student = make_student('a@example.com', self.branch, 'Pending')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def test_branch_list_served_from_cache_with_etag(self):
+        url = reverse('branch-list')
+        first = self.client.get(url)
+        self.assertEqual(first.json(), [{'id': self.branch.pk, 'name': 'CSE'}])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json(), first.json())
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+
+    def test_branch_change_invalidates(self):
+        url = reverse('branch-list')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Branch.objects.create(name='ECE')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    @override_settings(MATERIAL_PREVIEW_WORKERS=0)
+    def test_material_list_variants_and_invalidation(self):
+        StudyMaterial.objects.create(title='full', branch=self.branch, classification='Notes', file='materials/a.pdf')
+        StudyMaterial.objects.create(title='preview', branch=self.branch, classification='Notes',
+                                     file='materials/b.pdf', is_preview=True)
+        url = reverse('materials-list')
+        preview = self.client.get(url)
+        self.assertEqual([row['title'] for row in preview.json()], ['preview'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=preview['ETag']).status_code, 304)
+
+        course_request = CourseRequest.objects.get(student=self.student)
+        course_request.status = 'Approved'
+        with self.captureOnCommitCallbacks(execute=True):
+            course_request.save()
+        full = self.client.get(url, HTTP_IF_NONE_MATCH=preview['ETag'])
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(len(full.json()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StudyMaterial.objects.create(title='new', branch=self.branch, classification='PYQ', file='materials/c.pdf')
+        self.assertEqual(len(self.client.get(url, HTTP_IF_NONE_MATCH=full['ETag']).json()), 3)
+
+    def test_invalidation_waits_for_the_commit(self):
+        StudyMaterial.objects.create(title='full', branch=self.branch, classification='Notes', file='materials/a.pdf')
+        StudyMaterial.objects.create(title='preview', branch=self.branch, classification='Notes',
+                                     file='materials/b.pdf', is_preview=True)
+        url = reverse('materials-list')
+        before = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            course_request = CourseRequest.objects.get(student=self.student)
+            course_request.status = 'Approved'
+            course_request.save()
+            # Other connections still see the request as pending: a read now must not be cached as current.
+            during = self.client.get(url)
+            self.assertEqual((during['ETag'], during.json()), (before['ETag'], before.json()))
+        after = self.client.get(url, HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(sorted(row['title'] for row in after.json()), ['full', 'preview'])
+
+    def test_cache_stats_counts_hits_and_misses(self):
+        admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True)
+        self.client.get(reverse('branch-list'))
+        self.client.get(reverse('branch-list'))
+        self.client.force_authenticate(admin)
+        counters = self.client.get(reverse('cache-stats')).json()
+        self.assertGreaterEqual(counters['branches']['hit'], 1)
+        self.assertGreaterEqual(counters['branches']['miss'], 1)
+
+
+def seed_course_requests(count, branch, status='Pending'):
+    users = User.objects.bulk_create(
+        User(username=f'seed{i}', email=f'seed{i}@example.com', student_id=f'SEED-{i}', password='!')
+        for i in range(count)
+    )
+    CourseRequest.objects.bulk_create(CourseRequest(student=user, branch=branch, status=status) for user in users)
+    return users
+
+
+class QueryCountTests(APITestCase):
+    """List endpoints must cost a fixed number of queries however many rows they return."""
+
+    rows = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='CSE')
+        users = seed_course_requests(cls.rows, cls.branch)
+        Session.objects.bulk_create(Session(user=user, session_key=f'key-{user.pk}') for user in users[:500])
+        StudyMaterial.objects.bulk_create(
+            StudyMaterial(title=f'm{i}', branch=cls.branch, classification='Notes', file=f'materials/{i}.pdf')
+            for i in range(500)
+        )
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x',
+                                             is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_admin_dashboard(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('admin_dashboard'), {'page_size': 500})
+        self.assertEqual(len(response.json()['results']), 500)
+
+    def test_student_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('student-list'), {'page_size': 500})
+        self.assertEqual(len(response.json()['results']), 500)
+
+    def test_deep_pages_cost_the_same(self):
+        url, seen = reverse('student-list') + '?page_size=400', 0
+        while url:
+            with self.assertNumQueries(1):
+                page = self.client.get(url).json()
+            seen += len(page['results'])
+            url = page['next']
+        self.assertEqual(seen, self.rows + 1)
+
+    def test_course_request_view(self):
+        student = User.objects.get(email='seed7@example.com')
+        self.client.force_authenticate(student)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('course-request-detail'))
+        self.assertEqual(response.json()[0]['student']['email'], student.email)
+
+    def test_course_request_update(self):
+        pk = CourseRequest.objects.values_list('pk', flat=True).first()
+        with self.assertNumQueries(4):  # load, save, stats upsert, claims version bump
+            response = self.client.patch(reverse('course-request-update', args=[pk]), {'status': 'Approved'})
+        self.assertEqual(response.json()['status'], 'Approved')
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        # Session, user, two counts and the page; the branch filter adds one for course requests.
+        for model, queries in (('courserequest', 6), ('studymaterial', 5), ('session', 5)):
+            with self.subTest(model=model), self.assertNumQueries(queries):
+                self.assertEqual(self.client.get(reverse(f'admin:api_{model}_changelist')).status_code, 200)
+
+
+class ListFilterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.cse, self.ece = Branch.objects.create(name='CSE'), Branch.objects.create(name='ECE')
+        self.alice = make_student('alice@example.com', self.cse, 'Pending', student_id='PROD-1001')
+        self.bob = make_student('bob@example.com', self.ece, 'Pending', student_id='PROD-2002')
+        make_student('carol@example.com', self.cse, 'Approved', student_id='PROD-3003')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', is_staff=True, role='admin'))
+
+    def emails(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        return sorted(row['student']['email'] if 'student' in row else row['email'] for row in results)
+
+    def test_dashboard_filters(self):
+        self.assertEqual(self.emails('admin_dashboard'), ['alice@example.com', 'bob@example.com'])
+        self.assertEqual(self.emails('admin_dashboard', branch=self.cse.pk), ['alice@example.com'])
+        self.assertEqual(self.emails('admin_dashboard', status='Approved'), ['carol@example.com'])
+        self.assertEqual(self.emails('admin_dashboard', search='PROD-2'), ['bob@example.com'])
+
+    def test_student_list_filters(self):
+        self.assertEqual(self.emails('student-list', branch=self.cse.pk), ['alice@example.com', 'carol@example.com'])
+        self.assertEqual(self.emails('student-list', search='bob@'), ['bob@example.com'])
+        self.assertEqual(self.emails('student-list', search='BOB@'), ['bob@example.com'])
+        self.assertEqual(self.emails('student-list', search='prod-3'), ['carol@example.com'])
+
+    def test_invalid_filters_rejected(self):
+        self.assertEqual(self.client.get(reverse('admin_dashboard'), {'status': 'Nope'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('student-list'), {'branch': 'x'}).status_code, 400)
+
+    @override_settings(MATERIAL_PREVIEW_WORKERS=0)
+    def test_material_classification_filter_paginates(self):
+        for classification in ('PYQ', 'Notes', 'PYQ'):
+            StudyMaterial.objects.create(title=classification, branch=self.cse, classification=classification,
+                                         file='materials/x.pdf')
+        CourseRequest.objects.filter(student=self.alice).update(status='Approved')
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(len(self.client.get(reverse('materials-list')).json()), 3)
+        page = self.client.get(reverse('materials-list'), {'classification': 'PYQ', 'page_size': 1}).json()
+        self.assertEqual(len(page['results']), 1)
+        self.assertEqual(len(self.client.get(page['next']).json()['results']), 1)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_BACKOFF=30)
+class OutboxTests(APITestCase):
+    def test_signup_only_enqueues(self):
+        branch = Branch.objects.create(name='CSE')
+        response = APIClient().post(reverse('signup'), {
+            'username': 'new', 'email': 'new@example.com', 'password': 'pass12345', 'branch': branch.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboundEmail.objects.get()
+        self.assertEqual((queued.to, queued.status), ('new@example.com', 'pending'))
+
+        self.assertEqual(drain_outbox(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@example.com'])
+        self.assertEqual(OutboundEmail.objects.values_list('status', 'body').get(), ('sent', ''))
+        self.assertEqual(drain_outbox(), (0, 0))
+
+    def test_batch_uses_one_connection(self):
+        for i in range(5):
+            enqueue_mail('s', 'b', 'from@produit.academy', f'{i}@example.com')
+        with mock.patch('api.mail.get_connection', wraps=mail.get_connection) as get_connection:
+            call_command('send_queued_mail', stdout=StringIO())
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failures_back_off_then_dead_letter(self):
+        queued = enqueue_mail('s', 'b', 'from@produit.academy', 'x@example.com')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')), \
+                self.assertLogs('api.mail', 'WARNING'):
+            self.assertEqual(drain_outbox(), (0, 1))
+            queued.refresh_from_db()
+            self.assertEqual((queued.status, queued.attempts, queued.last_error), ('pending', 1, 'down'))
+            self.assertGreater(queued.next_attempt_at, timezone.now())
+            self.assertEqual(drain_outbox(), (0, 0))
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            drain_outbox()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.body), ('dead', 2, ''))
+
+    def test_prune_keeps_recent_and_pending_messages(self):
+        old, recent, pending = (enqueue_mail('s', 'b', 'from@produit.academy', f'{i}@example.com') for i in range(3))
+        OutboundEmail.objects.filter(pk__in=[old.pk, recent.pk]).update(status='sent')
+        OutboundEmail.objects.filter(pk__in=[old.pk, pending.pk]).update(created_at=timezone.now() - timedelta(days=40))
+        call_command('prune_outbox', stdout=StringIO())
+        self.assertEqual(set(OutboundEmail.objects.values_list('pk', flat=True)), {recent.pk, pending.pk})
+
+
+class SingleSessionTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_student('a@example.com')
+
+    def login(self):
+        response = APIClient().post(reverse('token_obtain_pair'), {'email': 'a@example.com', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def dashboard(self, tokens):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        return client.get(reverse('student_dashboard'))
+
+    def test_new_login_ends_previous_session(self):
+        first = self.login()
+        self.assertEqual(self.dashboard(first).status_code, 200)
+        second = self.login()
+        self.assertEqual(self.dashboard(first).status_code, 401)
+        self.assertEqual(self.dashboard(second).status_code, 200)
+        self.assertEqual(Session.objects.filter(user=self.user).count(), 1)
+
+    def test_refresh_requires_current_session(self):
+        first = self.login()
+        second = self.login()
+        refresh = APIClient().post(reverse('token_refresh'), {'refresh': first['refresh']})
+        self.assertEqual(refresh.status_code, 401)
+        refresh = APIClient().post(reverse('token_refresh'), {'refresh': second['refresh']})
+        self.assertEqual(refresh.status_code, 200)
+        self.assertEqual(self.dashboard(refresh.json()).status_code, 200)
+
+    def test_cached_session_check_costs_no_query(self):
+        tokens = self.login()
+        with self.assertNumQueries(1):  # simplejwt's user load only
+            self.assertEqual(self.dashboard(tokens).status_code, 200)
+
+    def test_login_from_another_process_is_picked_up(self):
+        tokens = self.login()
+        session_cache.set(str(self.user.pk), ('stale-session-id', 0))
+        with self.assertNumQueries(2):
+            self.assertEqual(self.dashboard(tokens).status_code, 200)
+
+    def test_prune_sessions(self):
+        self.login()
+        Session.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('prune_sessions', stdout=StringIO())
+        self.assertFalse(Session.objects.exists())
+
+
+
+@override_settings(JWT_TOKEN_USER_MODE=True, MATERIAL_PREVIEW_WORKERS=0)
+class TokenUserModeTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        self.user = make_student('a@example.com', self.branch, 'Pending', student_id='PROD-1')
+        StudyMaterial.objects.create(title='full', branch=self.branch, classification='Notes', file='materials/a.pdf')
+        StudyMaterial.objects.create(title='preview', branch=self.branch, classification='Notes',
+                                     file='materials/b.pdf', is_preview=True)
+        tokens = APIClient().post(reverse('token_obtain_pair'), {'email': 'a@example.com', 'password': 'pass12345'}).json()
+        self.refresh = tokens['refresh']
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+    def test_reads_skip_the_user_load(self):
+        self.client.get(reverse('materials-list'))  # warm the list cache
+        with self.assertNumQueries(0):
+            dashboard = self.client.get(reverse('student_dashboard'))
+            materials = self.client.get(reverse('materials-list'))
+        self.assertEqual(dashboard.json(), {'id': self.user.pk, 'username': 'a', 'email': 'a@example.com',
+                                            'role': 'student', 'student_id': 'PROD-1'})
+        self.assertEqual([row['title'] for row in materials.json()], ['preview'])
+
+    def test_unknown_attributes_load_the_user(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('user-profile')).json()['email'], 'a@example.com')
+
+    def test_status_change_invalidates_claims(self):
+        course_request = CourseRequest.objects.get(student=self.user)
+        course_request.status = 'Approved'
+        with self.captureOnCommitCallbacks(execute=True):
+            course_request.save()
+        self.assertEqual(len(self.client.get(reverse('materials-list')).json()), 2)
+        refreshed = APIClient().post(reverse('token_refresh'), {'refresh': self.refresh}).json()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed['access']}")
+        self.client.get(reverse('materials-list'))
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(reverse('materials-list')).json()), 2)
+
+    def test_account_change_invalidates_claims(self):
+        self.user.username, self.user.role = 'renamed', 'admin'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        # Until the next refresh the old token's account claims are read from the row.
+        self.assertEqual(self.client.get(reverse('student_dashboard')).json()['username'], 'renamed')
+        refreshed = APIClient().post(reverse('token_refresh'), {'refresh': self.refresh}).json()
+        access = AccessToken(refreshed['access'])
+        self.assertEqual((access['username'], access['role']), ('renamed', 'admin'))
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = APIClient().post(reverse('token_refresh'), {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivating_the_user_ends_their_tokens(self):
+        self.assertEqual(self.client.get(reverse('student_dashboard')).status_code, 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(reverse('student_dashboard')).status_code, 401)
+
+
+class StudentIdTests(APITestCase):
+    def test_block_costs_one_reservation(self):
+        allocator = BlockAllocator('test', 5)
+        self.assertEqual(allocator.next(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual([allocator.next() for _ in range(4)], [2, 3, 4, 5])
+        self.assertEqual(allocator.next(), 6)
+        self.assertEqual(Sequence.objects.get(name='test').next_value, 11)
+
+    def test_processes_get_disjoint_blocks(self):
+        first, second = BlockAllocator('test', 3), BlockAllocator('test', 3)
+        values = [allocator.next() for _ in range(5) for allocator in (first, second)]
+        self.assertEqual(sorted(values), [1, 2, 3, 4, 5, 6, 7, 8, 10, 11])
+
+    def test_threads_share_the_block(self):
+        allocator = BlockAllocator('test', 1000)
+        allocator.next()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            values = list(pool.map(lambda _: allocator.next(), range(800)))
+        self.assertEqual(len(set(values)), 800)
+
+    def test_block_is_dropped_after_fork(self):
+        allocator = BlockAllocator('test', 10)
+        allocator.next()
+        with mock.patch('api.student_ids.os.getpid', return_value=-1):
+            self.assertEqual(allocator.next(), 11)
+
+    @override_settings(STUDENT_ID_FORMAT='STU{:08d}')
+    def test_signup_uses_the_sequence(self):
+        Sequence.objects.filter(name='student_id').update(next_value=10_000)
+        with mock.patch('api.student_ids.student_ids', BlockAllocator('student_id', 20)):
+            for name in ('a', 'b'):
+                APIClient().post(reverse('signup'), {
+                    'username': name, 'email': f'{name}@example.com', 'password': 'pass12345'})
+        self.assertEqual(sorted(User.objects.values_list('student_id', flat=True)), ['STU00010000', 'STU00010001'])
+
+    def test_migration_starts_above_existing_ids(self):
+        make_student('old@example.com', student_id='PROD-9876')
+        migration = importlib.import_module('api.migrations.0008_student_id_sequence')
+        migration.seed_student_id_sequence(apps, None)
+        self.assertEqual(Sequence.objects.get(name='student_id').next_value, 9877)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ParallelSignupTests(TransactionTestCase):
+    @mock.patch('api.student_ids.student_ids', BlockAllocator('student_id', 3))
+    def test_parallel_signups_get_unique_ids(self):
+        def signup(i):
+            try:
+                return APIClient().post(reverse('signup'), {
+                    'username': f's{i}', 'email': f's{i}@example.com', 'password': 'pass12345'}).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            self.assertEqual(set(pool.map(signup, range(50))), {201})
+        self.assertEqual(User.objects.values('student_id').distinct().count(), 50)
+
+
+class AccountFlowTests(APITestCase):
+    """Each account flow is a fixed, small number of statements, and signup is all or nothing."""
+
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        allocator = BlockAllocator('student_id', 20)
+        allocator.next()
+        patcher = mock.patch('api.student_ids.student_ids', allocator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def signup(self):
+        return APIClient().post(reverse('signup'), {
+            'username': 'new', 'email': 'new@example.com', 'password': 'pass12345', 'branch': self.branch.pk})
+
+    def last_code(self):
+        return re.search(r'is: (\d{4})', OutboundEmail.objects.latest('pk').body).group(1)
+
+    def post(self, name, **data):
+        return APIClient().post(reverse(name), {'email': 'new@example.com', **data})
+
+    def test_signup(self):
+        # Unique checks on username and email and the branch check, then one transaction of four
+        # inserts plus the claims version bump from the course request signal and the stats upsert for
+        # the course request. Course requests take no change version, so signups never queue on it.
+        with self.assertNumQueries(11):
+            self.assertEqual(self.signup().status_code, 201)
+        user = User.objects.get(email='new@example.com')
+        self.assertFalse(user.is_active)
+        self.assertTrue(user.check_password('pass12345'))
+        self.assertEqual(CourseRequest.objects.get(student=user).status, 'Pending')
+        challenge = OTPChallenge.objects.get(user=user, purpose='verify')
+        self.assertNotIn(self.last_code(), challenge.code_hash)
+
+    def test_signup_is_atomic(self):
+        with mock.patch('api.accounts.enqueue_mail', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.signup()
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(CourseRequest.objects.exists())
+        self.assertFalse(OTPChallenge.objects.exists())
+
+    def test_verify(self):
+        self.signup()
+        code = self.last_code()
+        # savepoint, challenge DELETE, newly activated SELECT, user UPDATE, their branches, stats upsert, release
+        with self.assertNumQueries(7):
+            self.assertEqual(self.post('verify-otp', otp=code).status_code, 200)
+        user = User.objects.get()
+        self.assertEqual((user.is_active, user.is_verified), (True, True))
+        self.assertFalse(OTPChallenge.objects.exists())
+        self.assertEqual(self.post('verify-otp', otp=code).status_code, 400)
+        response = APIClient().post(reverse('verify-otp'), {'email': 'x@example.com', 'otp': code})
+        self.assertEqual(response.status_code, 404)
+
+    def test_expired_code_is_rejected(self):
+        self.signup()
+        OTPChallenge.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.post('verify-otp', otp=self.last_code()).status_code, 400)
+
+    def test_attempts_are_limited(self):
+        self.signup()
+        code = self.last_code()
+        wrong = f'{(int(code) + 1) % 10000:04d}'
+        for _ in range(5):
+            self.assertEqual(self.post('verify-otp', otp=wrong).status_code, 400)
+        self.assertEqual(OTPChallenge.objects.get().attempts, 5)
+        self.assertEqual(self.post('verify-otp', otp=code).status_code, 400)
+        self.assertFalse(User.objects.get().is_active)
+
+    def test_resend_replaces_the_challenge(self):
+        self.signup()
+        first = self.last_code()
+        OTPChallenge.objects.update(attempts=3)
+        with self.assertNumQueries(5):  # user lookup, savepoint, challenge upsert, outbox INSERT, release
+            self.assertEqual(self.post('resend-otp').status_code, 200)
+        # The misses so far still count: a resend does not hand out fresh guesses.
+        self.assertEqual(OTPChallenge.objects.get().attempts, 3)
+        if self.last_code() != first:
+            self.assertEqual(self.post('verify-otp', otp=first).status_code, 400)
+        self.assertEqual(self.post('verify-otp', otp=self.last_code()).status_code, 200)
+        self.assertEqual(self.post('resend-otp').status_code, 400)
+        self.assertEqual(APIClient().post(reverse('resend-otp'), {'email': 'x@example.com'}).status_code, 404)
+
+    def test_resend_does_not_restore_guesses(self):
+        self.signup()
+        OTPChallenge.objects.update(attempts=5)
+        self.assertEqual(self.post('resend-otp').status_code, 200)
+        self.assertEqual(self.post('verify-otp', otp=self.last_code()).status_code, 400)
+        # Once the code has expired unused, the next one comes with a fresh set of guesses.
+        OTPChallenge.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.post('resend-otp').status_code, 200)
+        self.assertEqual(OTPChallenge.objects.get().attempts, 0)
+        self.assertEqual(self.post('verify-otp', otp=self.last_code()).status_code, 200)
+
+    def test_password_reset(self):
+        self.signup()
+        with self.assertNumQueries(5):
+            self.assertEqual(self.post('password-reset-otp').status_code, 200)
+        code = self.last_code()
+        with self.assertNumQueries(4):
+            response = self.post('password-reset-confirm', otp=code, password='newpass123')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.get().check_password('newpass123'))
+        self.assertEqual(self.post('password-reset-confirm', otp=code, password='again12345').status_code, 400)
+        # The signup code is for verification only.
+        self.assertTrue(OTPChallenge.objects.filter(purpose='verify').exists())
+
+    @override_settings(OTP_EMAIL_BURST=3)
+    def test_requests_are_rate_limited_per_email(self):
+        self.signup()
+        statuses = [self.post('resend-otp').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertIn('Retry-After', self.post('resend-otp'))
+        other = APIClient().post(reverse('resend-otp'), {'email': 'other@example.com'})
+        self.assertEqual(other.status_code, 404)
+
+    def test_prune_otps(self):
+        self.signup()
+        OTPChallenge.objects.update(expires_at=timezone.now())
+        call_command('prune_otps', stdout=StringIO())
+        self.assertFalse(OTPChallenge.objects.exists())
+
+
+class RateLimitTests(APITestCase):
+    def test_bucket_refills(self):
+        buckets = TokenBuckets()
+        with mock.patch('api.ratelimit.time.monotonic', return_value=100.0):
+            self.assertEqual([buckets.take('k', 2, 10) for _ in range(2)], [0, 0])
+            self.assertAlmostEqual(buckets.take('k', 2, 10), 5.0)
+        with mock.patch('api.ratelimit.time.monotonic', return_value=105.0):
+            self.assertEqual(buckets.take('k', 2, 10), 0)
+
+    def test_shared_window_spans_processes(self):
+        # A second process has a fresh local bucket but shares the cache window.
+        self.assertEqual([ratelimit.take('k', 2, 60) for _ in range(2)], [0, 0])
+        ratelimit.buckets.clear()
+        self.assertGreater(ratelimit.take('k', 2, 60), 0)
+
+    def test_cache_outage_falls_back_to_local_bucket(self):
+        with mock.patch('api.ratelimit.get_cache', side_effect=RuntimeError('down')), \
+                self.assertLogs('api.ratelimit', 'WARNING'):
+            self.assertEqual(ratelimit.take('k', 1, 60), 0)
+        self.assertGreater(ratelimit.take('k', 1, 60), 0)
+
+
+@override_settings(PASSWORD_HASHER_COSTS={'PBKDF2_ITERATIONS': 1000, 'SCRYPT_WORK_FACTOR': 2 ** 10})
+class LoginTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_student('a@example.com')
+
+    def login(self, email='a@example.com', password='pass12345', **headers):
+        return APIClient().post(reverse('token_obtain_pair'), {'email': email, 'password': password}, **headers)
+
+    def test_one_lookup_and_one_hash_per_attempt(self):
+        for email, password in (('a@example.com', 'wrong'), ('nobody@example.com', 'pass12345')):
+            with self.subTest(email=email), self.assertNumQueries(1), \
+                    mock.patch('api.hashers.PBKDF2PasswordHasher.encode', autospec=True,
+                               side_effect=hashers.PBKDF2PasswordHasher.encode) as encode:
+                self.assertEqual(self.login(email, password).status_code, 401)
+            self.assertEqual(encode.call_count, 1)
+
+    def test_changed_policy_rehashes_on_login(self):
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+        with override_settings(PASSWORD_HASHER_COSTS={'PBKDF2_ITERATIONS': 1200}):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1200$'))
+
+        with override_settings(PASSWORD_HASHERS=['api.hashers.ScryptPasswordHasher', 'api.hashers.PBKDF2PasswordHasher']):
+            self.assertEqual(self.login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('scrypt$'))
+            self.assertTrue(self.user.check_password('pass12345'))
+
+    @override_settings(LOGIN_EMAIL_BURST=2)
+    def test_throttled_before_hashing(self):
+        self.assertEqual([self.login(password='wrong').status_code for _ in range(2)], [401, 401])
+        with mock.patch('api.hashers.PBKDF2PasswordHasher.encode') as encode:
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        encode.assert_not_called()
+        # Another account from the same address is unaffected.
+        make_student('b@example.com')
+        self.assertEqual(self.login('b@example.com').status_code, 200)
+
+    @override_settings(LOGIN_IP_BURST=2)
+    def test_forged_forwarded_for_does_not_reset_the_ip_limit(self):
+        # The proxy appends the address it saw; whatever the client put before it is ignored.
+        statuses = [self.login(f'{i}@example.com', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}, 203.0.113.7').status_code
+                    for i in range(3)]
+        self.assertEqual(statuses, [401, 401, 429])
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.0.9, 203.0.113.8').status_code, 200)
+
+
+class BulkUpdateTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        self.other = Branch.objects.create(name='ECE')
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x',
+                                              is_staff=True, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def bulk_requests(self, **data):
+        return self.client.post(reverse('course-request-bulk-update'), data, format='json')
+
+    def test_approve_by_ids_is_one_update_and_idempotent(self):
+        users = seed_course_requests(50, self.branch)
+        ids = list(CourseRequest.objects.values_list('pk', flat=True))
+        # transaction, locking SELECT, UPDATE, stats upsert, claims bump, one outbox INSERT
+        with self.assertNumQueries(7):
+            report = self.bulk_requests(status='Approved', ids=ids + [999999]).json()
+        self.assertEqual((report['updated'], report['unchanged'], report['not_found']), (50, 0, 1))
+        self.assertEqual(report['results'][str(ids[0])], 'updated')
+        self.assertEqual(report['results']['999999'], 'not_found')
+        self.assertEqual(CourseRequest.objects.filter(status='Approved').count(), 50)
+        self.assertEqual(OutboundEmail.objects.count(), 50)
+        self.assertEqual(OutboundEmail.objects.filter(to=users[0].email).get().subject,
+                         'Your Produit Academy course request was approved')
+
+        retry = self.bulk_requests(status='Approved', ids=ids).json()
+        self.assertEqual((retry['updated'], retry['unchanged']), (0, 50))
+        self.assertEqual(OutboundEmail.objects.count(), 50)
+
+    def test_filter_in_batches(self):
+        seed_course_requests(5, self.branch)
+        CourseRequest.objects.create(student=make_student('e@example.com'), branch=self.other, status='Pending')
+        with override_settings(BULK_UPDATE_LIMIT=3):
+            first = self.bulk_requests(status='Rejected', filter={'branch': self.branch.pk, 'status': 'Pending'}).json()
+            self.assertEqual((first['updated'], first['remaining']), (3, 2))
+            second = self.bulk_requests(status='Rejected', filter={'branch': self.branch.pk, 'status': 'Pending'}).json()
+            self.assertEqual((second['updated'], second['remaining']), (2, 0))
+        self.assertEqual(CourseRequest.objects.get(branch=self.other).status, 'Pending')
+
+    def test_repeated_filters_make_progress(self):
+        seed_course_requests(5, self.branch)
+        CourseRequest.objects.filter(pk=CourseRequest.objects.order_by('pk')[0].pk).update(status='Rejected')
+        with override_settings(BULK_UPDATE_LIMIT=2):
+            # The status defaults to Pending: the rejected request stays rejected.
+            reports = [self.bulk_requests(status='Approved', filter={'branch': self.branch.pk}).json()
+                       for _ in range(3)]
+            self.assertEqual([(report['updated'], report['remaining']) for report in reports],
+                             [(2, 2), (2, 0), (0, 0)])
+            url = reverse('student-bulk-update')
+            reports = [self.client.post(url, {'action': 'deactivate', 'filter': {'branch': self.branch.pk}},
+                                        format='json').json() for _ in range(3)]
+            self.assertEqual([(report['updated'], report['remaining']) for report in reports],
+                             [(2, 3), (2, 1), (1, 0)])
+        self.assertEqual(CourseRequest.objects.filter(status='Rejected').count(), 1)
+        self.assertFalse(User.objects.filter(role='student', is_active=True).exists())
+
+    def test_entitlement_is_invalidated(self):
+        student = make_student('s@example.com', self.branch, 'Pending')
+        self.assertEqual(get_entitlement(student), (self.branch.pk, False))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bulk_requests(status='Approved', ids=[CourseRequest.objects.get(student=student).pk])
+        self.assertEqual(get_entitlement(student), (self.branch.pk, True))
+
+    def test_validation(self):
+        self.assertEqual(self.bulk_requests(status='Approved').status_code, 400)
+        self.assertEqual(self.bulk_requests(status='Approved', ids=[1], filter={}).status_code, 400)
+        self.assertEqual(self.bulk_requests(status='Approved', filter={}).status_code, 400)
+        self.assertEqual(self.bulk_requests(status='Pending', ids=[1]).status_code, 400)
+        with override_settings(BULK_UPDATE_LIMIT=2):
+            self.assertEqual(self.bulk_requests(status='Approved', ids=[1, 2, 3]).status_code, 400)
+        student = make_student('s@example.com')
+        self.client.force_authenticate(student)
+        self.assertEqual(self.bulk_requests(status='Approved', ids=[1]).status_code, 403)
+
+    def test_deactivate_students_ends_sessions(self):
+        students = [make_student(f's{i}@example.com', self.branch, 'Approved') for i in range(3)]
+        make_student('x@example.com', self.other, 'Approved')
+        Session.objects.bulk_create(Session(user=student, session_key=f'key-{student.pk}') for student in students)
+        url = reverse('student-bulk-update')
+        report = self.client.post(url, {'action': 'deactivate', 'filter': {'branch': self.branch.pk}}, format='json').json()
+        self.assertEqual(report['updated'], 3)
+        self.assertEqual(User.objects.filter(is_active=False).count(), 3)
+        self.assertFalse(Session.objects.exists())
+        # Staff accounts are never touched.
+        report = self.client.post(url, {'action': 'deactivate', 'ids': [self.admin.pk]}, format='json').json()
+        self.assertEqual(report['not_found'], 1)
+        self.assertTrue(User.objects.get(pk=self.admin.pk).is_active)
+        report = self.client.post(url, {'action': 'activate', 'ids': [students[0].pk]}, format='json').json()
+        self.assertEqual(report['results'], {str(students[0].pk): 'updated'})
+
+
+class ExportImportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        admin = User.objects.create_user(username='admin', email='admin@example.com', password='x',
+                                         is_staff=True, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def export(self, kind, fmt, **params):
+        response = self.client.get(reverse('export', args=[kind, fmt]), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_export_streams_every_row(self):
+        seed_course_requests(1200, self.branch)
+        response, body = self.export('students', 'csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="students.csv"')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 1200)
+        self.assertEqual(rows[0]['email'], 'seed0@example.com')
+
+    def test_ndjson_export_of_course_requests_with_filters(self):
+        seed_course_requests(3, self.branch, 'Approved')
+        make_student('p@example.com', self.branch, 'Pending')
+        response, body = self.export('course-requests', 'ndjson', status='Pending')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([(row['student__email'], row['branch__name'], row['status']) for row in rows],
+                         [('p@example.com', 'CSE', 'Pending')])
+
+    def test_export_requires_admin_and_known_kind(self):
+        self.assertEqual(self.client.get(reverse('export', args=['users', 'csv'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', args=['students', 'xml'])).status_code, 404)
+        self.client.force_authenticate(make_student('s@example.com'))
+        self.assertEqual(self.client.get(reverse('export', args=['students', 'csv'])).status_code, 403)
+
+    def upload(self, text, **params):
+        upload = SimpleUploadedFile('students.csv', text.encode('utf-8-sig'), content_type='text/csv')
+        url = reverse('student-import') + ('?dry_run=1' if params.get('dry_run') else '')
+        return self.client.post(url, {'file': upload}, format='multipart')
+
+    def test_import_creates_students_and_reports_bad_rows(self):
+        make_student('taken@example.com')
+        response = self.upload(
+            'username,email,branch,status\n'
+            'amy,amy@example.com,CSE,Approved\n'
+            f'bob,bob@example.com,{self.branch.pk},\n'
+            'cat,not-an-email,CSE,\n'
+            'dan,dan@example.com,Nowhere,\n'
+            'eve,taken@example.com,,\n'
+            'amy2,amy@example.com,,\n'
+            'fay,fay@example.com,,\n'
+        )
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (3, 4))
+        self.assertEqual([error['line'] for error in report['errors']], [4, 5, 6, 7])
+        amy = User.objects.get(email='amy@example.com')
+        self.assertTrue(amy.is_active)
+        self.assertFalse(amy.has_usable_password())
+        self.assertTrue(amy.student_id.startswith('PROD-'))
+        self.assertEqual(CourseRequest.objects.get(student=amy).status, 'Approved')
+        self.assertEqual(CourseRequest.objects.get(student__email='bob@example.com').status, 'Pending')
+        self.assertFalse(CourseRequest.objects.filter(student__email='fay@example.com').exists())
+        self.assertEqual(User.objects.exclude(student_id=None).values('student_id').distinct().count(), 3)
+
+    def test_import_in_batches_catches_repeats_across_batches(self):
+        lines = ''.join(f's{i},s{i}@example.com,CSE,\n' for i in range(5))
+        report = import_students(io.StringIO('username,email,branch\n' + lines + 's0,s0@example.com,,\n'), batch_size=2)
+        self.assertEqual((report.created, report.failed), (5, 1))
+        self.assertEqual(CourseRequest.objects.count(), 5)
+
+    def test_account_created_during_the_import_fails_its_batch(self):
+        def signup_meanwhile(count):
+            User.objects.get_or_create(username='other', email='s1@example.com')
+            return allocate_student_ids(count)
+
+        lines = ''.join(f's{i},s{i}@example.com,CSE,\n' for i in range(3))
+        with mock.patch('api.imports.allocate_student_ids', side_effect=signup_meanwhile):
+            report = import_students(io.StringIO('username,email,branch\n' + lines), batch_size=2)
+        self.assertEqual((report.created, report.failed), (1, 2))
+        self.assertEqual([error['line'] for error in report.errors], [2, 3])
+        self.assertEqual(set(User.objects.filter(email__startswith='s').values_list('username', flat=True)),
+                         {'other', 's2'})
+
+    def test_dry_run_and_missing_columns(self):
+        self.assertEqual(self.upload('username,email\nx,x@example.com\n', dry_run=True).json()['created'], 1)
+        self.assertFalse(User.objects.filter(email='x@example.com').exists())
+        response = self.upload('name,mail\nx,x@example.com\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('missing column', response.json()['errors'][0]['error'])
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('username,email\nzed,zed@example.com\n')
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('import_students', handle.name, stdout=out)
+        self.assertIn('Created 1 student(s)', out.getvalue())
+
+
+@override_settings(MATERIAL_PREVIEW_WORKERS=0)
+class MaterialSearchTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        self.other = Branch.objects.create(name='ECE')
+        self.student = make_student('s@example.com', self.branch, 'Approved')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def material(self, title, content='', branch=None, is_preview=False):
+        material = StudyMaterial.objects.create(title=title, branch=branch or self.branch, classification='Notes',
+                                                file=f'materials/{title}.pdf', is_preview=is_preview)
+        store_text(material.pk, material.file.name, 'digest', content)
+        return material
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('material-search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def titles(self, q, **params):
+        return [hit['title'] for hit in self.search(q, **params)['results']]
+
+    def test_other_databases_fall_back_to_titles(self):
+        self.material('Heat & thermodynamics', 'Nothing about circuits.')
+        self.material('Circuits', 'Kirchhoff laws.')
+        self.material('Thermodynamics', 'Other branch.', branch=self.other)
+        with mock.patch('api.search.connection') as connection:
+            connection.vendor = 'mysql'
+            body = self.search('thermo heat')
+        self.assertEqual([hit['title'] for hit in body['results']], ['Heat & thermodynamics'])
+        self.assertEqual(body['results'][0]['snippet'], 'Heat &amp; thermodynamics')
+
+    def test_title_and_content_hits_ranked_with_snippets(self):
+        self.material('Thermodynamics notes', 'Heat engines and entropy.')
+        self.material('Circuits', 'Kirchhoff laws. Thermodynamics appears once here.')
+        self.material('Algebra', 'Groups and rings.')
+        body = self.search('thermodynamics')
+        self.assertEqual([hit['title'] for hit in body['results']], ['Thermodynamics notes', 'Circuits'])
+        self.assertIn('<mark>Thermodynamics</mark>', body['results'][1]['snippet'])
+        self.assertEqual(self.titles('thermo'), ['Thermodynamics notes', 'Circuits'])  # prefix on the last word
+        self.assertEqual(self.titles('kirchhoff law'), ['Circuits'])  # stemmed
+
+    def test_snippets_are_escaped(self):
+        self.material('Web', 'Never trust <script>alert(1)</script> input.')
+        snippet = self.search('trust')['results'][0]['snippet']
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertIn('<mark>trust</mark>', snippet)
+
+    def test_results_limited_to_entitlement(self):
+        self.material('Optics full')
+        self.material('Optics preview', is_preview=True)
+        self.material('Optics elsewhere', branch=self.other)
+        self.assertEqual(sorted(self.titles('optics')), ['Optics full', 'Optics preview'])
+        CourseRequest.objects.filter(student=self.student).update(status='Pending')
+        forget_entitlement(self.student.pk)
+        self.assertEqual(self.titles('optics'), ['Optics preview'])
+        admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.assertEqual(len(self.titles('optics')), 3)
+
+    def test_pagination(self):
+        for i in range(5):
+            self.material(f'Calculus {i}')
+        first = self.search('calculus', page_size=2)
+        self.assertEqual(len(first['results']), 2)
+        self.assertIsNone(first['previous'])
+        third = self.client.get(self.client.get(first['next']).json()['next']).json()
+        self.assertEqual(len(third['results']), 1)
+        self.assertIsNone(third['next'])
+
+    def test_index_follows_rename_and_delete(self):
+        material = self.material('Mechanics', 'Newton laws')
+        material.title = 'Dynamics'
+        material.save()
+        self.assertEqual(self.titles('mechanics'), [])
+        self.assertEqual(self.titles('dynamics'), ['Dynamics'])
+        self.assertEqual(self.titles('newton'), ['Dynamics'])
+        material.delete()
+        self.assertEqual(self.titles('newton'), [])
+
+    def test_query_validation_and_syntax(self):
+        self.assertEqual(self.client.get(reverse('material-search'), {'q': 'a'}).status_code, 400)
+        self.assertEqual(self.search('"unbalanced AND (')['results'], [])
+
+    def test_index_materials_command(self):
+        material = StudyMaterial.objects.create(title='Waves', branch=self.branch, classification='Notes',
+                                                file=SimpleUploadedFile('w.pdf', PDF_BYTES))
+        with mock.patch('api.search.extract_text', return_value='Standing waves and resonance') as extract:
+            call_command('index_materials', stdout=StringIO())
+            call_command('index_materials', stdout=StringIO())
+        extract.assert_called_once()
+        self.assertEqual(self.titles('resonance'), ['Waves'])
+
+
+class MaterialSyncTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        self.other = Branch.objects.create(name='ECE')
+        self.student = make_student('s@example.com', self.branch, 'Pending')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def material(self, title, branch=None, is_preview=True):
+        return StudyMaterial.objects.create(title=title, branch=branch or self.branch, classification='Notes',
+                                            file=f'materials/{title}.pdf', is_preview=is_preview)
+
+    def sync(self, since=None):
+        response = self.client.get(reverse('material-sync'), {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        return body, [row['title'] for row in body['changed']]
+
+    def test_empty_poll_is_one_query(self):
+        self.material('Intro')
+        body, titles = self.sync()
+        self.assertEqual((body['reset'], titles), (True, ['Intro']))
+        with self.assertNumQueries(1):
+            again, titles = self.sync(body['cursor'])
+        self.assertEqual((again['reset'], titles, again['removed'], again['cursor']), (False, [], [], body['cursor']))
+
+    def test_changes_deletions_and_moves(self):
+        kept, edited, deleted, moved = (self.material(title) for title in ('Kept', 'Edited', 'Deleted', 'Moved'))
+        hidden = self.material('Hidden')
+        cursor = self.sync()[0]['cursor']
+
+        edited.title = 'Edited again'
+        edited.save()
+        deleted_pk = deleted.pk
+        deleted.delete()
+        moved.branch = self.other
+        moved.save()
+        hidden.is_preview = False
+        hidden.save()
+        full_only = self.material('Full only', is_preview=False)
+        self.material('Elsewhere', branch=self.other)
+        body, titles = self.sync(cursor)
+        self.assertEqual(titles, ['Edited again'])
+        # Rows a preview client cannot see are reported removed whether or not it ever had them.
+        self.assertEqual(body['removed'], sorted([deleted_pk, moved.pk, hidden.pk, full_only.pk]))
+        self.assertEqual(self.sync(body['cursor'])[1], [])
+
+        moved.branch = self.branch
+        moved.save()
+        self.assertEqual(self.sync(body['cursor'])[1], ['Moved'])
+
+    def test_approval_revocation_and_branch_change(self):
+        self.material('Preview')
+        full = self.material('Full', is_preview=False)
+        cursor = self.sync()[0]['cursor']
+        request = CourseRequest.objects.get(student=self.student)
+
+        self.client.force_authenticate(make_student('admin@example.com', is_staff=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('course-request-bulk-update'), {'status': 'Approved', 'ids': [request.pk]},
+                             format='json')
+        self.client.force_authenticate(self.student)
+        body, titles = self.sync(cursor)
+        self.assertEqual((body['reset'], titles, body['removed']), (False, ['Full'], []))
+
+        request.refresh_from_db()
+        request.status = 'Rejected'
+        with self.captureOnCommitCallbacks(execute=True):
+            request.save()
+        body, titles = self.sync(body['cursor'])
+        self.assertEqual((body['reset'], titles, body['removed']), (False, [], [full.pk]))
+
+        request.branch = self.other
+        with self.captureOnCommitCallbacks(execute=True):
+            request.save()
+        self.material('Other preview', branch=self.other)
+        body, titles = self.sync(body['cursor'])
+        self.assertEqual((body['reset'], titles), (True, ['Other preview']))
+
+    def test_bad_cursor(self):
+        response = self.client.get(reverse('material-sync'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json())
+
+
+class StatsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.cse = Branch.objects.create(name='CSE')
+        self.ece = Branch.objects.create(name='ECE')
+        self.admin = make_student('admin@example.com', is_staff=True, role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def stats(self):
+        response = self.client.get(reverse('admin-stats'))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return body['active_students'], {branch['name']: branch for branch in body['branches']}
+
+    def material(self, branch, classification='Notes'):
+        return StudyMaterial.objects.create(title='M', branch=branch, classification=classification,
+                                            file='materials/m.pdf')
+
+    def test_counters_follow_every_write_path(self):
+        ana = make_student('ana@example.com', self.cse, 'Pending')
+        ben = make_student('ben@example.com', self.cse, 'Pending')
+        make_student('cyd@example.com', self.ece, 'Approved')
+        APIClient().post(reverse('signup'), {'username': 'dee', 'email': 'dee@example.com', 'password': 'pass12345',
+                                             'branch': self.ece.pk})
+        code = re.search(r'is: (\d{4})', OutboundEmail.objects.latest('pk').body).group(1)
+        APIClient().post(reverse('verify-otp'), {'email': 'dee@example.com', 'otp': code})
+        import_students(io.StringIO('username,email,branch,status\neve,eve@example.com,CSE,Approved\n'))
+
+        self.client.post(reverse('course-request-bulk-update'),
+                         {'status': 'Approved', 'filter': {'branch': self.cse.pk}}, format='json')
+        moved = CourseRequest.objects.get(student=ben)
+        moved.branch = self.ece
+        moved.save()
+        self.client.delete(reverse('student-manage', args=[ana.pk]))
+        self.client.post(reverse('student-bulk-update'), {'action': 'activate', 'ids': [ana.pk]}, format='json')
+        User.objects.get(email='cyd@example.com').delete()
+
+        notes, pyq = self.material(self.cse), self.material(self.cse, 'PYQ')
+        self.material(self.ece)
+        notes.classification = 'One-shots'
+        notes.save()
+        pyq.delete()
+
+        with self.assertNumQueries(2):
+            total, branches = self.stats()
+        self.assertEqual(total, 4)  # ana, ben, dee, eve
+        self.assertEqual(branches['CSE']['requests'], {'Pending': 0, 'Approved': 2, 'Rejected': 0})
+        self.assertEqual(branches['ECE']['requests'], {'Pending': 1, 'Approved': 1, 'Rejected': 0})
+        self.assertEqual((branches['CSE']['active_students'], branches['ECE']['active_students']), (2, 2))
+        self.assertEqual(branches['CSE']['materials'], {'PYQ': 0, 'Notes': 0, 'One-shots': 1})
+        self.assertEqual(branches['ECE']['materials'], {'PYQ': 0, 'Notes': 1, 'One-shots': 0})
+        out = StringIO()
+        call_command('reconcile_stats', dry_run=True, stdout=out)
+        self.assertIn('Found 0 drifted', out.getvalue())
+
+    def test_reconcile_rebuilds_counters(self):
+        make_student('ana@example.com', self.cse, 'Pending')
+        StatCounter.objects.update(value=42)
+        StatCounter.objects.create(metric='materials', branch_id=self.ece.pk, bucket='PYQ', value=3)
+        out = StringIO()
+        call_command('reconcile_stats', stdout=out)
+        self.assertIn('requests branch=%d Pending: 42 -> 1' % self.cse.pk, out.getvalue())
+        total, branches = self.stats()
+        self.assertEqual((total, branches['CSE']['active_students'], branches['ECE']['materials']['PYQ']), (1, 1, 0))
+
+        self.ece.delete()
+        self.assertFalse(StatCounter.objects.filter(branch_id=self.ece.pk).exists())
+
+
+@override_settings(MATERIAL_PREVIEW_WORKERS=0, MATERIAL_SENDFILE_MODE='', MATERIAL_UPLOAD_CHUNK_MAX=8 * 1024 ** 2)
+class ChunkedUploadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        self.client = APIClient()
+        self.client.force_authenticate(make_student('admin@example.com', is_staff=True, role='admin'))
+
+    def start(self, content=PDF_BYTES, **extra):
+        data = {'title': 'Big notes', 'classification': 'Notes', 'branch': self.branch.pk, 'filename': 'big.pdf',
+                'size': len(content), 'sha256': hashlib.sha256(content).hexdigest(), **extra}
+        response = self.client.post(reverse('upload-session-create'), data, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def put(self, session_id, offset, chunk, checksum=None):
+        if checksum is None:
+            checksum = hashlib.sha256(chunk).hexdigest()
+        return self.client.put(reverse('upload-session', args=[session_id]), chunk,
+                               content_type='application/octet-stream',
+                               HTTP_UPLOAD_OFFSET=str(offset), HTTP_UPLOAD_CHECKSUM=f'sha256 {checksum}')
+
+    def complete(self, session_id):
+        return self.client.post(reverse('upload-session-complete', args=[session_id]))
+
+    def test_chunks_resume_and_complete_into_a_material(self):
+        session_id = self.start()
+        self.assertEqual(self.put(session_id, 0, PDF_BYTES[:4000]).json(), {'offset': 4000})
+
+        # A retried chunk and a chunk from the wrong place are refused with where to carry on.
+        response = self.put(session_id, 0, PDF_BYTES[:4000])
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 4000))
+        self.assertEqual(self.put(session_id, 9000, PDF_BYTES[9000:]).status_code, 409)
+        self.assertEqual(self.complete(session_id).status_code, 409)
+        response = self.client.get(reverse('upload-session', args=[session_id]))
+        self.assertEqual((response.json()['offset'], response['Upload-Offset']), (4000, '4000'))
+
+        self.assertEqual(self.put(session_id, 4000, PDF_BYTES[4000:]).json(), {'offset': len(PDF_BYTES)})
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 201, response.content)
+        material = StudyMaterial.objects.get(pk=response.json()['id'])
+        self.assertEqual((material.title, material.branch, material.classification), ('Big notes', self.branch, 'Notes'))
+        self.assertEqual(digest_from_name(material.file.name), hashlib.sha256(PDF_BYTES).hexdigest())
+        with material.file.open('rb') as handle:
+            self.assertEqual(handle.read(), PDF_BYTES)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(part_path(session_id)))
+        self.assertEqual(self.complete(session_id).status_code, 404)
+
+    def test_bad_chunks_are_cut_off(self):
+        session_id = self.start()
+        response = self.put(session_id, 0, PDF_BYTES[:100], checksum='0' * 64)
+        self.assertEqual((response.status_code, response.json()['offset']), (400, 0))
+        self.assertEqual(os.path.getsize(part_path(session_id)), 0)
+        self.assertEqual(self.put(session_id, 0, b'PK\x03\x04 not a pdf').status_code, 400)
+        self.assertEqual(self.put(session_id, 0, PDF_BYTES[:100]).status_code, 200)
+        self.assertEqual(self.put(session_id, 100, PDF_BYTES[100:], checksum='').status_code, 400)
+        self.assertEqual(self.put(session_id, 100, PDF_BYTES[100:] + b'extra').status_code, 400)
+        self.assertEqual(os.path.getsize(part_path(session_id)), 100)
+
+    def test_whole_file_digest_is_checked(self):
+        session_id = self.start(sha256='f' * 64)
+        self.put(session_id, 0, PDF_BYTES)
+        response = self.complete(session_id)
+        self.assertEqual((response.status_code, response.json()['offset']), (400, 0))
+        self.assertFalse(StudyMaterial.objects.exists())
+        self.assertEqual(os.path.getsize(part_path(session_id)), 0)
+
+    def test_sessions_are_validated(self):
+        url = reverse('upload-session-create')
+        base = {'title': 'T', 'classification': 'Notes', 'branch': self.branch.pk, 'filename': 'a.pdf', 'size': 10,
+                'sha256': 'a' * 64}
+        for bad in ({'filename': 'a.exe'}, {'size': 0}, {'size': 2 * 1024 ** 3 + 1}, {'sha256': 'xyz'}):
+            self.assertEqual(self.client.post(url, {**base, **bad}, format='json').status_code, 400, bad)
+        student = APIClient()
+        student.force_authenticate(make_student('s@example.com'))
+        self.assertEqual(student.post(url, base, format='json').status_code, 403)
+
+    def test_single_request_upload_checks_type(self):
+        data = {'title': 'T', 'classification': 'Notes', 'branch': self.branch.pk}
+        response = self.client.post(reverse('material-upload'), {
+            **data, 'file': SimpleUploadedFile('a.pdf', b'MZ not a pdf', content_type='application/pdf')})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('material-upload'), {
+            **data, 'file': SimpleUploadedFile('a.pdf', PDF_BYTES, content_type='application/pdf')})
+        self.assertEqual(response.status_code, 201)
+
+    def test_sweep_removes_abandoned_sessions(self):
+        stale, fresh = self.start(), self.start()
+        self.put(stale, 0, PDF_BYTES[:100])
+        self.put(fresh, 0, PDF_BYTES[:100])
+        hour_ago = (timezone.now() - timedelta(hours=1)).timestamp()
+        UploadSession.objects.filter(pk=stale).update(updated_at=timezone.now() - timedelta(days=2))
+        os.utime(part_path(stale), (hour_ago - 2 * 86400, hour_ago - 2 * 86400))
+        orphan = part_path('00000000-0000-0000-0000-000000000000')
+        open(orphan, 'wb').close()
+        os.utime(orphan, (hour_ago - 2 * 86400, hour_ago - 2 * 86400))
+
+        out = StringIO()
+        call_command('sweep_uploads', stdout=out)
+        self.assertIn('Deleted 1 abandoned upload session(s) and 2 part file(s), 100 bytes', out.getvalue())
+        self.assertEqual([str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)], [fresh])
+        self.assertTrue(os.path.exists(part_path(fresh)))
+        self.assertFalse(os.path.exists(part_path(stale)) or os.path.exists(orphan))
+
+    def test_large_upload_memory_is_flat(self):
+        chunk_size, chunks = 8 * 1024 ** 2, 40  # 320 MiB
+        body = os.urandom(chunk_size)
+        first = b'%PDF-1.7\n' + body[9:]
+        digest = hashlib.sha256()
+        for index in range(chunks):
+            digest.update(first if index == 0 else body)
+        checksums = {first: hashlib.sha256(first).hexdigest(), body: hashlib.sha256(body).hexdigest()}
+        session_id = self.start(size=chunk_size * chunks, sha256=digest.hexdigest())
+
+        tracemalloc.start()
+        try:
+            for index in range(chunks):
+                chunk = first if index == 0 else body
+                response = self.put(session_id, index * chunk_size, chunk, checksums[chunk])
+                self.assertEqual(response.status_code, 200)
+                # The test client's request and response refer to each other, keeping its copy of the chunk alive.
+                del response
+                gc.collect()
+            response = self.complete(session_id)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(response.status_code, 201, response.content)
+        # One copy of a chunk in the test client and a read buffer in the view, never the file.
+        self.assertLess(peak, 2 * chunk_size)
+        material = StudyMaterial.objects.get(pk=response.json()['id'])
+        self.assertEqual(material.file.size, chunk_size * chunks)
+
+
+class FastSerializerTests(APITestCase):
+    """The fast path must put the same bytes on the wire as ModelSerializer plus JSONRenderer."""
+
+    def setUp(self):
+        super().setUp()
+        self.branches = [Branch.objects.create(name=name) for name in ('CSE', 'Électronique "ECE" ✓', 'line\u2028sep\u2029')]
+        for i, branch in enumerate(self.branches):
+            make_student(f'student{i}@example.com', branch, ('Pending', 'Approved', 'Rejected')[i],
+                         student_id=f'PROD-{i}' if i else None, username=f'名前 {i} </script>')
+            StudyMaterial.objects.create(title=f'Notes {i} \U0001F4D8', branch=branch, classification='Notes',
+                                         file=f'materials/file {i}é.pdf', is_preview=bool(i))
+        StudyMaterial.objects.create(title='no file', branch=self.branches[0], classification='PYQ', file='')
+        StudyMaterial.objects.create(title='digest name', branch=self.branches[0], classification='PYQ',
+                                     file='materials/0f3a9c.pdf')
+        self.request = APIRequestFactory().get('/api/materials/')
+
+    def assertSameBytes(self, serializer_class, fast_class, queryset, context):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+        fast = fast_class(context)
+        self.assertEqual(ORJSONRenderer().render(fast.many(fast.values(queryset))), expected)
+
+    def test_serializers_match_byte_for_byte(self):
+        cases = ((BranchSerializer, BranchValues, Branch.objects.all()),
+                 (UserSerializer, StudentValues, User.objects.all()),
+                 (StudyMaterialSerializer, StudyMaterialValues, StudyMaterial.objects.all()),
+                 (CourseRequestSerializer, CourseRequestValues, CourseRequest.objects.all()))
+        for serializer_class, fast_class, queryset in cases:
+            for context in ({'request': self.request}, {}):
+                with self.subTest(serializer=serializer_class.__name__, request=bool(context)):
+                    self.assertSameBytes(serializer_class, fast_class, queryset.order_by('pk'), context)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'when': timezone.now().replace(microsecond=123456), 'naive': timezone.now().replace(tzinfo=None),
+            'day': timezone.now().date(), 'price': decimal.Decimal('1.10'),
+            'ratio': 0.1, 'lazy': gettext_lazy('Notes'), 'nested': [(1, 2), {'a': None}], 1: 'int key',
+            'text': 'quote " slash / \\ tab \t \u2028 \u2029 \u00e9 \U0001F4D8', 'big': 2 ** 70,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    @override_settings(MATERIAL_PREVIEW_WORKERS=0)
+    def test_endpoints_unchanged(self):
+        admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get(reverse('admin_dashboard'), {'status': 'Approved'})
+        expected = CourseRequestSerializer(CourseRequest.objects.filter(status='Approved'), many=True).data
+        self.assertEqual(response.content, JSONRenderer().render({'next': None, 'previous': None, 'results': expected}))
+
+        student = User.objects.get(email='student1@example.com')
+        client.force_authenticate(student)
+        response = client.get(reverse('materials-list'))
+        request = APIRequestFactory().get('/')
+        expected = StudyMaterialSerializer(StudyMaterial.objects.filter(branch=self.branches[1]).order_by('pk'),
+                                           many=True, context={'request': request}).data
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True)
+        self.client = APIClient()
+
+    def scrape(self):
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_records_latency_queries_sizes_and_statuses(self):
+        Branch.objects.create(name='CSE')
+        self.client.get(reverse('branch-list'))
+        self.client.get(reverse('branch-list'))
+        self.client.get(reverse('student_dashboard'))
+        text = self.scrape()
+        self.assertIn('http_requests_total{view="branch-list",method="GET",status="200"} 2', text)
+        self.assertIn('http_requests_total{view="student_dashboard",method="GET",status="401"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{view="branch-list"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="branch-list",le="+Inf"} 2', text)
+        # The first list is built from the database, the second comes from the cache.
+        self.assertIn('db_queries_per_request_bucket{view="branch-list",le="0"} 1', text)
+        self.assertIn('db_queries_per_request_bucket{view="branch-list",le="1"} 2', text)
+        self.assertIn('http_response_size_bytes_bucket{view="branch-list",le="256"} 2', text)
+        self.assertIn('cache_events_total{namespace="branches",outcome="hit"}', text)
+
+    def test_needs_the_metrics_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            # Logging in as an admin is not the way in.
+            self.client.force_authenticate(self.admin)
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+    async def test_async_requests_are_recorded(self):
+        await sync_to_async(Branch.objects.create)(name='CSE')
+        with override_settings(ASYNC_VIEWS=True):
+            middleware = metrics.MetricsMiddleware(AsyncBranchListView.as_view())
+            self.assertTrue(iscoroutinefunction(middleware))
+            request = APIRequestFactory().get('/api/branches/')
+            response = await middleware(request)
+        self.assertEqual(response.status_code, 200)
+        text = metrics.render(metrics.collect())
+        self.assertIn('http_requests_total{view="<unmatched>",method="GET",status="200"} 1', text)
+        # The branch list query ran on a sync_to_async thread's connection, and still counts.
+        self.assertIn('db_queries_per_request_sum{view="<unmatched>"} 1', text)
+
+    def test_workers_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = {'counters': [['http_requests_total', [['view', 'branch-list'], ['method', 'GET'], ['status', '200']], 5]],
+                 'histograms': [['db_queries_per_request', [['view', 'branch-list']], [4] + [0] * 9, 0, 4]]}
+        with open(os.path.join(directory, 'metrics-999999.json'), 'w') as handle:
+            json.dump(other, handle)
+        with override_settings(METRICS_DIR=directory):
+            self.client.get(reverse('branch-list'))
+            text = self.scrape()
+        self.assertIn('http_requests_total{view="branch-list",method="GET",status="200"} 6', text)
+        self.assertIn('db_queries_per_request_count{view="branch-list"} 5', text)
+        self.assertTrue(os.path.exists(os.path.join(directory, f'metrics-{os.getpid()}.json')))
+
+    @override_settings(SLOW_QUERY_MS=0, SLOW_REQUEST_MS=0)
+    def test_slow_requests_and_queries_logged(self):
+        with self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client.get(reverse('branch-list'))
+        self.assertTrue(any('Slow query' in line and 'branch-list' in line and 'SELECT' in line for line in logs.output))
+        self.assertTrue(any('Slow request' in line and '/api/branches/' in line for line in logs.output))
+
+
+
+class BenchFlowsTests(APITestCase):
+    def test_flows_run_and_compare(self):
+        output = os.path.join(tempfile.mkdtemp(), 'run.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+        call_command('bench_flows', students=2, users=20, materials=20, branches=2, file_size=1024, output=output,
+                     stdout=StringIO(), stderr=StringIO())
+        with open(output) as handle:
+            report = json.load(handle)
+        self.assertEqual(report['endpoints']['material_file']['timing']['count'], 2)
+        self.assertEqual(report['endpoints']['approve']['timing']['count'], 2)
+        self.assertEqual(report['endpoints']['student_dashboard']['queries_per_request'], 1)
+        self.assertFalse(User.objects.filter(email__startswith='flowbench').exists())
+
+        report['endpoints']['student_dashboard']['queries_per_request'] = 0
+        report['endpoints']['materials']['timing']['p95_ms'] /= 10
+        with open(output, 'w') as handle:
+            json.dump(report, handle)
+        with mock.patch('api.management.commands.bench_flows.Command.run', return_value={
+                'requests': 1, 'seconds': 1, 'requests_per_second': 1, 'endpoints': {
+                    'student_dashboard': {**report['endpoints']['student_dashboard'], 'queries_per_request': 1},
+                    'materials': {**report['endpoints']['materials'],
+                                  'timing': {**report['endpoints']['materials']['timing'], 'p95_ms': 1000}}}}):
+            with self.assertRaisesMessage(CommandError, 'student_dashboard: 0 -> 1 queries per request'):
+                call_command('bench_flows', students=1, users=1, materials=1, branches=1, compare=output,
+                             stdout=StringIO(), stderr=StringIO())
+
+    def test_db_pool_bench_needs_postgres(self):
+        with self.assertRaisesMessage(CommandError, 'needs PostgreSQL'):
+            call_command('bench_db_pool', stdout=StringIO(), stderr=StringIO())
+
+
+# URLconf for AsyncViewTests: the async views under the names of the sync ones.
+urlpatterns = [
+    path('api/branches/', AsyncBranchListView.as_view(), name='branch-list'),
+    path('api/student/dashboard/', AsyncStudentDashboardView.as_view(), name='student_dashboard'),
+    path('api/materials/', AsyncStudyMaterialView.as_view(), name='materials-list'),
+    path('api/materials/<int:pk>/file/', AsyncMaterialFileView.as_view(), name='material-file'),
+]
+
+
+@override_settings(MATERIAL_PREVIEW_WORKERS=0, MATERIAL_SENDFILE_MODE='')
+class AsyncViewTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch = Branch.objects.create(name='CSE')
+        make_student('a@example.com', self.branch, 'Approved', student_id='PROD-1')
+        self.material = make_material(self.branch)
+        make_material(self.branch, title='PYQ set', is_preview=True)
+        tokens = APIClient().post(reverse('token_obtain_pair'), {'email': 'a@example.com', 'password': 'pass12345'}).json()
+        self.auth = {'Authorization': f"Bearer {tokens['access']}"}
+
+    async def get_async(self, name, *args, params=None, **headers):
+        with override_settings(ROOT_URLCONF=__name__):
+            return await AsyncClient().get(reverse(name, args=args), params or {}, headers=headers)
+
+    async def test_same_bytes_as_sync_views(self):
+        cases = (('branch-list', {}, {}), ('student_dashboard', {}, self.auth), ('materials-list', {}, self.auth),
+                 ('materials-list', {'classification': 'Notes'}, self.auth),
+                 ('materials-list', {'page_size': 1}, self.auth), ('materials-list', {'classification': 'x'}, self.auth),
+                 ('student_dashboard', {}, {}), ('student_dashboard', {}, {'Authorization': 'Bearer nope'}))
+        for name, params, headers in cases:
+            with self.subTest(name=name, params=params, headers=headers):
+                await sync_to_async(cache.clear)()
+                expected = await sync_to_async(APIClient().get)(reverse(name), params, headers=headers)
+                await sync_to_async(cache.clear)()
+                response = await self.get_async(name, params=params, **headers)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response.get('WWW-Authenticate'), expected.get('WWW-Authenticate'))
+
+    @override_settings(JWT_TOKEN_USER_MODE=True)
+    async def test_stale_account_claims_are_loaded_before_the_view(self):
+        user = await User.objects.aget(email='a@example.com')
+        user.username = 'renamed'
+
+        def rename():
+            with self.captureOnCommitCallbacks(execute=True):
+                user.save()
+        await sync_to_async(rename)()
+        response = await self.get_async('material-file', self.material.pk, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await self.get_async('student_dashboard', **self.auth)).json()['username'], 'renamed')
+
+    async def test_cached_list_revalidates(self):
+        first = await self.get_async('materials-list', **self.auth)
+        response = await self.get_async('materials-list', **{'If-None-Match': first['ETag']}, **self.auth)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_file_streams_from_async_iterator(self):
+        response = await self.get_async('material-file', self.material.pk, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), PDF_BYTES)
+        self.assertEqual(response['Content-Length'], str(len(PDF_BYTES)))
+        response = await self.get_async('material-file', self.material.pk, Range='bytes=10-19', **self.auth)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), PDF_BYTES[10:20])
+        missing = await self.get_async('material-file', self.material.pk + 100, **self.auth)
+        self.assertEqual(missing.json(), {'detail': 'Material not found.'})
@@ -0,0 +1,177 @@
+"""
+Resumable material uploads, sent in chunks.
+
+An admin opens an ``UploadSession`` with the material's fields and the
+``size`` and ``sha256`` of the whole file, then PUTs the file in order: each
+chunk carries its ``Upload-Offset`` and an ``Upload-Checksum: sha256 <hex>``
+of its own bytes. A chunk is streamed from the request straight into
+``uploads/<id>.part`` beside the material blobs, hashed on the way, and only
+counted once its digest matches and it is on disk; a bad or interrupted
+chunk is cut off again and can simply be re-sent. After a dropped
+connection the client reads the session's ``offset`` and carries on from
+there. Completing the session hashes the part file once more, creates the
+``StudyMaterial`` and renames the file into the content-addressed store in
+one transaction, so no material ever points at a partial file. Memory use
+is one read buffer per request, whatever the size of the file.
+
+Writers of a session are serialised by an exclusive ``flock`` on its part
+file, so a retried chunk racing the original gets a conflict instead of
+interleaving with it. ``manage.py sweep_uploads`` removes sessions left
+untouched for ``MATERIAL_UPLOAD_SESSION_TTL``.
+"""
+import fcntl
+import hashlib
+import os
+import re
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import StudyMaterial, UploadSession
+from .storage import material_storage
+
+UPLOAD_DIR = 'uploads'
+BLOCK_SIZE = 1024 * 1024
+PDF_MAGIC = b'%PDF-'
+CHECKSUM_RE = re.compile(r'sha256 ([0-9a-fA-F]{64})')
+
+
+class UploadError(Exception):
+    """A chunk or completion the session refused; ``offset`` is where the session stands."""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+class BadChunk(UploadError):
+    pass
+
+
+class Conflict(UploadError):
+    pass
+
+
+def part_path(session_id):
+    return material_storage().path(f'{UPLOAD_DIR}/{session_id}.part')
+
+
+@contextmanager
+def locked(session):
+    """The session's part file, open for update and locked against other writers; refreshes ``session``."""
+    path = part_path(session.pk)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise Conflict("Another request is writing to this upload.", session.offset)
+        # Whoever held the lock before may have moved the session on, completed or aborted it.
+        session.refresh_from_db()
+        yield handle
+
+
+def write_chunk(session, offset, length, checksum, stream):
+    """Write ``length`` bytes read from ``stream`` at ``offset`` and return the session's new offset."""
+    match = CHECKSUM_RE.fullmatch(checksum or '')
+    if match is None:
+        raise BadChunk("Send the chunk's digest as 'Upload-Checksum: sha256 <hex>'.", session.offset)
+    with locked(session) as handle:
+        if offset != session.offset:
+            raise Conflict(f"The upload continues at byte {session.offset}, not {offset}.", session.offset)
+        if not 0 < length <= settings.MATERIAL_UPLOAD_CHUNK_MAX:
+            raise BadChunk(f"Chunks are 1 to {settings.MATERIAL_UPLOAD_CHUNK_MAX} bytes long.", offset)
+        if offset + length > session.size:
+            raise BadChunk(f"The chunk runs past the declared size of {session.size} bytes.", offset)
+
+        # Anything past the offset is left over from a chunk that was refused or cut off.
+        handle.seek(offset)
+        handle.truncate()
+        try:
+            digest, remaining = hashlib.sha256(), length
+            while remaining:
+                block = stream.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    raise BadChunk(f"The chunk ended {remaining} bytes early.", offset)
+                digest.update(block)
+                handle.write(block)
+                remaining -= len(block)
+            if digest.hexdigest() != match[1].lower():
+                raise BadChunk("The chunk does not match its checksum.", offset)
+            handle.flush()
+            if offset == 0 and os.pread(handle.fileno(), len(PDF_MAGIC), 0) != PDF_MAGIC:
+                raise BadChunk("Only PDF files can be uploaded.", offset)
+            os.fsync(handle.fileno())
+        except BaseException:
+            handle.truncate(offset)
+            raise
+        UploadSession.objects.filter(pk=session.pk).update(offset=offset + length, updated_at=timezone.now())
+        return offset + length
+
+
+def complete(session):
+    """Check the whole file, move it into the material store and return the ``StudyMaterial`` created for it."""
+    with locked(session) as handle:
+        if session.offset != session.size:
+            raise Conflict(f"{session.offset} of {session.size} bytes have arrived.", session.offset)
+        digest = hashlib.sha256()
+        handle.seek(0)
+        for block in iter(partial(handle.read, BLOCK_SIZE), b''):
+            digest.update(block)
+        digest = digest.hexdigest()
+        if digest != session.sha256:
+            # Every chunk matched its own checksum, so the declared digest is wrong; nothing here can be kept.
+            handle.truncate(0)
+            UploadSession.objects.filter(pk=session.pk).update(offset=0, updated_at=timezone.now())
+            raise BadChunk("The file does not match the declared sha256; start the upload again.", 0)
+
+        storage, path = material_storage(), part_path(session.pk)
+        ext = os.path.splitext(session.filename)[1]
+        with transaction.atomic():
+            material = StudyMaterial.objects.create(
+                title=session.title, classification=session.classification, branch_id=session.branch_id,
+                is_preview=session.is_preview, file=storage.blob_name(digest, ext),
+            )
+            session.delete()
+            # Last, so a failed rename rolls the rows back; previews and text extraction run after commit.
+            storage.adopt(path, digest, ext)
+    return material
+
+
+def abort(session):
+    path = part_path(session.pk)
+    with locked(session):
+        session.delete()
+        os.unlink(path)
+
+
+def sweep(now=None):
+    """
+    Delete sessions untouched for ``MATERIAL_UPLOAD_SESSION_TTL`` and part files without a session.
+
+    Returns ``(sessions, files, bytes)`` removed.
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.MATERIAL_UPLOAD_SESSION_TTL)
+    sessions, _ = UploadSession.objects.filter(updated_at__lt=cutoff).delete()
+    directory = material_storage().path(UPLOAD_DIR)
+    if not os.path.isdir(directory):
+        return sessions, 0, 0
+
+    live = {str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)}
+    files = freed = 0
+    for entry in os.scandir(directory):
+        session_id, ext = os.path.splitext(entry.name)
+        if ext != '.part' or session_id in live:
+            continue
+        stat = entry.stat()
+        # A session being opened right now may not be visible yet; its file is brand new.
+        if stat.st_mtime >= cutoff.timestamp():
+            continue
+        os.unlink(entry.path)
+        files += 1
+        freed += stat.st_size
+    return sessions, files, freed
@@ -1,5 +1,10 @@
+from django.conf import settings
 from django.urls import path
 from .views import *
+if settings.ASYNC_VIEWS:
+    from .async_views import (AsyncBranchListView as BranchListView, AsyncMaterialFileView as MaterialFileView,
+                              AsyncStudentDashboardView as StudentDashboardView,
+                              AsyncStudyMaterialView as StudyMaterialView)
 # This is the line that needs to be added/corrected
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -11,11 +16,26 @@ urlpatterns = [
     path('student/dashboard/', StudentDashboardView.as_view(), name='student_dashboard'),
     path('admin/dashboard/', AdminDashboardView.as_view(), name='admin_dashboard'),
     path('materials/', StudyMaterialView.as_view(), name='materials-list'),
+    path('materials/sync/', MaterialSyncView.as_view(), name='material-sync'),
+    path('materials/search/', MaterialSearchView.as_view(), name='material-search'),
+    path('materials/<int:pk>/file/', MaterialFileView.as_view(), name='material-file'),
+    path('materials/<int:pk>/preview/', MaterialPreviewView.as_view(), name='material-thumbnail'),
+    path('materials/<int:pk>/preview/<int:page>/', MaterialPreviewView.as_view(), name='material-preview'),
     path('materials/upload/', StudyMaterialUploadView.as_view(), name='material-upload'),
+    path('materials/uploads/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('materials/uploads/<uuid:pk>/', UploadSessionView.as_view(), name='upload-session'),
+    path('materials/uploads/<uuid:pk>/complete/', UploadSessionCompleteView.as_view(), name='upload-session-complete'),
     path('courserequest/', CourseRequestView.as_view(), name='course-request-detail'),
     path('courserequests/<int:pk>/update/', CourseRequestUpdateView.as_view(), name='course-request-update'),
+    path('courserequests/bulk-update/', CourseRequestBulkUpdateView.as_view(), name='course-request-bulk-update'),
     path('admin/students/', StudentListView.as_view(), name='student-list'),
     path('admin/students/<int:pk>/', StudentManageView.as_view(), name='student-manage'),
+    path('admin/students/bulk/', StudentBulkUpdateView.as_view(), name='student-bulk-update'),
+    path('admin/students/import/', StudentImportView.as_view(), name='student-import'),
+    # The extension is a plain URL part, not DRF's ``format`` suffix: these responses bypass the renderers.
+    path('admin/export/<slug:kind>.<slug:fmt>', ExportView.as_view(), name='export'),
+    path('admin/stats/', StatsView.as_view(), name='admin-stats'),
+    path('admin/cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
     path('profile/', ProfileView.as_view(), name='user-profile'),
     path('verify-otp/', VerifyOTPView.as_view(), name='verify-otp'),
     path('resend-otp/', ResendOTPView.as_view(), name='resend-otp'),
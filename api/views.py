@@ -1,108 +1,133 @@
 from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
-from django.http import FileResponse, Http404
-from django.utils import timezone
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.http import Http404, HttpResponse
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from datetime import timedelta
-import random
+from django.utils.text import slugify
+import hmac
+import os
 
 from rest_framework import generics, permissions, status, parsers
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.utils.urls import replace_query_param
 
 from .serializers import (
     UserSerializer, CourseRequestSerializer, StudyMaterialSerializer,
     MyTokenObtainPairSerializer, BranchSerializer, ChangePasswordSerializer,
-    ResetPasswordSerializer, UserProfileSerializer
+    ResetPasswordSerializer, UserProfileSerializer, BulkCourseRequestSerializer, BulkStudentSerializer,
+    UploadSessionSerializer
 )
-from .models import User, Branch, StudyMaterial, CourseRequest, Session
+from .models import User, Branch, StudyMaterial, CourseRequest, Session, StatCounter, UploadSession
+from .accounts import RESET, VERIFY, issue_challenge, reset_password, verify_account
+from .authentication import end_sessions
+from .bulk import set_request_status, set_students_active
+from .cache import cached_list_response, get_entitlement, stats as cache_stats
+from .downloads import serve_file
+from .exports import EXPORTS, FORMATS as EXPORT_FORMATS, export_response
+from .fast_serializers import BranchValues, CourseRequestValues, FastListMixin, StudentValues, StudyMaterialValues
+from .imports import import_students, text_lines
+from .mail import enqueue_mail
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, collect as collect_metrics, render as render_metrics
+from .pagination import IdCursorPagination, OptionalCursorPagination
+from .previews import content_digest, preview_name, schedule_previews
+from .ratelimit import LoginThrottle, OTPThrottle
+from .search import search_materials
+from .stats import ALL_BRANCHES
+from .sync import changes_since
+from . import uploads
+
+def int_param(request, name):
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: 'A valid integer is required.'})
+
+def choice_param(request, name, choices, default=None):
+    value = request.query_params.get(name, default)
+    if value is not None and value not in dict(choices):
+        raise ValidationError({name: f'Must be one of: {", ".join(dict(choices))}.'})
+    return value
+
+def search_students(queryset, search, prefix=''):
+    # A prefix of LOWER(column) can use the text_pattern_ops indexes of migration 0016; istartswith
+    # compiles to UPPER(column) LIKE, which no index serves.
+    if not search:
+        return queryset
+    queryset = queryset.alias(student_id_lower=Lower(f'{prefix}student_id'), email_lower=Lower(f'{prefix}email'))
+    search = search.lower()
+    return queryset.filter(Q(student_id_lower__startswith=search) | Q(email_lower__startswith=search))
+
+def entitled_materials(user):
+    return materials_for(get_entitlement(user))
+
+def materials_for(entitlement):
+    # Approved students see every material of their branch, everyone else only the previews.
+    if entitlement is None:
+        return StudyMaterial.objects.none()
+    branch_id, approved = entitlement
+    if approved:
+        return StudyMaterial.objects.filter(branch_id=branch_id)
+    return StudyMaterial.objects.filter(branch_id=branch_id, is_preview=True)
+
+def previewable_materials(user):
+    # Page previews are cheap images, so any student with a request for the branch may see them.
+    if user.is_staff:
+        return StudyMaterial.objects.all()
+    entitlement = get_entitlement(user)
+    if entitlement is None:
+        return StudyMaterial.objects.none()
+    return StudyMaterial.objects.filter(branch_id=entitlement[0])
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
+    throttle_classes = [LoginThrottle]
 
 class SignUpView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    throttle_classes = [OTPThrottle]
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = serializer.save()
-
-        # Student ID Generation
-        student_id = f"PROD-{random.randint(1000, 9999)}"
-        while User.objects.filter(student_id=student_id).exists():
-            student_id = f"PROD-{random.randint(1000, 9999)}"
-        user.student_id = student_id
-        user.save()
-
-        # Course Request Creation
-        branch_id = request.data.get('branch')
-        if branch_id:
-            try:
-                branch = Branch.objects.get(id=branch_id)
-                CourseRequest.objects.create(student=user, branch=branch, status='Pending')
-            except Branch.DoesNotExist:
-                pass
-
-        # OTP Logic
-        otp = str(random.randint(1000, 9999))
-        user.otp = otp
-        user.otp_expiry = timezone.now() + timedelta(minutes=5)
-        user.save()
-
-        send_mail(
-            'Your OTP for Produit Academy',
-            f'Hi {user.username},\n\nYour One-Time Password (OTP) is: {otp}\nIt will expire in 5 minutes.',
-            'from@produit.academy',
-            [user.email],
-            fail_silently=True,
-        )
-        print(f"--- OTP {otp} sent to {user.email} ---")
-
+        serializer.save()
         return Response({"detail": "OTP sent to your email for verification."}, status=status.HTTP_201_CREATED)
 
 class VerifyOTPView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [OTPThrottle]
     def post(self, request, *args, **kwargs):
         email = request.data.get('email')
-        otp = request.data.get('otp')
-        try:
-            user = User.objects.get(email=email)
-            if user.otp == otp and user.otp_expiry > timezone.now():
-                user.is_active = True
-                user.is_verified = True
-                user.otp = None
-                user.otp_expiry = None
-                user.save()
-                return Response({'detail': 'Account verified successfully!'}, status=status.HTTP_200_OK)
-            else:
-                return Response({'detail': 'Invalid or expired OTP.'}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
+        if verify_account(email, request.data.get('otp')):
+            return Response({'detail': 'Account verified successfully!'}, status=status.HTTP_200_OK)
+        # Only a failed attempt pays for telling a wrong code from an unknown email.
+        if not User.objects.filter(email=email).exists():
             return Response({'detail': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'detail': 'Invalid or expired OTP.'}, status=status.HTTP_400_BAD_REQUEST)
 
 class ResendOTPView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [OTPThrottle]
     def post(self, request, *args, **kwargs):
-        email = request.data.get('email')
-        try:
-            user = User.objects.get(email=email)
-            if user.is_verified:
-                return Response({'detail': 'Account is already verified.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            otp = str(random.randint(1000, 9999))
-            user.otp = otp
-            user.otp_expiry = timezone.now() + timedelta(minutes=5)
-            user.save()
-
-            send_mail('Your New OTP for Produit Academy', f'Your new OTP is: {otp}', 'from@produit.academy', [user.email], fail_silently=True)
-            return Response({'detail': 'A new OTP has been sent to your email.'}, status=status.HTTP_200_OK)
-        except User.DoesNotExist:
+        user = User.objects.filter(email=request.data.get('email')).only('email', 'is_verified').first()
+        if user is None:
             return Response({'detail': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if user.is_verified:
+            return Response({'detail': 'Account is already verified.'}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            code = issue_challenge(user.pk, user.email, VERIFY)
+            enqueue_mail('Your New OTP for Produit Academy', f'Your new OTP is: {code}', 'from@produit.academy', user.email)
+        return Response({'detail': 'A new OTP has been sent to your email.'}, status=status.HTTP_200_OK)
 
 class ChangePasswordView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -112,39 +137,23 @@ class ChangePasswordView(generics.UpdateAPIView):
 
 class PasswordResetRequestOTPView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [OTPThrottle]
     def post(self, request):
-        email = request.data.get('email')
-        try:
-            user = User.objects.get(email=email)
-            otp = str(random.randint(1000, 9999))
-            user.otp = otp
-            user.otp_expiry = timezone.now() + timedelta(minutes=5)
-            user.save()
-            send_mail('Password Reset OTP for Produit Academy', f'Your OTP to reset your password is: {otp}', 'from@produit.academy', [user.email], fail_silently=True)
-            print(f"--- Password Reset OTP {otp} sent to {user.email} ---")
-            return Response({'detail': 'OTP has been sent to your email.'})
-        except User.DoesNotExist:
+        user = User.objects.filter(email=request.data.get('email')).only('email').first()
+        if user is None:
             return Response({'detail': 'User with this email does not exist.'}, status=status.HTTP_404_NOT_FOUND)
+        with transaction.atomic():
+            code = issue_challenge(user.pk, user.email, RESET)
+            enqueue_mail('Password Reset OTP for Produit Academy', f'Your OTP to reset your password is: {code}', 'from@produit.academy', user.email)
+        return Response({'detail': 'OTP has been sent to your email.'})
 
 class PasswordResetConfirmView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [OTPThrottle]
     def post(self, request):
-        email = request.data.get('email')
-        otp = request.data.get('otp')
-        password = request.data.get('password')
-
-        try:
-            user = User.objects.get(email=email)
-            if user.otp == otp and user.otp_expiry > timezone.now():
-                user.set_password(password)
-                user.otp = None
-                user.otp_expiry = None
-                user.save()
-                return Response({'detail': 'Password has been reset successfully.'})
-            else:
-                return Response({'detail': 'Invalid or expired OTP.'}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            return Response({'detail': 'An error occurred.'}, status=status.HTTP_400_BAD_REQUEST)
+        if reset_password(request.data.get('email'), request.data.get('otp'), request.data.get('password')):
+            return Response({'detail': 'Password has been reset successfully.'})
+        return Response({'detail': 'Invalid or expired OTP.'}, status=status.HTTP_400_BAD_REQUEST)
 
 class StudentDashboardView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -152,24 +161,90 @@ class StudentDashboardView(generics.RetrieveAPIView):
     def get_object(self):
         return self.request.user
 
-class AdminDashboardView(generics.ListAPIView):
+class AdminDashboardView(FastListMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
-    queryset = CourseRequest.objects.filter(status='Pending')
+    pagination_class = IdCursorPagination
     serializer_class = CourseRequestSerializer
+    fast_serializer_class = CourseRequestValues
+    def get_queryset(self):
+        request_status = choice_param(self.request, 'status', CourseRequest.STATUS_CHOICES, default='Pending')
+        queryset = CourseRequest.objects.filter(status=request_status)
+        branch_id = int_param(self.request, 'branch')
+        if branch_id is not None:
+            queryset = queryset.filter(branch_id=branch_id)
+        return search_students(queryset, self.request.query_params.get('search'), prefix='student__')
 
-class StudyMaterialView(generics.ListAPIView):
+class StudyMaterialView(FastListMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = StudyMaterialSerializer
+    fast_serializer_class = StudyMaterialValues
+    pagination_class = OptionalCursorPagination
     def get_queryset(self):
-        user = self.request.user
+        queryset = entitled_materials(self.request.user)
+        classification = choice_param(self.request, 'classification', StudyMaterial.CLASSIFICATION_CHOICES)
+        if classification:
+            queryset = queryset.filter(classification=classification)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # Filtered or paginated requests go to the database; the plain list is served from the cache.
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        entitlement = get_entitlement(request.user)
+        if entitlement is None:
+            return Response([])
+        branch_id, approved = entitlement
+        build = lambda: self.fast_list(self.get_queryset())
+        return cached_list_response(request, f'materials:{branch_id}', 'full' if approved else 'preview', build, private=True)
+
+class MaterialSyncView(APIView):
+    """What the user's library gained and lost since the ``since`` cursor; everything when ``reset`` is set."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        entitlement = get_entitlement(request.user)
         try:
-            course_request = CourseRequest.objects.get(student=user)
-            if course_request.status == 'Approved':
-                return StudyMaterial.objects.filter(branch=course_request.branch)
-            else:
-                return StudyMaterial.objects.filter(branch=course_request.branch, is_preview=True)
-        except CourseRequest.DoesNotExist:
-            return StudyMaterial.objects.none()
+            materials, removed, cursor = changes_since(entitlement, request.query_params.get('since'))
+        except ValueError:
+            raise ValidationError({'since': 'Not a sync cursor; sync again without one.'})
+        reset = materials is None
+        if reset:
+            materials = materials_for(entitlement)
+        serializer = StudyMaterialValues({'request': request})
+        return Response({'cursor': cursor, 'reset': reset, 'removed': sorted(removed),
+                         'changed': serializer.many(serializer.values(materials.order_by('pk')))})
+
+class MaterialSearchView(generics.GenericAPIView):
+    """Ranked full-text search over the materials the user may list, ``page`` at a time."""
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = StudyMaterialSerializer
+
+    def get(self, request, *args, **kwargs):
+        text = request.query_params.get('q', '').strip()
+        if len(text) < 2:
+            raise ValidationError({'q': 'At least 2 characters are required.'})
+        page = int_param(request, 'page') or 1
+        page_size = min(int_param(request, 'page_size') or 20, 100)
+        if page < 1 or page_size < 1:
+            raise ValidationError({'page': 'Pages and page sizes start at 1.'})
+        scope = {}
+        if not request.user.is_staff:
+            entitlement = get_entitlement(request.user)
+            if entitlement is None:
+                return Response({'next': None, 'previous': None, 'results': []})
+            scope = {'branch_id': entitlement[0], 'preview_only': not entitlement[1]}
+        classification = choice_param(request, 'classification', StudyMaterial.CLASSIFICATION_CHOICES)
+        # One extra hit tells whether there is a next page without counting every match.
+        hits = search_materials(text, classification=classification, limit=page_size + 1,
+                                offset=(page - 1) * page_size, **scope)
+        materials = StudyMaterial.objects.in_bulk([pk for pk, _, _ in hits[:page_size]])
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if len(hits) > page_size else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': [{**self.get_serializer(materials[pk]).data, 'rank': round(rank, 4), 'snippet': snippet}
+                        for pk, rank, snippet in hits[:page_size] if pk in materials],
+        })
 
 class StudyMaterialUploadView(generics.CreateAPIView):
     permission_classes = [permissions.IsAdminUser]
@@ -177,9 +252,73 @@ class StudyMaterialUploadView(generics.CreateAPIView):
     queryset = StudyMaterial.objects.all()
     serializer_class = StudyMaterialSerializer
 
+def upload_error(exc):
+    code = status.HTTP_409_CONFLICT if isinstance(exc, uploads.Conflict) else status.HTTP_400_BAD_REQUEST
+    return Response({'detail': str(exc), 'offset': exc.offset}, status=code, headers={'Upload-Offset': str(exc.offset)})
+
+class UploadSessionCreateView(generics.CreateAPIView):
+    """Opens a resumable upload for files too big for one request; the protocol is described in ``api.uploads``."""
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = UploadSessionSerializer
+    def perform_create(self, serializer): serializer.save(created_by=self.request.user)
+
+class UploadSessionView(APIView):
+    """GET where an upload stands, PUT its next chunk as the raw request body, DELETE to abandon it."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_session(self, pk):
+        try:
+            return UploadSession.objects.get(pk=pk)
+        except UploadSession.DoesNotExist:
+            raise Http404
+
+    def get(self, request, pk):
+        session = self.get_session(pk)
+        return Response(UploadSessionSerializer(session).data, headers={'Upload-Offset': str(session.offset)})
+
+    def put(self, request, pk):
+        session = self.get_session(pk)
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            raise ValidationError({'Upload-Offset': "Send the byte offset of the chunk in this header."})
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        # request.stream reads the body off the socket as it goes; request.data would buffer it.
+        try:
+            offset = uploads.write_chunk(session, offset, length, request.headers.get('Upload-Checksum'),
+                                         request.stream)
+        except UploadSession.DoesNotExist:
+            raise Http404
+        except uploads.UploadError as exc:
+            return upload_error(exc)
+        return Response({'offset': offset}, headers={'Upload-Offset': str(offset)})
+
+    def delete(self, request, pk):
+        try:
+            uploads.abort(self.get_session(pk))
+        except UploadSession.DoesNotExist:
+            raise Http404
+        except uploads.UploadError as exc:
+            return upload_error(exc)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class UploadSessionCompleteView(UploadSessionView):
+    """POST once every byte has arrived: verifies the whole file and creates the material."""
+    http_method_names = ['post', 'options']
+
+    def post(self, request, pk):
+        try:
+            material = uploads.complete(self.get_session(pk))
+        except UploadSession.DoesNotExist:
+            raise Http404
+        except uploads.UploadError as exc:
+            return upload_error(exc)
+        return Response(StudyMaterialSerializer(material, context={'request': request}).data,
+                        status=status.HTTP_201_CREATED)
+
 class CourseRequestUpdateView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAdminUser]
-    queryset = CourseRequest.objects.all()
+    queryset = CourseRequest.objects.select_related('student', 'branch')
     serializer_class = CourseRequestSerializer
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -190,21 +329,44 @@ class CourseRequestUpdateView(generics.UpdateAPIView):
             return Response(self.get_serializer(instance).data)
         return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
 
-class BranchListView(generics.ListAPIView):
+class CourseRequestBulkUpdateView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    def post(self, request):
+        serializer = BulkCourseRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response(set_request_status(data['status'], ids=data.get('ids'), limit=settings.BULK_UPDATE_LIMIT,
+                                           **data.get('filter', {})))
+
+class BranchListView(FastListMixin, generics.ListAPIView):
     queryset = Branch.objects.all()
     serializer_class = BranchSerializer
+    fast_serializer_class = BranchValues
     permission_classes = [permissions.AllowAny]
 
-class CourseRequestView(generics.ListAPIView):
+    def list(self, request, *args, **kwargs):
+        build = lambda: self.fast_list(self.get_queryset())
+        return cached_list_response(request, 'branches', 'all', build)
+
+class CourseRequestView(FastListMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CourseRequestSerializer
+    fast_serializer_class = CourseRequestValues
     def get_queryset(self):
-        return CourseRequest.objects.filter(student=self.request.user)
+        return CourseRequest.objects.filter(student_id=self.request.user.pk)
 
-class StudentListView(generics.ListAPIView):
+class StudentListView(FastListMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
-    queryset = User.objects.filter(role='student', is_active=True)
+    pagination_class = IdCursorPagination
     serializer_class = UserSerializer
+    fast_serializer_class = StudentValues
+    def get_queryset(self):
+        queryset = User.objects.filter(role='student', is_active=True)
+        branch_id = int_param(self.request, 'branch')
+        if branch_id is not None:
+            # Students pick their branch through the course request, not User.branch.
+            queryset = queryset.filter(id__in=CourseRequest.objects.filter(branch_id=branch_id).values('student_id'))
+        return search_students(queryset, self.request.query_params.get('search'))
 
 class StudentManageView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAdminUser]
@@ -212,7 +374,47 @@ class StudentManageView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = UserSerializer
     def perform_destroy(self, instance):
         instance.is_active = False
-        instance.save()
+        instance.save(update_fields=['is_active'])
+        end_sessions(instance.pk)
+
+class StudentBulkUpdateView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    def post(self, request):
+        serializer = BulkStudentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response(set_students_active(data['action'] == 'activate', ids=data.get('ids'),
+                                            limit=settings.BULK_UPDATE_LIMIT, **data.get('filter', {})))
+
+class ExportView(APIView):
+    """Streams ``students`` or ``course-requests`` as CSV or NDJSON; ``?branch=`` (and ``?status=`` for requests) filter."""
+    permission_classes = [permissions.IsAdminUser]
+    def get(self, request, kind, fmt):
+        if kind not in EXPORTS or fmt not in EXPORT_FORMATS:
+            raise Http404
+        queryset = EXPORTS[kind][0]()
+        branch_id = int_param(request, 'branch')
+        if kind == 'students':
+            if branch_id is not None:
+                queryset = queryset.filter(id__in=CourseRequest.objects.filter(branch_id=branch_id).values('student_id'))
+        else:
+            request_status = choice_param(request, 'status', CourseRequest.STATUS_CHOICES)
+            if branch_id is not None:
+                queryset = queryset.filter(branch_id=branch_id)
+            if request_status:
+                queryset = queryset.filter(status=request_status)
+        return export_response(kind, fmt, queryset)
+
+class StudentImportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [parsers.MultiPartParser]
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': 'A CSV file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        report = import_students(text_lines(upload), dry_run=request.query_params.get('dry_run') == '1')
+        return Response(report.as_dict(), status=status.HTTP_200_OK if report.created or not report.failed
+                        else status.HTTP_400_BAD_REQUEST)
 
 class ProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -221,15 +423,87 @@ class ProfileView(generics.RetrieveUpdateAPIView):
         return self.request.user
 
 class MaterialFileView(generics.GenericAPIView):
-    permission_classes = [permissions.AllowAny] 
-    queryset = StudyMaterial.objects.all()
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return StudyMaterial.objects.all()
+        return entitled_materials(self.request.user)
 
     def get(self, request, *args, **kwargs):
         try:
             material = self.get_object()
-            file_handle = material.file.open()
-            response = FileResponse(file_handle, content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename="{material.file.name}"'
-            return response
-        except Http404:
-            return Response({"detail": "Material not found."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            # Stored names are content digests, so name the download after the title instead.
+            filename = (slugify(material.title) or 'material') + os.path.splitext(material.file.name)[1]
+            return serve_file(request, material.file.storage, material.file.name, 'application/pdf', filename)
+        except (Http404, FileNotFoundError):
+            return Response({"detail": "Material not found."}, status=status.HTTP_404_NOT_FOUND)
+
+
+class MaterialPreviewView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return previewable_materials(self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            material = self.get_object()
+            digest = content_digest(material.file)
+        except (Http404, FileNotFoundError):
+            return Response({"detail": "Material not found."}, status=status.HTTP_404_NOT_FOUND)
+        page = kwargs.get('page')
+        suffix = 'thumb' if page is None else f'p{page}'
+        try:
+            return serve_file(request, default_storage, preview_name(digest, page), 'image/jpeg',
+                              f'{material.pk}-{suffix}.jpg', etag=f'"{digest}-{suffix}"')
+        except FileNotFoundError:
+            schedule_previews(material, digest)
+            return Response({"detail": "Preview not available yet."}, status=status.HTTP_404_NOT_FOUND)
+
+
+class StatsView(APIView):
+    """Requests by status, active students and materials by classification per branch, from ``StatCounter``."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        counters = {(metric, branch_id, bucket): value for metric, branch_id, bucket, value
+                    in StatCounter.objects.values_list('metric', 'branch_id', 'bucket', 'value')}
+        statuses = [choice for choice, _ in CourseRequest.STATUS_CHOICES]
+        classifications = [choice for choice, _ in StudyMaterial.CLASSIFICATION_CHOICES]
+        branches = [{
+            'id': branch_id, 'name': name,
+            'requests': {status: counters.get(('requests', branch_id, status), 0) for status in statuses},
+            'active_students': counters.get(('students', branch_id, ''), 0),
+            'materials': {kind: counters.get(('materials', branch_id, kind), 0) for kind in classifications},
+        } for branch_id, name in Branch.objects.order_by('id').values_list('id', 'name')]
+        return Response({'active_students': counters.get(('students', ALL_BRANCHES, ''), 0), 'branches': branches})
+
+class CacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        counters = {}
+        for (namespace, outcome), value in sorted(cache_stats.items()):
+            counters.setdefault(namespace, {})[outcome] = value
+        return Response(counters)
+
+class HasMetricsToken(permissions.BasePermission):
+    """``Authorization: Bearer <METRICS_TOKEN>``; nobody gets in while the setting is empty."""
+    def has_permission(self, request, view):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        return bool(settings.METRICS_TOKEN) and scheme.lower() == 'bearer' and hmac.compare_digest(
+            token.encode(), settings.METRICS_TOKEN.encode())
+
+class MetricsView(APIView):
+    """
+    Prometheus scrape target: request metrics summed over every worker sharing ``METRICS_DIR``.
+
+    Scrapers send the static ``METRICS_TOKEN`` rather than logging in: a JWT
+    login would be short-lived and end the account's other session.
+    """
+    authentication_classes = []
+    permission_classes = [HasMetricsToken]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(collect_metrics()), content_type=METRICS_CONTENT_TYPE)
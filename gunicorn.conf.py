@@ -0,0 +1,50 @@
+# Read by `gunicorn` from the project root. SERVER_MODE picks the deployment:
+#   wsgi  gthread workers (the default)
+#   asgi  uvicorn workers; settings.ASYNC_VIEWS then routes the read-heavy endpoints to api.async_views
+#
+# Worker processes follow the CPUs this process may run on; request threads cover the time spent waiting on
+# the database and clients. Each thread holds at most one database connection, so an instance opens up to
+# workers * threads of them (DB_POOL_MAX_SIZE per worker, see settings.DATABASES).
+import multiprocessing
+import os
+import sys
+
+cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else multiprocessing.cpu_count()
+
+mode = os.environ.get('SERVER_MODE', 'wsgi')
+if mode == 'asgi':
+    wsgi_app = 'produit_academy_backend.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    # One event loop per CPU; sync work runs in each worker's thread pool.
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpus))
+else:
+    wsgi_app = 'produit_academy_backend.wsgi:application'
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpus + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Import Django once in the master: faster forks and shared memory pages. See pre_fork for the connections.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def on_starting(server):
+    # Metrics files are per worker pid; start each deployment from zero rather than summing dead workers forever.
+    directory = os.environ.get('METRICS_DIR')
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.startswith('metrics-'):
+                os.remove(os.path.join(directory, name))
+
+
+def pre_fork(server, worker):
+    # A connection (or a pool with its sockets and threads) the master opened while loading the app would be
+    # shared by every child. Close them before forking so each worker connects on its own.
+    if 'django.db' in sys.modules:
+        from django.db import connections
+        for connection in connections.all(initialized_only=True):
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
@@ -19,6 +19,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware', 'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', 'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware', 'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -45,11 +46,44 @@ TEMPLATES = [{'BACKEND': 'django.template.backends.django.DjangoTemplates', 'DIR
                                                 'django.contrib.auth.context_processors.auth', 'django.contrib.messages.context_processors.messages']}}]
 
 WSGI_APPLICATION = 'produit_academy_backend.wsgi.application'
+ASGI_APPLICATION = 'produit_academy_backend.asgi.application'
+# SERVER_MODE=asgi (see gunicorn.conf.py) runs uvicorn workers and routes the read-heavy endpoints to api.async_views.
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', str(SERVER_MODE == 'asgi')).lower() == 'true'
 
-DATABASES = {'default': dj_database_url.config(default=os.environ.get('DATABASE_URL'), conn_max_age=600)}
+# Connections are health-checked before reuse. On PostgreSQL each process draws them from psycopg 3's pool and
+# returns them at the end of every request (pooling requires CONN_MAX_AGE=0); DB_POOL_MAX_SIZE defaults to the
+# gunicorn threads per worker, the most a worker can use at once. DB_POOL=false keeps one persistent
+# connection per thread instead, under WSGI.
+DATABASES = {'default': dj_database_url.config(default=os.environ.get('DATABASE_URL'), conn_health_checks=True,
+                                               conn_max_age=int(os.environ.get('CONN_MAX_AGE', 600)))}
+DB_POOL = os.environ.get('DB_POOL', 'true').lower() == 'true'
+if DB_POOL and DATABASES['default'].get('ENGINE') == 'django.db.backends.postgresql':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', os.environ.get('GUNICORN_THREADS', 4))),
+        # Seconds a request waits for a free connection before failing.
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    }
+elif SERVER_MODE == 'asgi':
+    # Without the pool, ASGI workers close connections after each request: sync_to_async runs queries on
+    # threads that come and go, and persistent connections left on them pile up until the server refuses more.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
 
 AUTH_USER_MODEL = 'api.User'
-AUTHENTICATION_BACKENDS = ['api.authentication.EmailBackend', 'django.contrib.auth.backends.ModelBackend']
+# One lookup by email per login attempt; the backend also answers the admin's permission checks.
+AUTHENTICATION_BACKENDS = ['api.authentication.EmailBackend']
+# New and re-hashed passwords use PASSWORD_HASHER (pbkdf2, scrypt, or argon2 with argon2-cffi installed). Costs
+# not set here keep Django's defaults; stored hashes with another algorithm or cost are re-hashed at the next login.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+password_hashers = {'pbkdf2': 'api.hashers.PBKDF2PasswordHasher', 'scrypt': 'api.hashers.ScryptPasswordHasher',
+                    'argon2': 'api.hashers.Argon2PasswordHasher'}
+PASSWORD_HASHERS = [password_hashers[PASSWORD_HASHER],
+                    *(path for name, path in password_hashers.items() if name != PASSWORD_HASHER)]
+PASSWORD_HASHER_COSTS = {name: int(os.environ[name]) for name in (
+    'PBKDF2_ITERATIONS', 'SCRYPT_WORK_FACTOR', 'SCRYPT_BLOCK_SIZE', 'SCRYPT_PARALLELISM',
+    'ARGON2_TIME_COST', 'ARGON2_MEMORY_COST', 'ARGON2_PARALLELISM') if os.environ.get(name)}
 
 AUTH_PASSWORD_VALIDATORS = [{'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
                             {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -62,6 +96,93 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-REST_FRAMEWORK = {'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework_simplejwt.authentication.JWTAuthentication',)}
-SIMPLE_JWT = {"ACCESS_TOKEN_LIFETIME": timedelta(minutes=5), "REFRESH_TOKEN_LIFETIME": timedelta(days=1)}
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file
+# ORJSONRenderer writes the same bytes as DRF's JSONRenderer, faster when orjson is installed.
+# NUM_PROXIES: reverse proxies in front of gunicorn (the platform's router by default; 0 when clients connect
+# directly). The per-IP throttles trust only the X-Forwarded-For entry the outermost of them appended.
+REST_FRAMEWORK = {'DEFAULT_AUTHENTICATION_CLASSES': ('api.authentication.SingleSessionJWTAuthentication',),
+                  'DEFAULT_RENDERER_CLASSES': (os.environ.get('JSON_RENDERER', 'api.renderers.ORJSONRenderer'),
+                                               'rest_framework.renderers.BrowsableAPIRenderer'),
+                  'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1))}
+SIMPLE_JWT = {"ACCESS_TOKEN_LIFETIME": timedelta(minutes=5), "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+              "TOKEN_REFRESH_SERIALIZER": "api.serializers.MyTokenRefreshSerializer"}
+# Per-process cache of each user's active login session; SESSION_CACHE_TTL bounds how long a token
+# superseded by a login on another worker is still accepted by this one.
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 50000))
+SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 30))
+# Student ids come from a database sequence; each process reserves STUDENT_ID_BLOCK_SIZE at a time.
+STUDENT_ID_FORMAT = os.environ.get('STUDENT_ID_FORMAT', 'PROD-{:06d}')
+STUDENT_ID_BLOCK_SIZE = int(os.environ.get('STUDENT_ID_BLOCK_SIZE', 20))
+# One-time codes: wrong guesses allowed per code, and per-IP/per-email request budgets per period (seconds).
+OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', 5))
+OTP_IP_BURST = int(os.environ.get('OTP_IP_BURST', 30))
+OTP_EMAIL_BURST = int(os.environ.get('OTP_EMAIL_BURST', 10))
+OTP_RATE_PERIOD = int(os.environ.get('OTP_RATE_PERIOD', 900))
+# Password logins per client IP (generous: a campus shares one address) and per account, per period (seconds).
+# Attempts over budget are refused before any password is hashed.
+LOGIN_IP_BURST = int(os.environ.get('LOGIN_IP_BURST', 200))
+LOGIN_EMAIL_BURST = int(os.environ.get('LOGIN_EMAIL_BURST', 10))
+LOGIN_RATE_PERIOD = int(os.environ.get('LOGIN_RATE_PERIOD', 300))
+# Most rows one bulk admin request may change; filter-based requests report what is left.
+BULK_UPDATE_LIMIT = int(os.environ.get('BULK_UPDATE_LIMIT', 5000))
+# Serve safe requests from the access token's claims instead of loading the user row.
+JWT_TOKEN_USER_MODE = os.environ.get('JWT_TOKEN_USER_MODE', 'False').lower() == 'true'
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_mail'))
+
+# Outbox drained by `manage.py send_queued_mail --loop`: retries back off exponentially from
+# EMAIL_OUTBOX_BACKOFF seconds and give up (status 'dead') after EMAIL_OUTBOX_MAX_ATTEMPTS.
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_BACKOFF = int(os.environ.get('EMAIL_OUTBOX_BACKOFF', 30))
+EMAIL_OUTBOX_MAX_BACKOFF = int(os.environ.get('EMAIL_OUTBOX_MAX_BACKOFF', 3600))
+EMAIL_OUTBOX_LEASE = int(os.environ.get('EMAIL_OUTBOX_LEASE', 300))
+
+# CACHE_BACKEND: 'locmem' (per process, the default), 'file' or 'db' (shared by every worker;
+# run `manage.py createcachetable` first). Catalogue entries and their version tokens (hence ETags) expire
+# after CATALOG_CACHE_TIMEOUT seconds: with locmem an invalidation only reaches the worker that made it,
+# so that is how long other workers may serve stale lists, and rate limits are counted per worker.
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'produit-academy'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, '.cache')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'api_cache'),
+}
+_cache_backend, _cache_location = CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')]
+CACHES = {'default': {'BACKEND': _cache_backend, 'LOCATION': os.environ.get('CACHE_LOCATION', _cache_location)}}
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+
+# Material downloads: '' streams from Python, 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd)
+# hand the transfer to the front-end server. MATERIAL_SENDFILE_PREFIX is the internal nginx location.
+MATERIAL_SENDFILE_MODE = os.environ.get('MATERIAL_SENDFILE_MODE', '')
+MATERIAL_SENDFILE_PREFIX = os.environ.get('MATERIAL_SENDFILE_PREFIX', '/protected-media/')
+MATERIAL_FILE_MAX_AGE = int(os.environ.get('MATERIAL_FILE_MAX_AGE', 3600))
+
+# PDF previews rendered after upload by a bounded process pool (0 workers disables it).
+MATERIAL_PREVIEW_WORKERS = int(os.environ.get('MATERIAL_PREVIEW_WORKERS', 2))
+MATERIAL_PREVIEW_QUEUE_SIZE = int(os.environ.get('MATERIAL_PREVIEW_QUEUE_SIZE', 32))
+MATERIAL_PREVIEW_PAGES = int(os.environ.get('MATERIAL_PREVIEW_PAGES', 3))
+MATERIAL_PREVIEW_DPI = int(os.environ.get('MATERIAL_PREVIEW_DPI', 50))
+MATERIAL_PREVIEW_THUMB_WIDTH = int(os.environ.get('MATERIAL_PREVIEW_THUMB_WIDTH', 320))
+# Full-text search indexes the first MATERIAL_SEARCH_PAGES pages of each PDF, cut at MATERIAL_SEARCH_MAX_CHARS.
+MATERIAL_SEARCH_PAGES = int(os.environ.get('MATERIAL_SEARCH_PAGES', 50))
+MATERIAL_SEARCH_MAX_CHARS = int(os.environ.get('MATERIAL_SEARCH_MAX_CHARS', 200_000))
+# Material uploads (bytes); big files go through resumable upload sessions sent in chunks of at most
+# MATERIAL_UPLOAD_CHUNK_MAX. Sessions untouched for MATERIAL_UPLOAD_SESSION_TTL seconds are swept.
+MATERIAL_UPLOAD_MAX_SIZE = int(os.environ.get('MATERIAL_UPLOAD_MAX_SIZE', 2 * 1024 ** 3))
+MATERIAL_UPLOAD_CHUNK_MAX = int(os.environ.get('MATERIAL_UPLOAD_CHUNK_MAX', 64 * 1024 ** 2))
+MATERIAL_UPLOAD_SESSION_TTL = int(os.environ.get('MATERIAL_UPLOAD_SESSION_TTL', 24 * 3600))
+
+# Request metrics served at /metrics. Give every worker the same METRICS_DIR to see the whole pool;
+# requests and queries slower than the thresholds (milliseconds) are logged with their view.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+# Scrapers authenticate with 'Authorization: Bearer <METRICS_TOKEN>'; /metrics is closed while it is empty.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 1000))
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 200))
+LOGGING = {
+    'version': 1, 'disable_existing_loggers': False,
+    'formatters': {'plain': {'format': '%(asctime)s %(levelname)s %(name)s [%(process)d] %(message)s'}},
+    'handlers': {'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'}},
+    'loggers': {'api': {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO'), 'propagate': False}},
+}
\ No newline at end of file